@@ -0,0 +1,116 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, F, Value, When
+
+from blog.models import BlogPost
+
+logger = logging.getLogger(__name__)
+
+
+class BlogPostViewCounter:
+    """Класс отложенного подсчета просмотров постов: просмотры копятся в кэше Django (Redis) или,
+    при выключенном кэше (CACHE_ENABLED), в памяти процесса и записываются в BlogPost.views_count
+    одним UPDATE через F(), поэтому просмотры не теряются и строки постов не блокируются на каждый просмотр.
+    Из кэша просмотры записывает задача flush_blogpost_views, из памяти процесса - сам процесс,
+    когда с последней записи прошло BLOG_VIEWS_FLUSH_SECONDS секунд, и при завершении процесса"""
+
+    def __init__(self, flush_seconds: float = None):
+        self.flush_seconds = flush_seconds if flush_seconds is not None else settings.BLOG_VIEWS_FLUSH_SECONDS
+        self._views = Counter()
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, pk: int) -> None:
+        """Метод учитывает просмотр поста"""
+        if settings.CACHE_ENABLED:
+            key = self._get_key(pk)
+            cache.add(key, 0, None)
+            cache.incr(key)
+            return
+        with self._lock:
+            self._views[pk] += 1
+            if time.monotonic() - self._flushed_at >= self.flush_seconds:
+                self._flush_local()
+
+    def get_pending(self, pk: int) -> int:
+        """Метод возвращает количество просмотров поста, еще не записанных в БД"""
+        if settings.CACHE_ENABLED:
+            return cache.get(self._get_key(pk)) or 0
+        with self._lock:
+            return self._views[pk]
+
+    def flush(self) -> int:
+        """Метод записывает накопленные просмотры в БД, возвращает количество записанных просмотров"""
+        if settings.CACHE_ENABLED:
+            return self._flush_cache()
+        with self._lock:
+            return self._flush_local()
+
+    def _flush_local(self) -> int:
+        views, self._views = self._views, Counter()
+        self._flushed_at = time.monotonic()
+        try:
+            update_views_count(views)
+        except Exception:
+            self._views.update(views)  # просмотры запишутся при следующей записи
+            raise
+        return sum(views.values())
+
+    def _flush_cache(self) -> int:
+        pks = list(BlogPost.objects.values_list('pk', flat=True))
+        keys = {self._get_key(pk): pk for pk in pks}
+        views = Counter({keys[key]: value for key, value in cache.get_many(keys).items() if value})
+        # просмотры вычитаются из кэша, а не удаляются, чтобы не потерять просмотры, учтенные во время записи
+        for pk, value in views.items():
+            cache.decr(self._get_key(pk), value)
+        try:
+            update_views_count(views)
+        except Exception:
+            for pk, value in views.items():
+                cache.incr(self._get_key(pk), value)
+            raise
+        return sum(views.values())
+
+    @staticmethod
+    def _get_key(pk: int) -> str:
+        return f"blogpost_views:{pk}"
+
+
+def update_views_count(views: Counter) -> None:
+    """Функция увеличивает просмотры постов одним UPDATE, значения считаются в БД через F()"""
+    if not views:
+        return
+    BlogPost.objects.filter(pk__in=views).update(views_count=F('views_count') + Case(
+        *(When(pk=pk, then=Value(value)) for pk, value in views.items()),
+        default=Value(0),
+    ))
+
+
+_view_counter = None
+_view_counter_lock = threading.Lock()
+
+
+def get_view_counter() -> BlogPostViewCounter:
+    """Функция возвращает общий для процесса счетчик просмотров постов"""
+    global _view_counter
+    with _view_counter_lock:
+        if _view_counter is None:
+            _view_counter = BlogPostViewCounter()
+            atexit.register(flush_blogpost_views_on_exit)
+    return _view_counter
+
+
+def flush_blogpost_views_on_exit() -> None:
+    """Функция записывает просмотры из памяти процесса при его завершении, ошибка записи только логируется"""
+    if _view_counter is None or settings.CACHE_ENABLED:
+        return
+    try:
+        _view_counter.flush()
+    except Exception:
+        logger.exception("Failed to flush blog post views")
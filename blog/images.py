@@ -0,0 +1,87 @@
+import hashlib
+import logging
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from mailing.cache import TwoTierCache
+
+logger = logging.getLogger(__name__)
+
+# размеры уменьшенных копий превью: изображение вписывается в прямоугольник с сохранением пропорций
+PREVIEW_VARIANTS = {
+    'thumbnail': (150, 150),
+    'card': (300, 300),
+    'detail': (800, 800),
+}
+
+PREVIEW_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+preview_cache = TwoTierCache('blog_previews', settings.BLOG_CACHE_TIMEOUT)
+
+
+def get_preview_hash(name: str) -> str:
+    """Функция считает хэш содержимого превью, по нему называются уменьшенные копии,
+    поэтому одинаковые изображения уменьшаются один раз"""
+    content_hash = hashlib.sha256()
+    with default_storage.open(name) as file:
+        for chunk in file.chunks():
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def get_preview_variant_name(content_hash: str, variant: str, image_format: str) -> str:
+    """Функция возвращает путь уменьшенной копии превью в хранилище media"""
+    return f"blog/previews/{content_hash[:2]}/{content_hash}_{variant}.{image_format}"
+
+
+def make_preview_variant(name: str, variant: str, image_format: str, content_hash: str = None) -> str:
+    """Функция создает уменьшенную копию превью, если ее еще нет, и возвращает ее путь в хранилище media"""
+    content_hash = content_hash or get_preview_hash(name)
+    variant_name = get_preview_variant_name(content_hash, variant, image_format)
+    if default_storage.exists(variant_name):
+        return variant_name
+
+    pil_format, save_options = PREVIEW_FORMATS[image_format]
+    with default_storage.open(name) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.thumbnail(PREVIEW_VARIANTS[variant], Image.LANCZOS)
+        if pil_format == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGB' if pil_format == 'JPEG' else 'RGBA')
+        buffer = BytesIO()
+        image.save(buffer, pil_format, **save_options)
+    # хранилище может переименовать файл, если копию одновременно создал другой процесс
+    return default_storage.save(variant_name, ContentFile(buffer.getvalue()))
+
+
+def make_preview_variants(name: str) -> str:
+    """Функция создает все уменьшенные копии превью, возвращает хэш содержимого превью"""
+    content_hash = get_preview_hash(name)
+    for variant in PREVIEW_VARIANTS:
+        for image_format in PREVIEW_FORMATS:
+            make_preview_variant(name, variant, image_format, content_hash)
+    return content_hash
+
+
+def get_preview_variant_url(name: str, variant: str = 'card', image_format: str = 'jpeg',
+                            content_hash: str = None) -> str:
+    """Функция возвращает ссылку на уменьшенную копию превью. По хэшу превью, посчитанному при сохранении поста,
+    ссылка строится без чтения исходного изображения, без хэша копия создается при первом обращении.
+    Если копию создать не удалось, возвращается ссылка на исходное изображение"""
+    if not name:
+        return '#'
+    if content_hash:
+        return default_storage.url(get_preview_variant_name(content_hash, variant, image_format))
+    try:
+        variant_name = preview_cache.get_or_set(
+            f"{name}:{variant}:{image_format}", lambda: make_preview_variant(name, variant, image_format))
+    except Exception:
+        logger.exception("Failed to make %s %s preview for %s", variant, image_format, name)
+        return default_storage.url(name)
+    return default_storage.url(variant_name)
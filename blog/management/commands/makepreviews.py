@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from blog.images import make_preview_variants
+from blog.models import BlogPost
+from blog.services import invalidate_blogposts
+
+
+class Command(BaseCommand):
+    """Кастомная команда для создания уменьшенных копий превью уже загруженных постов"""
+    help = "Makes resized preview variants for existing blog posts."
+
+    def handle(self, *args, **options):
+        blogposts = BlogPost.objects.exclude(preview='').exclude(preview__isnull=True)
+        made_count = 0
+        for name in blogposts.values_list('preview', flat=True).distinct():
+            try:
+                preview_hash = make_preview_variants(name)
+            except Exception as error:
+                self.stderr.write(f"Failed to make previews for {name}: {error}")
+                continue
+            blogposts.filter(preview=name).update(preview_hash=preview_hash)
+            made_count += 1
+        if made_count:
+            invalidate_blogposts()
+        self.stdout.write(f"Previews made: {made_count}")
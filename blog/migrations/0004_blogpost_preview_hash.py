@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-18 20:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_blogpost_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='preview_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, verbose_name='Хэш превью'),
+        ),
+    ]
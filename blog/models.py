@@ -1,3 +1,5 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
 from users.models import User
@@ -17,6 +19,9 @@ class BlogPost(models.Model):
                                       editable=False)
     author = models.ForeignKey(User, verbose_name='Автор', help_text='Укажите автора', **NULLABLE,
                                on_delete=models.SET_NULL)
+    search_vector = SearchVectorField(verbose_name='Поисковый вектор', **NULLABLE, editable=False)
+    # по хэшу содержимого превью называются его уменьшенные копии, он считается при сохранении поста
+    preview_hash = models.CharField(max_length=64, verbose_name='Хэш превью', **NULLABLE, editable=False)
 
     def __str__(self):
         return self.title
@@ -25,3 +30,6 @@ class BlogPost(models.Model):
         verbose_name = "Блоговая запись>"
         verbose_name_plural = "Блоговые записи"
         ordering = ('title',)
+        indexes = [
+            GinIndex(fields=['search_vector'], name='blogpost_search_idx'),
+        ]
@@ -1,18 +1,144 @@
-from django.core.cache import cache
+import logging
+import random
+from datetime import datetime
+from typing import NamedTuple
 
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import F
+
+from blog.counters import get_view_counter
 from blog.models import BlogPost
 from config import settings
+from mailing.cache import TwoTierCache
+from mailing.leader import get_leader_lock
+from mailing.versions import BLOG_VERSION, get_content_last_modified, make_etag
+
+logger = logging.getLogger(__name__)
+
+blogpost_cache = TwoTierCache('blogposts', settings.BLOG_CACHE_TIMEOUT)
+
+# в списках содержимое обрезается до 100 символов, лишний символ нужен, чтобы truncatechars добавил многоточие
+PREVIEW_CONTENT_LENGTH = 101
+
+
+class BlogPostPreview(NamedTuple):
+    """Класс краткой записи опубликованного поста для списков: хранится в кэше вместо объектов модели"""
+    pk: int
+    title: str
+    slug: str
+    preview: str
+    preview_hash: str
+    content: str
+    created_at: datetime
+    author_id: int
+    is_published: bool = True
+
+    def __str__(self):
+        return self.title
+
+
+def get_published_blogposts() -> list:
+    """Функция выбирает краткие записи опубликованных постов, содержимое обрезается до длины анонса в списках"""
+    blogposts = BlogPost.objects.filter(is_published=True).values_list(
+        'pk', 'title', 'slug', 'preview', 'preview_hash', 'content', 'created_at', 'author_id')
+    return [
+        BlogPostPreview(pk, title, slug, preview, preview_hash, (content or '')[:PREVIEW_CONTENT_LENGTH],
+                        created_at, author_id)
+        for pk, title, slug, preview, preview_hash, content, created_at, author_id in blogposts
+    ]
+
+
+def get_blogpost_for_cache() -> list:
+    """Функция получает список постов из памяти процесса, из кэша или из БД и тогда записывает в кэш"""
+    return blogpost_cache.get_or_set('published', get_published_blogposts)
+
+
+def get_random_blogposts(count: int = 3) -> list:
+    """Функция выбирает случайные посты из закэшированного списка без запроса к БД"""
+    blogposts = get_blogpost_for_cache()
+    return random.sample(blogposts, min(count, len(blogposts)))
+
+
+def invalidate_blogposts() -> None:
+    """Функция сбрасывает закэшированный список постов"""
+    blogpost_cache.invalidate()
+
+
+def record_blogpost_view(request, pk) -> None:
+    """Функция учитывает просмотр поста и запоминает в запросе просмотры поста вместе с еще не записанными в БД
+    для страницы поста. Просмотр несуществующего поста не учитывается"""
+    views_count = BlogPost.objects.filter(pk=pk).values_list('views_count', flat=True).first()
+    if views_count is not None:
+        view_counter = get_view_counter()
+        view_counter.add(pk)
+        views_count += view_counter.get_pending(pk)
+    request._blogpost_views_count = views_count
+
+
+def get_blogpost_views_count(request, pk):
+    """Функция возвращает просмотры поста вместе с еще не записанными в БД, None - поста нет.
+    Просмотры, запомненные при учете просмотра, не выбираются повторно"""
+    if '_blogpost_views_count' not in request.__dict__:
+        views_count = BlogPost.objects.filter(pk=pk).values_list('views_count', flat=True).first()
+        if views_count is not None:
+            views_count += get_view_counter().get_pending(pk)
+        request._blogpost_views_count = views_count
+    return request._blogpost_views_count
+
+
+def flush_blogpost_views() -> int:
+    """Функция записывает накопленные просмотры постов в БД, возвращает количество записанных просмотров.
+    Одновременно запись выполняет только один процесс"""
+    flush_lock = get_leader_lock('blogpost_views_flush')
+    if not flush_lock.acquire():
+        logger.info("Blog post views flush is already running")
+        return 0
+    try:
+        views_count = get_view_counter().flush()
+    finally:
+        flush_lock.release()
+    if views_count:
+        logger.info("Blog post views flushed: %s", views_count)
+    return views_count
+
+
+def get_blogpost_search_vector() -> SearchVector:
+    """Функция возвращает поисковый вектор поста: совпадения в заголовке важнее совпадений в содержимом"""
+    return (SearchVector('title', weight='A', config='russian')
+            + SearchVector('content', weight='B', config='russian'))
+
+
+def update_blogpost_search_vector(pk: int) -> None:
+    """Функция пересчитывает поисковый вектор поста в БД"""
+    BlogPost.objects.filter(pk=pk).update(search_vector=get_blogpost_search_vector())
+
+
+def search_blogposts(query: str):
+    """Функция ищет опубликованные посты по заголовку и содержимому с учетом русской морфологии,
+    посты упорядочены по релевантности. Поиск использует GIN-индекс поискового вектора"""
+    search_query = SearchQuery(query, config='russian', search_type='websearch')
+    return (
+        BlogPost.objects.filter(is_published=True, search_vector=search_query)
+        .annotate(rank=SearchRank(F('search_vector'), search_query))
+        .defer('search_vector')
+        .order_by('-rank', '-created_at', 'pk')
+    )
+
+
+def get_blogpost_list_etag(request, *args, **kwargs) -> str:
+    """Функция возвращает ETag списка постов по версии постов без выбора самих постов"""
+    return make_etag(request, BLOG_VERSION)
+
 
+def get_blogpost_detail_etag(request, pk, *args, **kwargs):
+    """Функция возвращает ETag страницы поста по версии постов, None - поста нет, и страница ответит 404.
+    Просмотры в ETag не входят: каждый просмотр увеличивает их, и страница никогда не ответила бы 304,
+    поэтому в закэшированной браузером странице просмотры обновляются вместе с версией постов"""
+    if get_blogpost_views_count(request, pk) is None:
+        return None
+    return make_etag(request, BLOG_VERSION, pk)
 
-def get_blogpost_for_cache():
-    """Функция получает список постов из кэша или из БД и тогда записывает в кэш"""
-    if settings.CACHE_ENABLED:
-        key = 'blogposts'
-        blogposts_list = cache.get(key)
-        if blogposts_list is None:
-            blogposts_list = BlogPost.objects.filter(is_published=True)
-            cache.set(key, blogposts_list)
-    else:
-        blogposts_list = BlogPost.objects.filter(is_published=True)
 
-    return blogposts_list
+def get_blogposts_last_modified(request, *args, **kwargs):
+    """Функция возвращает время последнего изменения постов"""
+    return get_content_last_modified(request, BLOG_VERSION)
@@ -0,0 +1,47 @@
+import logging
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from blog.images import make_preview_variants
+from blog.models import BlogPost
+from blog.services import invalidate_blogposts, update_blogpost_search_vector
+from mailing.versions import BLOG_VERSION, touch_content_version
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=BlogPost)
+@receiver(post_delete, sender=BlogPost)
+def blogpost_changed(sender, **kwargs):
+    """Сигнал сбрасывает список постов и увеличивает версию постов при создании, изменении и удалении поста"""
+    invalidate_blogposts()
+    touch_content_version(BLOG_VERSION)
+
+
+@receiver(post_save, sender=BlogPost)
+def blogpost_search_saved(sender, instance, **kwargs):
+    """Сигнал пересчитывает поисковый вектор поста при его создании и изменении"""
+    update_blogpost_search_vector(instance.pk)
+
+
+@receiver(post_save, sender=BlogPost)
+def blogpost_preview_saved(sender, instance, update_fields=None, **kwargs):
+    """Сигнал создает уменьшенные копии превью при сохранении поста и запоминает хэш превью, по которому
+    страницы строят ссылки на копии, существующие копии не пересоздаются. Ошибка создания только логируется:
+    хэш сбрасывается, и копии создадутся при первом показе превью"""
+    if update_fields is not None and 'preview' not in update_fields:
+        return
+    preview_hash = None
+    if instance.preview:
+        try:
+            preview_hash = make_preview_variants(instance.preview.name)
+        except Exception:
+            logger.exception("Failed to make previews for blog post %s", instance.pk)
+    if preview_hash != instance.preview_hash:
+        instance.preview_hash = preview_hash
+        # update() не вызывает сигналы, поэтому список постов и версия постов обновляются еще раз:
+        # между сбросом в blogpost_changed и записью хэша страницы могли закэшировать старый хэш
+        BlogPost.objects.filter(pk=instance.pk).update(preview_hash=preview_hash)
+        invalidate_blogposts()
+        touch_content_version(BLOG_VERSION)
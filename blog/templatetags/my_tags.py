@@ -1,5 +1,7 @@
 from django import template
 
+from blog.images import get_preview_variant_url
+
 register = template.Library()
 
 
@@ -8,3 +10,9 @@ def media_filter(path):
     if path:
         return f"/media/{path}"
     return '#'
+
+
+@register.simple_tag()
+def preview_url(blogpost, variant='card', image_format='jpeg'):
+    """Тег возвращает ссылку на уменьшенную копию превью поста нужного размера и формата"""
+    return get_preview_variant_url(str(blogpost.preview or ''), variant, image_format, blogpost.preview_hash)
@@ -1,3 +1,208 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from blog.counters import BlogPostViewCounter
+from blog.images import PREVIEW_FORMATS, PREVIEW_VARIANTS, get_preview_variant_name
+from blog.models import BlogPost
+from blog.services import (get_blogpost_for_cache, get_blogpost_search_vector, invalidate_blogposts,
+                           search_blogposts)
+from blog.templatetags.my_tags import preview_url
+
+
+class BlogPostViewCounterTest(TestCase):
+    """Тесты отложенного подсчета просмотров постов"""
+
+    def setUp(self):
+        cache.clear()
+        self.blogposts = [BlogPost.objects.create(title=f"Пост {i}", is_published=True) for i in range(2)]
+
+    def get_views(self) -> list:
+        return [BlogPost.objects.get(pk=blogpost.pk).views_count for blogpost in self.blogposts]
+
+    @override_settings(CACHE_ENABLED=False)
+    def test_local_views_flushed_in_one_update(self):
+        """Просмотры из памяти процесса записываются одним UPDATE для всех постов"""
+        view_counter = BlogPostViewCounter(flush_seconds=60)
+        for blogpost in [self.blogposts[0]] * 3 + [self.blogposts[1]]:
+            view_counter.add(blogpost.pk)
+        self.assertEqual(view_counter.get_pending(self.blogposts[0].pk), 3)
+        self.assertEqual(self.get_views(), [0, 0])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(view_counter.flush(), 4)
+        self.assertEqual(self.get_views(), [3, 1])
+        self.assertEqual(view_counter.get_pending(self.blogposts[0].pk), 0)
+
+    @override_settings(CACHE_ENABLED=False)
+    def test_local_views_kept_after_failed_flush(self):
+        """Если записать просмотры не удалось, они остаются в памяти процесса до следующей записи"""
+        view_counter = BlogPostViewCounter(flush_seconds=60)
+        view_counter.add(self.blogposts[0].pk)
+        with mock.patch('blog.counters.update_views_count', side_effect=DatabaseError('db is down')), \
+                self.assertRaises(DatabaseError):
+            view_counter.flush()
+
+        view_counter.add(self.blogposts[0].pk)
+        self.assertEqual(view_counter.flush(), 2)
+        self.assertEqual(self.get_views(), [2, 0])
+
+    @override_settings(CACHE_ENABLED=True)
+    def test_cache_views_flushed_and_subtracted(self):
+        """Просмотры из кэша вычитаются на записанное количество, а не удаляются"""
+        view_counter = BlogPostViewCounter()
+        view_counter.add(self.blogposts[1].pk)
+        view_counter.add(self.blogposts[1].pk)
+
+        self.assertEqual(view_counter.flush(), 2)
+        view_counter.add(self.blogposts[1].pk)
+
+        self.assertEqual(self.get_views(), [0, 2])
+        self.assertEqual(view_counter.get_pending(self.blogposts[1].pk), 1)
+
+
+def make_image(name: str = 'preview.png', size: tuple = (1200, 900)) -> SimpleUploadedFile:
+    buffer = BytesIO()
+    Image.new('RGB', size, (200, 100, 50)).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+@override_settings(CACHE_ENABLED=False)
+class BlogPostDetailViewTest(TestCase):
+    """Тесты учета просмотров и ETag страницы поста"""
+
+    def setUp(self):
+        self.blogpost = BlogPost.objects.create(title='Пост', is_published=True)
+        self.url = reverse('blog:view', args=[self.blogpost.pk])
+        self.view_counter = BlogPostViewCounter(flush_seconds=60)
+        patcher = mock.patch('blog.services.get_view_counter', return_value=self.view_counter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_not_modified_counts_view(self):
+        """Повторный запрос с ETag страницы отвечает 304 Not Modified и тоже учитывается как просмотр поста"""
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.view_counter.get_pending(self.blogpost.pk), 2)
+        self.assertEqual(self.view_counter.flush(), 2)
+        self.assertEqual(BlogPost.objects.get(pk=self.blogpost.pk).views_count, 2)
+
+    def test_page_shows_pending_views(self):
+        """Страница поста показывает просмотры, еще не записанные в БД, ETag меняется при изменении поста"""
+        etag = self.client.get(self.url)['ETag']
+        self.view_counter.add(self.blogpost.pk)
+        self.blogpost.title = 'Новый заголовок'
+        self.blogpost.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.context['object'].views_count, 3)
+        self.assertEqual(BlogPost.objects.get(pk=self.blogpost.pk).views_count, 0)
+
+
+class BlogPostPreviewTest(TestCase):
+    """Тесты уменьшенных копий превью постов"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        invalidate_blogposts()
+
+    def test_preview_hash_saved_with_post(self):
+        """При сохранении поста создаются все копии превью и запоминается хэш превью"""
+        blogpost = BlogPost.objects.create(title='Пост', is_published=True, preview=make_image())
+
+        blogpost.refresh_from_db()
+        self.assertEqual(len(blogpost.preview_hash), 64)
+        for variant in PREVIEW_VARIANTS:
+            for image_format in PREVIEW_FORMATS:
+                self.assertTrue(default_storage.exists(
+                    get_preview_variant_name(blogpost.preview_hash, variant, image_format)))
+
+    def test_preview_url_does_not_read_source(self):
+        """Ссылки на копии превью строятся по хэшу без чтения исходного изображения"""
+        blogpost = BlogPost.objects.create(title='Пост', is_published=True, preview=make_image())
+        blogpost.refresh_from_db()
+        blogpost_preview = get_blogpost_for_cache()[0]
+
+        with mock.patch.object(default_storage, 'open', side_effect=AssertionError('source read')):
+            urls = [preview_url(blogpost, 'detail', 'webp'), preview_url(blogpost_preview, 'card', 'jpeg')]
+
+        self.assertEqual(urls, [
+            default_storage.url(get_preview_variant_name(blogpost.preview_hash, 'detail', 'webp')),
+            default_storage.url(get_preview_variant_name(blogpost.preview_hash, 'card', 'jpeg')),
+        ])
+
+    def test_save_without_preview_keeps_hash(self):
+        """Сохранение полей поста без превью не пересчитывает хэш, удаление превью сбрасывает хэш"""
+        blogpost = BlogPost.objects.create(title='Пост', preview=make_image())
+        blogpost.refresh_from_db()
+        preview_hash = blogpost.preview_hash
+
+        with mock.patch('blog.signals.make_preview_variants') as make_preview_variants:
+            blogpost.title = 'Новый заголовок'
+            blogpost.save(update_fields=['title'])
+        make_preview_variants.assert_not_called()
+        self.assertEqual(BlogPost.objects.get(pk=blogpost.pk).preview_hash, preview_hash)
+
+        blogpost.preview = None
+        blogpost.save()
+        self.assertIsNone(BlogPost.objects.get(pk=blogpost.pk).preview_hash)
+
+
+class BlogPostSearchTest(TestCase):
+    """Тесты полнотекстового поиска постов"""
+
+    def setUp(self):
+        cache.clear()
+        self.in_title = BlogPost.objects.create(title='Настройка рассылки', content='Пошаговая инструкция',
+                                                is_published=True)
+        self.in_content = BlogPost.objects.create(title='Новости', content='Мы улучшили рассылки клиентам',
+                                                  is_published=True)
+        BlogPost.objects.create(title='Черновик рассылки', content='Рассылка', is_published=False)
+        BlogPost.objects.create(title='Отпуск', content='Фотографии с моря', is_published=True)
+
+    def test_search_by_morphology_ranked_by_title(self):
+        """Посты находятся по любой форме слова, совпадение в заголовке выше совпадения в содержимом,
+        неопубликованные посты не находятся"""
+        self.assertEqual(list(search_blogposts('рассылка')), [self.in_title, self.in_content])
+        self.assertEqual(list(search_blogposts('инструкции')), [self.in_title])
+        self.assertEqual(list(search_blogposts('самолет')), [])
+
+    def test_search_updated_after_post_change(self):
+        """Поисковый вектор пересчитывается при изменении поста"""
+        self.in_content.content = 'Фотографии самолетов'
+        self.in_content.save()
+        self.assertEqual(list(search_blogposts('самолет')), [self.in_content])
+        self.assertEqual(list(search_blogposts('рассылка')), [self.in_title])
+
+    def test_list_view_search_pages(self):
+        """Список постов показывает найденные посты по страницам, ссылки на страницы сохраняют запрос"""
+        BlogPost.objects.bulk_create([
+            BlogPost(title=f"Рассылка {i}", content='Текст', is_published=True) for i in range(20)
+        ])
+        BlogPost.objects.filter(title__startswith='Рассылка ').update(
+            search_vector=get_blogpost_search_vector())
+
+        response = self.client.get(reverse('blog:list'), {'q': 'рассылки', 'page': 2})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['paginator'].count, 22)
+        self.assertEqual(len(response.context['object_list']), 2)
+        self.assertEqual(response.context['page_query'], 'q=%D1%80%D0%B0%D1%81%D1%81%D1%8B%D0%BB%D0%BA%D0%B8')
@@ -4,34 +4,64 @@ from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.contrib.auth.models import Group
 from django.core.mail import send_mail
+from django.http import HttpResponseRedirect
 from django.urls import reverse_lazy, reverse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from pytils.translit import slugify
 
 from blog.forms import BlogPostForm, BlogPostUpdateForm
 from blog.models import BlogPost
-from blog.services import get_blogpost_for_cache
+from blog.services import (get_blogpost_detail_etag, get_blogpost_for_cache, get_blogpost_list_etag,
+                           get_blogpost_views_count, get_blogposts_last_modified, record_blogpost_view,
+                           search_blogposts)
+from mailing.forms import SearchForm
 
 
+@method_decorator(condition(etag_func=get_blogpost_list_etag, last_modified_func=get_blogposts_last_modified),
+                  name='get')
 class BlogPostListView(ListView):
-    """Контроллер для вывода списка постов"""
+    """Контроллер для вывода списка постов, если посты не менялись, отвечает 304 Not Modified"""
     model = BlogPost
+    template_name = 'blog/blogpost_list.html'
+    paginate_by = 20
 
     def get_queryset(self, *args, **kwargs):
-        """Метод возвращает опубликованные блоговые записи из БД или из кэша"""
+        """Метод возвращает найденные посты, а без запроса поиска - краткие записи опубликованных постов
+        из БД или из кэша"""
+        self.search_form = SearchForm(self.request.GET)
+        if self.search_form.is_valid() and self.search_form.cleaned_data['q']:
+            return search_blogposts(self.search_form.cleaned_data['q'])
         return get_blogpost_for_cache()
 
+    def get_context_data(self, *args, **kwargs):
+        """Метод передает форму поиска и параметры запроса для ссылок на страницы"""
+        context_data = super().get_context_data(*args, **kwargs)
+        context_data['search_form'] = self.search_form
+        query = self.request.GET.copy()
+        query.pop('page', None)
+        context_data['page_query'] = query.urlencode()
+        return context_data
 
+
+@method_decorator(condition(etag_func=get_blogpost_detail_etag, last_modified_func=get_blogposts_last_modified),
+                  name='get')
 class BlogPostDetailView(DetailView):
-    """Контроллер для просмотра одного поста"""
+    """Контроллер для просмотра одного поста, если пост не менялся, отвечает 304 Not Modified"""
     model = BlogPost
 
+    def dispatch(self, request, *args, **kwargs):
+        """Метод учитывает просмотр до проверки ETag, поэтому ответ 304 Not Modified тоже считается просмотром"""
+        if request.method == 'GET':
+            record_blogpost_view(request, kwargs['pk'])
+        return super().dispatch(request, *args, **kwargs)
+
     def get_object(self, queryset=None):
-        """Метод ведет подсчет количества просмотров"""
+        """Метод показывает просмотры поста вместе с еще не записанными в БД"""
         self.object = super().get_object(queryset)
-        self.object.views_count += 1
-        self.object.save(update_fields=['views_count'])
+        self.object.views_count = get_blogpost_views_count(self.request, self.object.pk)
 
         return self.object
 
@@ -59,12 +89,12 @@ class BlogPostUpdateView(LoginRequiredMixin, PermissionRequiredMixin, UpdateView
     permission_required = 'blog.change_blogpost'
 
     def form_valid(self, form):
-        if form.is_valid():
-            new_post = form.save()
-            new_post.slug = slugify(new_post.title)
-            new_post.save()
+        self.object = form.save(commit=False)
+        self.object.slug = slugify(self.object.title)
+        # просмотры не перезаписываются: их увеличивает отложенная запись просмотров
+        self.object.save(update_fields=[*form.Meta.fields, 'slug'])
 
-        return super().form_valid(form)
+        return HttpResponseRedirect(self.get_success_url())
 
     def get_success_url(self):
         return reverse('blog:view', args=[self.kwargs.get('pk')])
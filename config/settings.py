@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_crontab',
     "django_apscheduler",
     'django.contrib.admindocs',
@@ -150,15 +151,85 @@ DEFAULT_FROM_EMAIL = os.getenv("EMAIL_HOST_USER")
 SERVER_EMAIL = os.getenv("EMAIL_HOST_USER")
 EMAIL_ADMIN = os.getenv("EMAIL_HOST_USER")
 
+# максимальное количество одновременных соединений с одним SMTP-сервером
+EMAIL_POOL_SIZE = int(os.getenv("EMAIL_POOL_SIZE", 2))
+EMAIL_POOL_IDLE_TIMEOUT = int(os.getenv("EMAIL_POOL_IDLE_TIMEOUT", 60))
+EMAIL_SEND_BATCH_SIZE = int(os.getenv("EMAIL_SEND_BATCH_SIZE", 100))
+
+# per_recipient - отдельное письмо каждому клиенту, bulk - одно письмо всем клиентам рассылки
+MAILING_DISPATCH_MODE = os.getenv("MAILING_DISPATCH_MODE", 'per_recipient')
+MAILING_SEND_CHUNK_SIZE = int(os.getenv("MAILING_SEND_CHUNK_SIZE", 500))
+
+# True - письма из исходящей очереди отправляют процессы команды runmailingworker
+MAILING_OUTBOX_WORKERS = os.getenv("MAILING_OUTBOX_WORKERS") == 'True'
+# срок, после которого неотмеченное письмо считается брошенным упавшим процессом и отправляется повторно
+MAILING_OUTBOX_LEASE_SECONDS = int(os.getenv("MAILING_OUTBOX_LEASE_SECONDS", 600))
+MAILING_WORKER_IDLE_SLEEP = float(os.getenv("MAILING_WORKER_IDLE_SLEEP", 5))
+MAILING_SEND_WORKERS = int(os.getenv("MAILING_SEND_WORKERS", 4))
+
+# попытки рассылки записываются в БД пачками по MAILING_ATTEMPT_FLUSH_SIZE,
+# но не реже раза в MAILING_ATTEMPT_FLUSH_SECONDS секунд
+MAILING_ATTEMPT_FLUSH_SIZE = int(os.getenv("MAILING_ATTEMPT_FLUSH_SIZE", 500))
+MAILING_ATTEMPT_FLUSH_SECONDS = float(os.getenv("MAILING_ATTEMPT_FLUSH_SECONDS", 5))
+
+# лимиты отправки писем в секунду и в минуту, 0 - без ограничения
+MAILING_RATE_LIMITS = {
+    'sender': {
+        'second': int(os.getenv("MAILING_SENDER_RATE_PER_SECOND", 0)),
+        'minute': int(os.getenv("MAILING_SENDER_RATE_PER_MINUTE", 0)),
+    },
+    'domain': {
+        'second': int(os.getenv("MAILING_DOMAIN_RATE_PER_SECOND", 0)),
+        'minute': int(os.getenv("MAILING_DOMAIN_RATE_PER_MINUTE", 0)),
+    },
+}
+
+# повторная отправка писем после временных ошибок (коды 4xx, разрыв соединения) с экспоненциальной задержкой
+MAILING_RETRY_MAX_ATTEMPTS = int(os.getenv("MAILING_RETRY_MAX_ATTEMPTS", 5))
+MAILING_RETRY_BASE_DELAY = int(os.getenv("MAILING_RETRY_BASE_DELAY", 60))
+MAILING_RETRY_MAX_DELAY = int(os.getenv("MAILING_RETRY_MAX_DELAY", 3600))
+MAILING_RETRY_BATCH_SIZE = int(os.getenv("MAILING_RETRY_BATCH_SIZE", 50))
+MAILING_RETRY_RATE_LIMITS = {
+    'sender': {
+        'second': int(os.getenv("MAILING_RETRY_RATE_PER_SECOND", 0)),
+        'minute': int(os.getenv("MAILING_RETRY_RATE_PER_MINUTE", 0)),
+    },
+}
+
+# True - задачи рассылок выполняет только один процесс из всех запущенных планировщиков и cron,
+# резервный процесс становится ведущим в течение MAILING_LEADER_HEARTBEAT_SECONDS после падения ведущего
+MAILING_LEADER_ELECTION = os.getenv("MAILING_LEADER_ELECTION", 'True') == 'True'
+MAILING_LEADER_HEARTBEAT_SECONDS = int(os.getenv("MAILING_LEADER_HEARTBEAT_SECONDS", 5))
+# срок аренды блокировки в кэше, если БД не Postgres
+MAILING_LEADER_LEASE_SECONDS = int(os.getenv("MAILING_LEADER_LEASE_SECONDS", 15))
+# срок, после которого планировщик без отметки считается упавшим и его рассылки распределяются между другими
+MAILING_SHARD_NODE_TIMEOUT = int(os.getenv("MAILING_SHARD_NODE_TIMEOUT", 15))
+
+# попытки рассылки старше MAILING_ATTEMPT_RETENTION_DAYS дней сворачиваются в дневную статистику и удаляются
+MAILING_ATTEMPT_RETENTION_DAYS = int(os.getenv("MAILING_ATTEMPT_RETENTION_DAYS", 30))
+MAILING_ATTEMPT_ROLLUP_BATCH_SIZE = int(os.getenv("MAILING_ATTEMPT_ROLLUP_BATCH_SIZE", 5000))
+# количество последних попыток на странице рассылки
+MAILING_DETAIL_ATTEMPTS_COUNT = int(os.getenv("MAILING_DETAIL_ATTEMPTS_COUNT", 100))
+# количество попыток рассылки, читаемых из БД за раз при выгрузке
+MAILING_EXPORT_CHUNK_SIZE = int(os.getenv("MAILING_EXPORT_CHUNK_SIZE", 2000))
+
+# статусы рассылок меняются и рассылки отправляются одним заданием: задания crontab - отдельные процессы,
+# и из двух одновременных заданий блокировку ведущего процесса получило бы только одно
 CRONJOBS = [
-    ('*/1 * * * *', 'mailing.services.change_mailing_status'),
-    ('*/1 * * * *', 'mailing.services.send_mailing'),
+    ('*/1 * * * *', 'mailing.services.run_mailing_jobs'),
+    ('0 3 * * *', 'mailing.services.rollup_attempts'),
+    ('*/1 * * * *', 'blog.services.flush_blogpost_views'),
 ]
 
 APSCHEDULER_DATETIME_FORMAT = "N j, Y, f:s a"
 
 APSCHEDULER_RUN_NOW_TIMEOUT = 25
 
+# True - запускать рассылки точно в их время вместо опроса БД каждые 59 секунд
+MAILING_EXACT_SCHEDULING = os.getenv("MAILING_EXACT_SCHEDULING") == 'True'
+MAILING_SCHEDULE_WATCH_SECONDS = int(os.getenv("MAILING_SCHEDULE_WATCH_SECONDS", 5))
+MAILING_SCHEDULE_MAX_SLEEP = int(os.getenv("MAILING_SCHEDULE_MAX_SLEEP", 300))
+
 AUTH_USER_MODEL = 'users.User'
 
 LOGIN_REDIRECT_URL = '/'
@@ -171,6 +242,19 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 CACHE_ENABLED = os.getenv('CACHE_ENABLED') == 'True'
 
+# время жизни значений в памяти процесса перед общим кэшем и количество таких значений
+CACHE_LOCAL_TIMEOUT = float(os.getenv("CACHE_LOCAL_TIMEOUT", 5))
+CACHE_LOCAL_MAX_SIZE = int(os.getenv("CACHE_LOCAL_MAX_SIZE", 256))
+# как часто каждый процесс пишет в лог попадания и промахи своих двухуровневых кэшей, 0 - не писать
+CACHE_STATS_LOG_SECONDS = int(os.getenv("CACHE_STATS_LOG_SECONDS", 300))
+BLOG_CACHE_TIMEOUT = int(os.getenv("BLOG_CACHE_TIMEOUT", 300))
+
+# как часто накопленные просмотры постов записываются в БД
+BLOG_VIEWS_FLUSH_SECONDS = int(os.getenv("BLOG_VIEWS_FLUSH_SECONDS", 60))
+
+# время жизни статистики рассылок на главной странице, статистика также сбрасывается при изменении рассылок и клиентов
+MAILING_STATISTIC_CACHE_TIMEOUT = int(os.getenv("MAILING_STATISTIC_CACHE_TIMEOUT", 300))
+
 if CACHE_ENABLED:
     CACHES = {
         "default": {
@@ -178,3 +262,19 @@ if CACHE_ENABLED:
             "LOCATION": os.getenv('CACHES_LOCATION'),
         }
     }
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'mailing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
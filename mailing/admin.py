@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from mailing.models import Client, Message, MailingSettings, MailingAttempt
+from mailing.models import (Client, ContentVersion, Message, MailingSettings, MailingAttempt, MailingAttemptDaily,
+                            MailServerResponse, OutboxMessage, SchedulerNode)
 
 
 @admin.register(Client)
@@ -15,10 +16,40 @@ class MessageAdmin(admin.ModelAdmin):
 
 @admin.register(MailingSettings)
 class MailingSettingsAdmin(admin.ModelAdmin):
-    list_display = ('start_datetime', 'end_datetime', 'periodicity', 'mailing_status', 'message')
+    list_display = ('start_datetime', 'end_datetime', 'periodicity', 'mailing_status', 'message', 'next_send_datetime',
+                    'send_count', 'success_count', 'failure_count')
 
 
 @admin.register(MailingAttempt)
 class MailingAttemptAdmin(admin.ModelAdmin):
-    list_display = ('datetime_last_try', 'attempt_status', 'response_mail_server', 'mailing')
+    list_display = ('datetime_last_try', 'attempt_status', 'mail_server_response', 'mailing', 'client')
+    list_select_related = ('mail_server_response', 'mailing', 'client')
     list_filter = ('mailing',)
+
+
+@admin.register(MailingAttemptDaily)
+class MailingAttemptDailyAdmin(admin.ModelAdmin):
+    list_display = ('date', 'mailing', 'success_count', 'failure_count', 'first_try_datetime', 'last_try_datetime')
+    list_filter = ('mailing',)
+
+
+@admin.register(MailServerResponse)
+class MailServerResponseAdmin(admin.ModelAdmin):
+    list_display = ('text',)
+    search_fields = ('text',)
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('email', 'status', 'scheduled_datetime', 'locked_datetime', 'mailing')
+    list_filter = ('status', 'mailing')
+
+
+@admin.register(SchedulerNode)
+class SchedulerNodeAdmin(admin.ModelAdmin):
+    list_display = ('name', 'heartbeat_datetime')
+
+
+@admin.register(ContentVersion)
+class ContentVersionAdmin(admin.ModelAdmin):
+    list_display = ('name', 'version', 'updated_at')
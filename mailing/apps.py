@@ -7,8 +7,10 @@ class MailingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mailing'
 
-# сделать активными это строки для автоматического запуска попыток рассылки
-    # def ready(self):
-    #     from mailing.services import start
-    #     sleep(2)
-    #     start()
+    def ready(self):
+        import mailing.signals  # noqa: F401
+
+        # сделать активными это строки для автоматического запуска попыток рассылки
+        # from mailing.services import start
+        # sleep(2)
+        # start()
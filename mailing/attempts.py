@@ -0,0 +1,163 @@
+import atexit
+import logging
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.utils import timezone
+
+from mailing.models import MailingAttempt, MailingAttemptDaily, MailingSettings
+from mailing.versions import MAILING_ATTEMPTS_VERSION, touch_content_version
+
+logger = logging.getLogger(__name__)
+
+
+class AttemptWriter:
+    """Класс буфера попыток рассылки: попытки копятся в памяти и записываются в БД одним bulk_create,
+    когда в буфере набралось MAILING_ATTEMPT_FLUSH_SIZE попыток или с последней записи прошло
+    MAILING_ATTEMPT_FLUSH_SECONDS секунд. В той же транзакции увеличиваются счетчики рассылок и дневная статистика.
+    Буфер также записывается в конце каждого запуска отправки, при ошибке отправки и при завершении процесса"""
+
+    def __init__(self, flush_size: int = None, flush_seconds: float = None):
+        self.flush_size = flush_size or settings.MAILING_ATTEMPT_FLUSH_SIZE
+        self.flush_seconds = flush_seconds if flush_seconds is not None else settings.MAILING_ATTEMPT_FLUSH_SECONDS
+        self._attempts = []
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, attempts: list) -> None:
+        """Метод добавляет попытки в буфер и записывает буфер, если достигнут порог размера или времени"""
+        with self._lock:
+            self._attempts.extend(attempts)
+            is_full = len(self._attempts) >= self.flush_size
+            is_expired = time.monotonic() - self._flushed_at >= self.flush_seconds
+            if is_full or is_expired:
+                self._flush()
+
+    def flush(self) -> int:
+        """Метод записывает все попытки из буфера, возвращает количество записанных попыток"""
+        with self._lock:
+            return self._flush()
+
+    def _flush(self) -> int:
+        attempts, self._attempts = self._attempts, []
+        self._flushed_at = time.monotonic()
+        if attempts:
+            try:
+                with transaction.atomic():
+                    MailingAttempt.objects.bulk_create(attempts, batch_size=self.flush_size)
+                    update_mailing_counters(attempts)
+                    update_daily_counters(attempts)
+            except Exception:
+                self._attempts = attempts + self._attempts  # попытки запишутся при следующей записи буфера
+                raise
+            touch_content_version(MAILING_ATTEMPTS_VERSION)
+        return len(attempts)
+
+
+def update_mailing_counters(attempts: list) -> None:
+    """Функция увеличивает счетчики попыток рассылок на записанные попытки одним UPDATE на рассылку,
+    значения считаются в БД через F(), поэтому одновременные записи из разных процессов не теряются"""
+    mailing_counters = {}
+    for attempt in attempts:
+        if attempt.mailing_id is None:
+            continue
+        counters = mailing_counters.setdefault(attempt.mailing_id, {
+            'success_count': 0, 'failure_count': 0, 'last_success_datetime': None, 'last_failure_datetime': None,
+        })
+        if attempt.attempt_status == MailingAttempt.SUCCESSFULLY:
+            counters['success_count'] += 1
+            counters['last_success_datetime'] = max(
+                filter(None, [counters['last_success_datetime'], attempt.datetime_last_try]))
+        else:
+            counters['failure_count'] += 1
+            counters['last_failure_datetime'] = max(
+                filter(None, [counters['last_failure_datetime'], attempt.datetime_last_try]))
+
+    # рассылки обновляются в порядке id, чтобы одновременные записи не блокировали друг друга
+    for mailing_id, counters in sorted(mailing_counters.items()):
+        updates = {
+            'send_count': F('send_count') + counters['success_count'] + counters['failure_count'],
+            'success_count': F('success_count') + counters['success_count'],
+            'failure_count': F('failure_count') + counters['failure_count'],
+        }
+        for field_name in ('last_success_datetime', 'last_failure_datetime'):
+            if counters[field_name] is not None:
+                value = Value(counters[field_name])
+                updates[field_name] = Greatest(Coalesce(field_name, value), value)
+        MailingSettings.objects.filter(pk=mailing_id).update(**updates)
+
+
+def update_daily_counters(attempts: list) -> None:
+    """Функция добавляет записанные попытки в дневную статистику рассылок: недостающие дни создаются
+    одним bulk_create с пропуском конфликтов, счетчики дней увеличиваются в БД через F(),
+    поэтому отчет по дням строится без выбора самих попыток"""
+    day_counters = {}
+    for attempt in attempts:
+        if attempt.mailing_id is None:
+            continue
+        counters = day_counters.setdefault((attempt.mailing_id, timezone.localdate(attempt.datetime_last_try)), {
+            'success_count': 0, 'failure_count': 0,
+            'first_try_datetime': attempt.datetime_last_try, 'last_try_datetime': attempt.datetime_last_try,
+        })
+        if attempt.attempt_status == MailingAttempt.SUCCESSFULLY:
+            counters['success_count'] += 1
+        else:
+            counters['failure_count'] += 1
+        counters['first_try_datetime'] = min(counters['first_try_datetime'], attempt.datetime_last_try)
+        counters['last_try_datetime'] = max(counters['last_try_datetime'], attempt.datetime_last_try)
+    if not day_counters:
+        return
+
+    # день мог создать другой процесс, поэтому конфликты пропускаются и счетчики увеличиваются у всех дней
+    MailingAttemptDaily.objects.bulk_create([
+        MailingAttemptDaily(mailing_id=mailing_id, date=date, first_try_datetime=counters['first_try_datetime'],
+                            last_try_datetime=counters['last_try_datetime'])
+        for (mailing_id, date), counters in day_counters.items()
+    ], ignore_conflicts=True)
+    for (mailing_id, date), counters in sorted(day_counters.items()):
+        MailingAttemptDaily.objects.filter(mailing_id=mailing_id, date=date).update(
+            success_count=F('success_count') + counters['success_count'],
+            failure_count=F('failure_count') + counters['failure_count'],
+            first_try_datetime=Least('first_try_datetime', Value(counters['first_try_datetime'])),
+            last_try_datetime=Greatest('last_try_datetime', Value(counters['last_try_datetime'])),
+        )
+
+
+_attempt_writer = None
+_attempt_writer_lock = threading.Lock()
+
+
+def get_attempt_writer() -> AttemptWriter:
+    """Функция возвращает общий для процесса буфер попыток рассылки"""
+    global _attempt_writer
+    with _attempt_writer_lock:
+        if _attempt_writer is None:
+            _attempt_writer = AttemptWriter()
+            atexit.register(flush_attempts)
+    return _attempt_writer
+
+
+def flush_attempts() -> None:
+    """Функция записывает буфер попыток рассылки процесса, ошибка записи только логируется"""
+    if _attempt_writer is None:
+        return
+    try:
+        _attempt_writer.flush()
+    except Exception:
+        logger.exception("Failed to flush mailing attempts")
+
+
+def stop_on_sigterm() -> None:
+    """Функция завершает команду по SIGTERM (так останавливают процесс systemd и Docker) так же, как по Ctrl+C:
+    atexit при SIGTERM не вызывается, а обработка KeyboardInterrupt в команде записывает буфер попыток"""
+    signal.signal(signal.SIGTERM, raise_keyboard_interrupt)
+
+
+def raise_keyboard_interrupt(signum, frame):
+    """Обработчик сигнала прерывает команду исключением KeyboardInterrupt"""
+    raise KeyboardInterrupt(f"Signal {signum} received")
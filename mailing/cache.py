@@ -0,0 +1,136 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+def get_or_set_single_flight(key: str, compute, timeout: int, lock_timeout: int = 10):
+    """Функция возвращает значение из кэша, а при его отсутствии пересчитывает значение только в одном процессе:
+    процесс, захвативший блокировку, считает значение и записывает его в кэш, остальные процессы ждут
+    его результат, но не дольше lock_timeout секунд, после чего считают значение сами"""
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = f"{key}:lock"
+    if cache.add(lock_key, 1, lock_timeout):
+        try:
+            value = compute()
+            cache.set(key, value, timeout)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    return compute()
+
+
+class TwoTierCache:
+    """Класс двухуровневого кэша: значения хранятся в памяти процесса (LRU на CACHE_LOCAL_MAX_SIZE ключей,
+    не дольше CACHE_LOCAL_TIMEOUT секунд) и в общем кэше Django (Redis) не дольше timeout секунд.
+    Ключи общего кэша содержат версию пространства имен: сброс увеличивает версию, и старые значения
+    перестают читаться во всех процессах, а в памяти других процессов живут не дольше CACHE_LOCAL_TIMEOUT секунд.
+    При выключенном кэше (CACHE_ENABLED) используется только память процесса.
+    Попадания и промахи процесс пишет в лог не чаще раза в CACHE_STATS_LOG_SECONDS секунд"""
+
+    def __init__(self, name: str, timeout: int, local_timeout: float = None, max_size: int = None):
+        self.name = name
+        self.timeout = timeout
+        self.local_timeout = settings.CACHE_LOCAL_TIMEOUT if local_timeout is None else local_timeout
+        self.max_size = max_size or settings.CACHE_LOCAL_MAX_SIZE
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._stats_logged_at = time.monotonic()
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_set(self, key: str, compute):
+        """Метод возвращает значение из памяти процесса, из общего кэша или считает его и записывает в оба уровня"""
+        with self._lock:
+            expires_at, value = self._local.get(key, (0, None))
+            is_local_hit = expires_at > time.monotonic()
+            if is_local_hit:
+                self._local.move_to_end(key)
+                self.local_hits += 1
+        if is_local_hit:
+            self._log_stats_if_due()
+            return value
+
+        is_shared_hit = False
+        if settings.CACHE_ENABLED:
+            shared_key = f"{self.name}:{self._get_version()}:{key}"
+            value = cache.get(shared_key)
+            is_shared_hit = value is not None
+            if not is_shared_hit:
+                value = get_or_set_single_flight(shared_key, compute, self.timeout)
+        else:
+            value = compute()
+
+        with self._lock:
+            if is_shared_hit:
+                self.shared_hits += 1
+            else:
+                self.misses += 1
+            self._local[key] = (time.monotonic() + self.local_timeout, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+        self._log_stats_if_due()
+        return value
+
+    def invalidate(self) -> None:
+        """Метод сбрасывает все значения пространства имен: в памяти процесса сразу, в общем кэше - новой версией"""
+        with self._lock:
+            self._local.clear()
+        if settings.CACHE_ENABLED:
+            try:
+                cache.incr(self._version_key)
+            except ValueError:  # версии еще нет или она вытеснена из кэша
+                self._get_version()
+
+    def get_stats(self) -> dict:
+        """Метод возвращает счетчики попаданий и промахов кэша в текущем процессе"""
+        with self._lock:
+            return {
+                'local_hits': self.local_hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'local_size': len(self._local),
+            }
+
+    def _log_stats_if_due(self) -> None:
+        if not settings.CACHE_STATS_LOG_SECONDS:
+            return
+        with self._lock:
+            if time.monotonic() - self._stats_logged_at < settings.CACHE_STATS_LOG_SECONDS:
+                return
+            self._stats_logged_at = time.monotonic()
+        stats = self.get_stats()
+        requests_count = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        logger.info("Cache %s: local hits %s, shared hits %s, misses %s, hit ratio %.1f%%, local size %s",
+                    self.name, stats['local_hits'], stats['shared_hits'], stats['misses'],
+                    100 * (stats['local_hits'] + stats['shared_hits']) / requests_count, stats['local_size'])
+
+    @property
+    def _version_key(self) -> str:
+        return f"{self.name}:version"
+
+    def _get_version(self) -> int:
+        version = cache.get(self._version_key)
+        if version is None:
+            # новая версия не совпадает со старыми, даже если прежняя версия была вытеснена из кэша
+            cache.add(self._version_key, time.time_ns(), None)
+            version = cache.get(self._version_key)
+        return version
+
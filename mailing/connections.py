@@ -0,0 +1,165 @@
+import logging
+import smtplib
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPConnectionPool:
+    """Класс пула SMTP-соединений: открытые соединения переиспользуются между рассылками,
+    количество одновременно открытых соединений ограничено, простаивающие соединения закрываются по таймауту"""
+
+    def __init__(self, host: str = None, size: int = None, idle_timeout: int = None):
+        self.host = host or settings.EMAIL_HOST
+        self.size = size or settings.EMAIL_POOL_SIZE
+        self.idle_timeout = idle_timeout or settings.EMAIL_POOL_IDLE_TIMEOUT
+        self._semaphore = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._idle = deque()  # пары (соединение, время последнего использования)
+
+    @contextmanager
+    def connection(self):
+        """Метод выдает соединение из пула и возвращает его в пул после использования,
+        разорванное соединение закрывается"""
+        self._semaphore.acquire()
+        try:
+            connection = self._take()
+            try:
+                yield connection
+            except Exception as e:
+                if self.is_connection_error(e):
+                    connection.close()
+                else:
+                    self._put(connection)
+                raise
+            self._put(connection)
+        finally:
+            self._semaphore.release()
+
+    @staticmethod
+    def is_connection_error(error: Exception) -> bool:
+        """Метод проверяет, что ошибка связана с разрывом соединения, а не с ответом сервера на письмо"""
+        if isinstance(error, smtplib.SMTPServerDisconnected):
+            return True
+        return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+    @staticmethod
+    def send_with_reconnect(connection, message) -> int:
+        """Метод отправляет одно письмо, при разрыве соединения сервером переподключается
+        и повторяет письмо один раз, возвращает количество принятых сервером писем (0 или 1).
+        Если переподключиться не удалось, вызывает SMTPServerDisconnected"""
+        try:
+            return connection.send_messages([message])
+        except smtplib.SMTPServerDisconnected:
+            logger.info("SMTP connection dropped by server, reconnecting")
+            connection.close()
+            try:
+                connection.open()
+            except OSError as e:  # SMTPException - тоже OSError
+                raise smtplib.SMTPServerDisconnected(f"SMTP reconnect failed: {e}") from e
+            return connection.send_messages([message])
+
+    def send_each(self, connection, messages: list, rate_limiter=None, on_wait=None):
+        """Метод-генератор отправляет письма по одному через соединение и сразу после ответа сервера
+        возвращает результат письма: None - письмо принято сервером, иначе ошибка сервера;
+        перед каждым письмом ожидает ограничитель скорости, перед каждым ожиданием вызывается on_wait.
+        Если соединение разорвано и не восстановлено, остальные письма не отправляются
+        (закрытое соединение Django открывало бы заново для каждого письма),
+        а получают ту же временную ошибку и уходят на повторную отправку"""
+        for index, message in enumerate(messages):
+            if rate_limiter is not None:
+                rate_limiter.acquire(message.from_email, message.recipients(), on_wait)
+            try:
+                yield None if self.send_with_reconnect(connection, message) else smtplib.SMTPException()
+            except OSError as e:  # SMTPException - тоже OSError
+                yield e
+                if self.is_connection_error(e):
+                    for _ in messages[index + 1:]:
+                        yield e
+                    return
+
+    def close_idle(self) -> None:
+        """Метод закрывает соединения, простаивающие дольше таймаута"""
+        with self._lock:
+            expired = self._pop_expired()
+        for connection in expired:
+            connection.close()
+
+    def close(self) -> None:
+        """Метод закрывает все простаивающие соединения пула"""
+        with self._lock:
+            connections = [connection for connection, _ in self._idle]
+            self._idle.clear()
+        for connection in connections:
+            connection.close()
+
+    def _take(self):
+        """Метод берет из пула живое соединение или открывает новое"""
+        with self._lock:
+            expired = self._pop_expired()
+            connection = self._idle.pop()[0] if self._idle else None
+        for expired_connection in expired:
+            expired_connection.close()
+
+        if connection is not None and not self._is_alive(connection):
+            connection.close()
+            connection = None
+        if connection is None:
+            connection = get_connection(host=self.host, fail_silently=False)
+        connection.open()
+        return connection
+
+    def _put(self, connection) -> None:
+        """Метод возвращает соединение в пул"""
+        with self._lock:
+            self._idle.append((connection, time.monotonic()))
+
+    def _pop_expired(self) -> list:
+        """Метод извлекает из пула соединения, простаивающие дольше таймаута"""
+        now = time.monotonic()
+        expired = [connection for connection, last_used in self._idle if now - last_used > self.idle_timeout]
+        if expired:
+            self._idle = deque(item for item in self._idle if now - item[1] <= self.idle_timeout)
+        return expired
+
+    @staticmethod
+    def _is_alive(connection) -> bool:
+        """Метод проверяет командой NOOP, что сервер не закрыл соединение"""
+        smtp = getattr(connection, 'connection', None)
+        if smtp is None:
+            return True  # соединение еще не открыто или это не SMTP-бэкенд
+        try:
+            return smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Функция проверяет, что ошибка отправки временная и письмо можно отправить повторно:
+    разрыв соединения или ответ сервера с кодом 4xx; ответы с кодом 5xx - постоянные ошибки"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        return bool(codes) and all(400 <= code < 500 for code in codes)
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return SMTPConnectionPool.is_connection_error(error)
+
+
+_smtp_pools = {}
+_smtp_pools_lock = threading.Lock()
+
+
+def get_smtp_pool(host: str = None) -> SMTPConnectionPool:
+    """Функция возвращает общий для процесса пул SMTP-соединений с почтовым сервером,
+    размер пула ограничивает количество одновременных соединений с этим сервером"""
+    host = host or settings.EMAIL_HOST
+    with _smtp_pools_lock:
+        if host not in _smtp_pools:
+            _smtp_pools[host] = SMTPConnectionPool(host=host)
+    return _smtp_pools[host]
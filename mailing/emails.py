@@ -0,0 +1,49 @@
+import copy
+from email.utils import make_msgid
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.core.mail.utils import DNS_NAME
+
+from mailing.models import MailingSettings
+
+
+class PreparedEmailMessage(EmailMessage):
+    """Класс письма одному получателю, собранного из готового MIME-сообщения рассылки:
+    тело письма кодируется один раз, для каждого получателя заменяются только заголовки"""
+
+    def __init__(self, mime_message, to: list, from_email: str = None, idempotency_key: str = None):
+        super().__init__(from_email=from_email or settings.EMAIL_HOST_USER, to=to)
+        self.mime_message = mime_message
+        self.idempotency_key = idempotency_key
+
+    def message(self):
+        """Метод возвращает копию готового MIME-сообщения с адресом получателя и собственным Message-ID,
+        повторная отправка письма с тем же ключом получает тот же Message-ID"""
+        message = copy.copy(self.mime_message)  # удаление заголовка создает у копии собственный список заголовков
+        del message['To']
+        message['To'] = ', '.join(self.to)
+        del message['Message-ID']
+        if self.idempotency_key:
+            message['Message-ID'] = f"<mailing.{self.idempotency_key}@{DNS_NAME}>"
+        else:
+            message['Message-ID'] = make_msgid(domain=DNS_NAME)
+        return message
+
+
+def prepare_mime_message(mailing: MailingSettings):
+    """Функция один раз собирает и кодирует MIME-сообщение рассылки без получателей"""
+    return EmailMessage(
+        subject=mailing.message.theme,
+        body=mailing.message.body,
+        from_email=settings.EMAIL_HOST_USER,
+    ).message()
+
+
+def build_recipient_messages(mime_message, emails: list, idempotency_keys: list = None) -> list:
+    """Функция создает по одному письму на каждый адрес из общего MIME-сообщения рассылки"""
+    idempotency_keys = idempotency_keys or [None] * len(emails)
+    return [
+        PreparedEmailMessage(mime_message, to=[email], idempotency_key=key)
+        for email, key in zip(emails, idempotency_keys)
+    ]
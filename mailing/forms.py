@@ -1,6 +1,7 @@
-from django.forms import BooleanField, CheckboxInput, ModelForm
+from django.forms import (BooleanField, CharField, CheckboxInput, ChoiceField, DateField, DateInput, Form, IntegerField,
+                          ModelForm, TextInput, TypedChoiceField)
 
-from mailing.models import Client, Message, MailingSettings
+from mailing.models import Client, Message, MailingSettings, MailingAttempt
 
 
 class StyleFormMixin:
@@ -33,3 +34,29 @@ class MailingSettingsForm(StyleFormMixin, ModelForm):
     class Meta:
         model = MailingSettings
         exclude = ('mailing_status', 'owner', 'is_disabled')
+
+
+class MailingAttemptFilterForm(StyleFormMixin, Form):
+    """Форма для фильтрации попыток рассылок по статусу и периоду"""
+    attempt_status = TypedChoiceField(
+        label='Статус попытки рассылки',
+        choices=(('', 'Все'),) + MailingAttempt.ATTEMPTS,
+        coerce=int,
+        empty_value=None,
+        required=False,
+    )
+    date_from = DateField(label='С', required=False, widget=DateInput(attrs={'type': 'date'}))
+    date_to = DateField(label='По', required=False, widget=DateInput(attrs={'type': 'date'}))
+
+
+class MailingAttemptExportForm(MailingAttemptFilterForm):
+    """Форма для выгрузки попыток рассылок"""
+    mailing_id = IntegerField(label='Рассылка', required=False)
+    owner_id = IntegerField(label='Владелец', required=False)
+    export_format = ChoiceField(label='Формат', choices=(('csv', 'CSV'), ('jsonl', 'JSONL')), required=False)
+
+
+class SearchForm(StyleFormMixin, Form):
+    """Форма для поиска в списках"""
+    q = CharField(label='Поиск', max_length=200, required=False,
+                  widget=TextInput(attrs={'type': 'search', 'placeholder': 'Поиск'}))
@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import os
+import socket
+import threading
+from functools import wraps
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, InterfaceError, connections
+
+from mailing.sharding import get_current_shard
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLock:
+    """Класс блокировки ведущего процесса: задачи рассылок выполняет только процесс, захвативший блокировку.
+    В Postgres это сессионная advisory-блокировка на отдельном соединении с БД, которую сервер снимает сам,
+    как только соединение упавшего процесса закрывается. В других БД - ключ в кэше Django со сроком аренды
+    MAILING_LEADER_LEASE_SECONDS, который ведущий продлевает при каждой проверке"""
+
+    def __init__(self, name: str = 'mailing_scheduler'):
+        self.name = name
+        self.key = int.from_bytes(hashlib.sha1(name.encode()).digest()[:8], 'big', signed=True)
+        self.node = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self.is_leader = False
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        """Метод захватывает или подтверждает блокировку без ожидания, возвращает True для ведущего процесса"""
+        with self._lock:
+            was_leader = self.is_leader
+            if connections['default'].vendor == 'postgresql':
+                self.is_leader = self._acquire_advisory_lock()
+            else:
+                self.is_leader = self._acquire_cache_lease()
+            if self.is_leader != was_leader:
+                logger.info("Node %s %s leader '%s'", self.node, 'became' if self.is_leader else 'is no longer',
+                            self.name)
+            return self.is_leader
+
+    def release(self) -> None:
+        """Метод освобождает блокировку, чтобы резервный процесс сразу стал ведущим"""
+        with self._lock:
+            if self._connection is not None:
+                self._release_advisory_lock()
+                self._close_connection()
+            elif self.is_leader and cache.get(self._cache_key) == self.node:
+                cache.delete(self._cache_key)
+            self.is_leader = False
+
+    def _acquire_advisory_lock(self) -> bool:
+        try:
+            if self._connection is None:
+                # соединение создается отдельно от соединений потоков, чтобы блокировка жила вместе с процессом
+                self._connection = connections.create_connection('default')
+                self._connection.inc_thread_sharing()
+            with self._connection.cursor() as cursor:
+                if self.is_leader:  # повторный захват увеличил бы счетчик блокировки, достаточно проверить соединение
+                    cursor.execute("SELECT 1")
+                    return True
+                cursor.execute("SELECT pg_try_advisory_lock(%s)", [self.key])
+                return cursor.fetchone()[0]
+        except (DatabaseError, InterfaceError):  # InterfaceError - соединение уже закрыто
+            logger.exception("Leader lock connection lost")
+            self._close_connection()
+            return False
+
+    def _release_advisory_lock(self) -> None:
+        # сервер снимает блокировку закрытого соединения не сразу, а когда заметит закрытие
+        if not self.is_leader:
+            return
+        try:
+            with self._connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [self.key])
+        except (DatabaseError, InterfaceError):
+            pass
+
+    def _close_connection(self) -> None:
+        try:
+            self._connection.close()
+        except (DatabaseError, InterfaceError):
+            pass
+        self._connection.dec_thread_sharing()
+        self._connection = None
+
+    @property
+    def _cache_key(self) -> str:
+        return f"leader:{self.name}"
+
+    def _acquire_cache_lease(self) -> bool:
+        timeout = settings.MAILING_LEADER_LEASE_SECONDS
+        if cache.add(self._cache_key, self.node, timeout):
+            return True
+        if cache.get(self._cache_key) == self.node:
+            cache.touch(self._cache_key, timeout)
+            return True
+        return False
+
+
+_leader_locks = {}
+_leader_locks_lock = threading.Lock()
+
+
+def get_leader_lock(name: str = 'mailing_scheduler') -> LeaderLock:
+    """Функция возвращает общую для процесса блокировку ведущего процесса"""
+    with _leader_locks_lock:
+        if name not in _leader_locks:
+            _leader_locks[name] = LeaderLock(name)
+    return _leader_locks[name]
+
+
+def get_leader_lock_name() -> str:
+    """Функция возвращает имя блокировки ведущего процесса, у каждой части рассылок своя блокировка"""
+    shard = get_current_shard()
+    return 'mailing_scheduler' if shard is None else f"mailing_scheduler:{shard}"
+
+
+def leader_only(func):
+    """Декоратор запускает задачу только в ведущем процессе своей части рассылок,
+    в резервных процессах задача пропускается"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if settings.MAILING_LEADER_ELECTION and not get_leader_lock(get_leader_lock_name()).acquire():
+            logger.debug("Skipping %s: not a leader", func.__name__)
+            return None
+        return func(*args, **kwargs)
+    return wrapper
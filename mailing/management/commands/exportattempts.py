@@ -0,0 +1,36 @@
+import sys
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from mailing.models import MailingAttempt
+from mailing.services import filter_attempts, iter_attempts_export
+
+
+class Command(BaseCommand):
+    """Кастомная команда для потоковой выгрузки попыток рассылок в CSV или JSONL"""
+    help = "Exports mailing attempts as CSV or JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='export_format', choices=('csv', 'jsonl'), default='csv',
+                            help='Формат выгрузки')
+        parser.add_argument('--owner', type=int, help='id владельца рассылок')
+        parser.add_argument('--mailing', type=int, help='id рассылки')
+        parser.add_argument('--date-from', type=date.fromisoformat, help='Начало периода в формате ГГГГ-ММ-ДД')
+        parser.add_argument('--date-to', type=date.fromisoformat, help='Конец периода в формате ГГГГ-ММ-ДД')
+        parser.add_argument('--output', help='Файл выгрузки, по умолчанию - стандартный вывод')
+
+    def handle(self, *args, **options):
+        attempts = MailingAttempt.objects.all()
+        if options['owner'] is not None:
+            attempts = attempts.filter(mailing__owner_id=options['owner'])
+        attempts = filter_attempts(attempts, date_from=options['date_from'], date_to=options['date_to'],
+                                   mailing_id=options['mailing'])
+
+        output = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else sys.stdout
+        try:
+            for line in iter_attempts_export(attempts, options['export_format']):
+                output.write(line)
+        finally:
+            if output is not sys.stdout:
+                output.close()
@@ -6,7 +6,10 @@ from django.core.management import BaseCommand
 from django.db import connection
 
 from blog.models import BlogPost
+from blog.services import get_blogpost_search_vector, invalidate_blogposts
 from mailing.models import Client, Message, MailingSettings, MailingAttempt
+from mailing.services import rebuild_daily_attempts, refresh_mailing_counters, refresh_next_send_datetime
+from mailing.versions import BLOG_VERSION, MAILING_ATTEMPTS_VERSION, touch_content_version
 from users.models import User
 
 
@@ -168,6 +171,10 @@ class Command(BaseCommand):
 
         BlogPost.objects.bulk_create(blogpost_for_create)
         Command.select_setval_id('blog', 'blogpost')
+        # bulk_create не вызывает сигналы: поисковые векторы, кэш и версия постов обновляются здесь
+        BlogPost.objects.update(search_vector=get_blogpost_search_vector())
+        invalidate_blogposts()
+        touch_content_version(BLOG_VERSION)
 
         Client.objects.all().delete()
         Command.truncate_table_restart_id('mailing', 'client')
@@ -250,10 +257,16 @@ class Command(BaseCommand):
                     id=attempt["pk"],
                     datetime_last_try=attempt["fields"]["datetime_last_try"],
                     attempt_status=attempt["fields"]["attempt_status"],
-                    response_mail_server=attempt["fields"]["response_mail_server"],
+                    mail_server_response_id=attempt["fields"]["mail_server_response"],
                     mailing=MailingSettings.objects.get(pk=attempt["fields"]["mailing"])
                 )
             )
 
         MailingAttempt.objects.bulk_create(mailingattempt_for_create)
         Command.select_setval_id('mailing', 'mailingattempt')
+        rebuild_daily_attempts()
+
+        for mailingsettings in MailingSettings.objects.all():
+            refresh_next_send_datetime(mailingsettings)
+            refresh_mailing_counters(mailingsettings)
+        touch_content_version(MAILING_ATTEMPTS_VERSION)
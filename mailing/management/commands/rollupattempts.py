@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mailing.services import rollup_attempts
+
+
+class Command(BaseCommand):
+    """Кастомная команда для удаления старых попыток рассылки, уже учтенных в дневной статистике рассылок"""
+    help = "Deletes old mailing attempts already counted in daily statistics."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.MAILING_ATTEMPT_RETENTION_DAYS,
+                            help='Удалять попытки рассылки старше указанного количества дней')
+        parser.add_argument('--batch-size', type=int, default=settings.MAILING_ATTEMPT_ROLLUP_BATCH_SIZE,
+                            help='Количество попыток рассылки, удаляемых одним запросом')
+
+    def handle(self, *args, **options):
+        rolled_count = rollup_attempts(options['days'], options['batch_size'])
+        self.stdout.write(f"Mailing attempts deleted: {rolled_count}")
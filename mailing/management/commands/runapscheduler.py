@@ -2,13 +2,20 @@ import logging
 
 from django.conf import settings
 
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.cron import CronTrigger
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django_apscheduler.jobstores import DjangoJobStore
 
 
-from mailing.services import change_mailing_status, send_mailing
+from blog.services import flush_blogpost_views
+from mailing.attempts import flush_attempts, stop_on_sigterm
+from mailing.scheduling import ExactTimeScheduler
+from mailing.leader import get_leader_lock, get_leader_lock_name
+from mailing.services import change_mailing_status, leader_heartbeat, send_mailing
+from mailing.sharding import join_shard_membership, parse_shard, set_current_shard
 
 
 logger = logging.getLogger(__name__)
@@ -18,10 +25,99 @@ class Command(BaseCommand):
     """Кастомная команда для запуска автоматических попыток рассылки"""
     help = "Runs APScheduler."
 
+    def add_arguments(self, parser):
+        parser.add_argument('--exact', action='store_true', default=settings.MAILING_EXACT_SCHEDULING,
+                            help='Запускать рассылки точно в их время вместо опроса БД каждые 59 секунд')
+        parser.add_argument('--shard', default=None,
+                            help='Обрабатывать только рассылки, у которых id % M == N, в формате N/M, '
+                                 'или auto - распределять рассылки между запущенными планировщиками автоматически')
+
     def handle(self, *args, **options):
+        shard_membership = None
+        if options['shard'] == 'auto':
+            shard_membership = join_shard_membership()
+        elif options['shard']:
+            try:
+                set_current_shard(parse_shard(options['shard']))
+            except ValueError as error:
+                raise CommandError(error)
+
         scheduler = BlockingScheduler(timezone=settings.TIME_ZONE)
-        scheduler.add_jobstore(DjangoJobStore(), "default")
+        jobstore = DjangoJobStore()
+        scheduler.add_jobstore(jobstore, "default")
+
+        if options['exact']:
+            self.remove_polling_jobs(jobstore)
+            ExactTimeScheduler(scheduler).start()
+            logger.info("Added exact time mailing jobs.")
+        else:
+            self.add_polling_jobs(scheduler)
+        self.add_leader_heartbeat_job(scheduler, shard_membership is not None)
+        self.add_blog_views_flush_job(scheduler)
+
+        stop_on_sigterm()
+        try:
+            logger.info("Starting scheduler...")
+            scheduler.start()
+        except KeyboardInterrupt:
+            logger.info("Stopping scheduler...")
+            scheduler.shutdown()
+            flush_attempts()  # попытки, накопленные задачами в буфере, не должны потеряться
+            if shard_membership is not None:
+                shard_membership.leave()
+            get_leader_lock(get_leader_lock_name()).release()
+            logger.info("Scheduler shut down successfully!")
+
+    @staticmethod
+    def add_leader_heartbeat_job(scheduler, is_auto_shard):
+        """Метод добавляет задачу продления блокировки ведущего процесса и отметки планировщика
+        в списке планировщиков, задача и запускаемые ей разовые задачи рассылок хранятся в памяти процесса"""
+        if not settings.MAILING_LEADER_ELECTION and not is_auto_shard:
+            return
+        scheduler.add_jobstore(MemoryJobStore(), 'leader')
+        scheduler.add_job(
+            leader_heartbeat,
+            trigger='interval',
+            seconds=settings.MAILING_LEADER_HEARTBEAT_SECONDS,
+            kwargs={'scheduler': scheduler, 'jobstore': 'leader'},
+            id='leader_heartbeat',
+            jobstore='leader',
+            max_instances=1,
+            replace_existing=True,
+        )
+        logger.info("Added job 'leader_heartbeat'.")
+
+    @staticmethod
+    def add_blog_views_flush_job(scheduler):
+        """Метод добавляет задачу записи накопленных в кэше просмотров постов в БД, задача хранится в памяти
+        процесса. При выключенном кэше просмотры записывают сами процессы сайта"""
+        if not settings.CACHE_ENABLED:
+            return
+        scheduler.add_jobstore(MemoryJobStore(), 'blog')
+        scheduler.add_job(
+            flush_blogpost_views,
+            trigger='interval',
+            seconds=settings.BLOG_VIEWS_FLUSH_SECONDS,
+            id='flush_blogpost_views',
+            jobstore='blog',
+            max_instances=1,
+            replace_existing=True,
+        )
+        logger.info("Added job 'flush_blogpost_views'.")
+
+    @staticmethod
+    def remove_polling_jobs(jobstore):
+        """Метод удаляет сохраненные в БД задачи рассылок, которые запускаются каждые 59 секунд"""
+        for job_id in ('change_mailing_status', 'send_mailing'):
+            try:
+                jobstore.remove_job(job_id)
+                logger.info("Removed job '%s'.", job_id)
+            except JobLookupError:
+                pass
 
+    @staticmethod
+    def add_polling_jobs(scheduler):
+        """Метод добавляет задачи рассылок, которые запускаются каждые 59 секунд"""
         scheduler.add_job(
             change_mailing_status,
             trigger=CronTrigger(second="*/59"),  # Every 60 seconds
@@ -41,11 +137,3 @@ class Command(BaseCommand):
         logger.info(
             "Added job: 'send_mailing'."
         )
-
-        try:
-            logger.info("Starting scheduler...")
-            scheduler.start()
-        except KeyboardInterrupt:
-            logger.info("Stopping scheduler...")
-            scheduler.shutdown()
-            logger.info("Scheduler shut down successfully!")
\ No newline at end of file
@@ -0,0 +1,45 @@
+import logging
+from time import sleep
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mailing.attempts import flush_attempts, get_attempt_writer, stop_on_sigterm
+from mailing.connections import get_smtp_pool
+from mailing.services import deliver_outbox
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Кастомная команда для запуска процесса отправки писем из исходящей очереди,
+    процессов можно запустить сколько угодно на любом количестве серверов"""
+    help = "Runs outbox delivery worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.MAILING_SEND_CHUNK_SIZE,
+                            help='Количество писем, захватываемых за один раз')
+        parser.add_argument('--once', action='store_true',
+                            help='Отправить все письма из очереди и завершить работу')
+
+    def handle(self, *args, **options):
+        pool = get_smtp_pool()
+        stop_on_sigterm()
+        logger.info("Starting outbox worker...")
+        try:
+            while True:
+                delivered_count = deliver_outbox(options['batch_size'])
+                if delivered_count:
+                    logger.info("Outbox messages delivered: %s", delivered_count)
+                    continue
+                get_attempt_writer().flush()
+                if options['once']:
+                    break
+                pool.close_idle()
+                sleep(settings.MAILING_WORKER_IDLE_SLEEP)
+        except KeyboardInterrupt:
+            logger.info("Stopping outbox worker...")
+        finally:
+            flush_attempts()
+            pool.close()
+            logger.info("Outbox worker stopped")
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.9 on 2026-10-18 20:06
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Max
+
+PERIOD_DELTAS = {
+    'once a day': timedelta(days=1),
+    'once a week': timedelta(days=7),
+    'once a month': timedelta(days=30),
+}
+
+
+def fill_next_send_datetime(apps, schema_editor):
+    """Функция рассчитывает дату и время следующей отправки для существующих рассылок"""
+    MailingSettings = apps.get_model('mailing', 'MailingSettings')
+    mailings = MailingSettings.objects.annotate(last_try=Max('mailingattempt__datetime_last_try'))
+    for mailing in mailings:
+        if mailing.last_try is None:
+            mailing.next_send_datetime = mailing.start_datetime
+        else:
+            period = PERIOD_DELTAS.get(mailing.periodicity)
+            mailing.next_send_datetime = mailing.last_try + period if period else None
+        mailing.save(update_fields=['next_send_datetime'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0009_alter_mailingsettings_mailing_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailingsettings',
+            name='next_send_datetime',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Дата и время следующей отправки рассылки'),
+        ),
+        migrations.RunPython(fill_next_send_datetime, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='mailingsettings',
+            index=models.Index(fields=['mailing_status', 'is_disabled', 'next_send_datetime'], name='mailing_due_idx'),
+        ),
+    ]
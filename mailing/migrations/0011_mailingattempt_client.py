@@ -0,0 +1,19 @@
+# Generated by Django 4.2.9 on 2026-10-18 20:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0010_mailingsettings_next_send_datetime'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailingattempt',
+            name='client',
+            field=models.ForeignKey(blank=True, help_text='Получатель письма при отправке рассылки каждому клиенту отдельно', null=True, on_delete=django.db.models.deletion.SET_NULL, to='mailing.client', verbose_name='Клиент'),
+        ),
+    ]
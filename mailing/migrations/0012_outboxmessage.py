@@ -0,0 +1,32 @@
+# Generated by Django 4.2.9 on 2026-10-18 20:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0011_mailingattempt_client'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254, verbose_name='Email')),
+                ('status', models.CharField(choices=[('pending', 'ожидает отправки'), ('processing', 'отправляется'), ('sent', 'отправлено'), ('failed', 'не отправлено')], default='pending', verbose_name='Статус отправки')),
+                ('scheduled_datetime', models.DateTimeField(verbose_name='Дата и время постановки рассылки в очередь')),
+                ('locked_datetime', models.DateTimeField(blank=True, null=True, verbose_name='Дата и время захвата письма на отправку')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mailing.client', verbose_name='Клиент')),
+                ('mailing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mailing.mailingsettings', verbose_name='Рассылка')),
+            ],
+            options={
+                'verbose_name': 'Письмо в очереди',
+                'verbose_name_plural': 'Исходящая очередь',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'id'], name='outbox_status_idx')],
+            },
+        ),
+    ]
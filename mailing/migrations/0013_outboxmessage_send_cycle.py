@@ -0,0 +1,33 @@
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_send_cycle(apps, schema_editor):
+    """Функция заполняет плановое время отправки писем, уже стоящих в очереди"""
+    OutboxMessage = apps.get_model('mailing', 'OutboxMessage')
+    OutboxMessage.objects.update(send_cycle=F('scheduled_datetime'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0012_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxmessage',
+            name='send_cycle',
+            field=models.DateTimeField(null=True, verbose_name='Плановое время отправки рассылки'),
+        ),
+        migrations.RunPython(fill_send_cycle, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='outboxmessage',
+            name='send_cycle',
+            field=models.DateTimeField(verbose_name='Плановое время отправки рассылки'),
+        ),
+        migrations.AddConstraint(
+            model_name='outboxmessage',
+            constraint=models.UniqueConstraint(fields=('mailing', 'client', 'send_cycle'), name='outbox_unique_send'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.9 on 2026-10-18 20:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0013_outboxmessage_send_cycle'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mailingsettings',
+            index=models.Index(fields=['mailing_status', 'is_disabled', 'start_datetime'], name='mailing_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mailingsettings',
+            index=models.Index(fields=['mailing_status', 'is_disabled', 'end_datetime'], name='mailing_end_idx'),
+        ),
+    ]
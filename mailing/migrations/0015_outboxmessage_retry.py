@@ -0,0 +1,32 @@
+# Generated by Django 4.2.9 on 2026-10-18 20:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0014_mailingsettings_schedule_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxmessage',
+            name='attempt_count',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Количество неудачных попыток отправки'),
+        ),
+        migrations.AddField(
+            model_name='outboxmessage',
+            name='next_attempt_datetime',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Дата и время повторной отправки'),
+        ),
+        migrations.AlterField(
+            model_name='outboxmessage',
+            name='status',
+            field=models.CharField(choices=[('pending', 'ожидает отправки'), ('processing', 'отправляется'), ('retry', 'ожидает повторной отправки'), ('sent', 'отправлено'), ('failed', 'не отправлено')], default='pending', verbose_name='Статус отправки'),
+        ),
+        migrations.AddIndex(
+            model_name='outboxmessage',
+            index=models.Index(fields=['status', 'next_attempt_datetime'], name='outbox_retry_idx'),
+        ),
+    ]
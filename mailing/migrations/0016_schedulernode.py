@@ -0,0 +1,26 @@
+# Generated by Django 4.2.9 on 2026-10-18 20:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0015_outboxmessage_retry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchedulerNode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=150, unique=True, verbose_name='Планировщик')),
+                ('heartbeat_datetime', models.DateTimeField(verbose_name='Дата и время последней отметки')),
+            ],
+            options={
+                'verbose_name': 'Планировщик рассылок',
+                'verbose_name_plural': 'Планировщики рассылок',
+                'ordering': ['name'],
+            },
+        ),
+    ]
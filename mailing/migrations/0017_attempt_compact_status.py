@@ -0,0 +1,87 @@
+import hashlib
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+ATTEMPT_STATUSES = {
+    'Successfully': 1,
+    'Not successful': 2,
+}
+
+
+def compact_attempts(apps, schema_editor):
+    """Функция переводит статусы попыток рассылки в числа, а ответы почтовых серверов - в справочник ответов"""
+    MailingAttempt = apps.get_model('mailing', 'MailingAttempt')
+    MailServerResponse = apps.get_model('mailing', 'MailServerResponse')
+
+    for status_text, status in ATTEMPT_STATUSES.items():
+        MailingAttempt.objects.filter(attempt_status=status_text).update(attempt_status_code=status)
+
+    texts = MailingAttempt.objects.exclude(response_mail_server__isnull=True).exclude(
+        response_mail_server='').values_list('response_mail_server', flat=True).distinct()
+    for text in texts:
+        response = MailServerResponse.objects.create(
+            text=text,
+            text_hash=hashlib.sha256(text.encode()).hexdigest(),
+        )
+        MailingAttempt.objects.filter(response_mail_server=text).update(mail_server_response=response)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0016_schedulernode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailServerResponse',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField(verbose_name='Ответ почтового сервера')),
+                ('text_hash', models.CharField(max_length=64, unique=True, verbose_name='Хэш ответа')),
+            ],
+            options={
+                'verbose_name': 'Ответ почтового сервера',
+                'verbose_name_plural': 'Ответы почтовых серверов',
+            },
+        ),
+        migrations.AddField(
+            model_name='mailingattempt',
+            name='mail_server_response',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='mailing.mailserverresponse', verbose_name='Ответ почтового сервера'),
+        ),
+        migrations.AddField(
+            model_name='mailingattempt',
+            name='attempt_status_code',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.RunPython(compact_attempts, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='mailingattempt',
+            name='response_mail_server',
+        ),
+        migrations.RemoveField(
+            model_name='mailingattempt',
+            name='attempt_status',
+        ),
+        migrations.RenameField(
+            model_name='mailingattempt',
+            old_name='attempt_status_code',
+            new_name='attempt_status',
+        ),
+        migrations.AlterField(
+            model_name='mailingattempt',
+            name='attempt_status',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'Успешно'), (2, 'Не успешно')], verbose_name='Статус попытки рассылки'),
+        ),
+        migrations.AlterField(
+            model_name='mailingattempt',
+            name='mailing',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='mailing.mailingsettings', verbose_name='Рассылка'),
+        ),
+        migrations.AddIndex(
+            model_name='mailingattempt',
+            index=models.Index(fields=['mailing', 'datetime_last_try'], name='attempt_mailing_try_idx'),
+        ),
+    ]
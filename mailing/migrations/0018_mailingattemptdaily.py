@@ -0,0 +1,43 @@
+# Generated by Django 4.2.9 on 2026-10-18 20:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0017_attempt_compact_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailingAttemptDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('success_count', models.PositiveIntegerField(default=0, verbose_name='Количество успешных попыток')),
+                ('failure_count', models.PositiveIntegerField(default=0, verbose_name='Количество неуспешных попыток')),
+                ('first_try_datetime', models.DateTimeField(verbose_name='Дата и время первой попытки')),
+                ('last_try_datetime', models.DateTimeField(verbose_name='Дата и время последней попытки')),
+            ],
+            options={
+                'verbose_name': 'Дневная статистика попыток рассылки',
+                'verbose_name_plural': 'Дневная статистика попыток рассылок',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='mailingattempt',
+            index=models.Index(fields=['datetime_last_try', 'id'], name='attempt_try_idx'),
+        ),
+        migrations.AddField(
+            model_name='mailingattemptdaily',
+            name='mailing',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='mailing.mailingsettings', verbose_name='Рассылка'),
+        ),
+        migrations.AddConstraint(
+            model_name='mailingattemptdaily',
+            constraint=models.UniqueConstraint(fields=('mailing', 'date'), name='attempt_daily_unique'),
+        ),
+    ]
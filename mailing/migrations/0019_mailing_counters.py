@@ -0,0 +1,86 @@
+from django.db import migrations, models
+from django.db.models import Count, Max, Q, Sum
+
+SUCCESSFULLY = 1
+NOT_SUCCESSFUL = 2
+
+
+def latest(*datetimes):
+    datetimes = [value for value in datetimes if value is not None]
+    return max(datetimes) if datetimes else None
+
+
+def fill_mailing_counters(apps, schema_editor):
+    """Функция заполняет счетчики попыток существующих рассылок по попыткам рассылки и дневной статистике"""
+    MailingSettings = apps.get_model('mailing', 'MailingSettings')
+    MailingAttempt = apps.get_model('mailing', 'MailingAttempt')
+    MailingAttemptDaily = apps.get_model('mailing', 'MailingAttemptDaily')
+
+    attempts = {
+        counters['mailing_id']: counters
+        for counters in MailingAttempt.objects.exclude(mailing=None).values('mailing_id').annotate(
+            success_count=Count('id', filter=Q(attempt_status=SUCCESSFULLY)),
+            failure_count=Count('id', filter=Q(attempt_status=NOT_SUCCESSFUL)),
+            last_success_datetime=Max('datetime_last_try', filter=Q(attempt_status=SUCCESSFULLY)),
+            last_failure_datetime=Max('datetime_last_try', filter=Q(attempt_status=NOT_SUCCESSFUL)),
+        ).order_by()
+    }
+    rollups = {
+        counters['mailing_id']: counters
+        for counters in MailingAttemptDaily.objects.exclude(mailing=None).values('mailing_id').annotate(
+            success_total=Sum('success_count'),
+            failure_total=Sum('failure_count'),
+            last_success_datetime=Max('last_try_datetime', filter=Q(success_count__gt=0)),
+            last_failure_datetime=Max('last_try_datetime', filter=Q(failure_count__gt=0)),
+        ).order_by()
+    }
+    empty = {'success_count': 0, 'failure_count': 0, 'success_total': 0, 'failure_total': 0,
+             'last_success_datetime': None, 'last_failure_datetime': None}
+    for mailing in MailingSettings.objects.filter(pk__in=attempts.keys() | rollups.keys()):
+        attempt_counters = attempts.get(mailing.pk, empty)
+        rollup_counters = rollups.get(mailing.pk, empty)
+        mailing.success_count = attempt_counters['success_count'] + rollup_counters['success_total']
+        mailing.failure_count = attempt_counters['failure_count'] + rollup_counters['failure_total']
+        mailing.send_count = mailing.success_count + mailing.failure_count
+        mailing.last_success_datetime = latest(
+            attempt_counters['last_success_datetime'], rollup_counters['last_success_datetime'])
+        mailing.last_failure_datetime = latest(
+            attempt_counters['last_failure_datetime'], rollup_counters['last_failure_datetime'])
+        mailing.save(update_fields=['send_count', 'success_count', 'failure_count', 'last_success_datetime',
+                                    'last_failure_datetime'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0018_mailingattemptdaily'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailingsettings',
+            name='failure_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество неуспешных попыток'),
+        ),
+        migrations.AddField(
+            model_name='mailingsettings',
+            name='last_failure_datetime',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Дата и время последней неуспешной попытки'),
+        ),
+        migrations.AddField(
+            model_name='mailingsettings',
+            name='last_success_datetime',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Дата и время последней успешной попытки'),
+        ),
+        migrations.AddField(
+            model_name='mailingsettings',
+            name='send_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество попыток рассылки'),
+        ),
+        migrations.AddField(
+            model_name='mailingsettings',
+            name='success_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество успешных попыток'),
+        ),
+        migrations.RunPython(fill_mailing_counters, migrations.RunPython.noop),
+    ]
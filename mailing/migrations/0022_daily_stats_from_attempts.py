@@ -0,0 +1,47 @@
+from django.db import migrations
+from django.db.models import Count, Max, Min, Q
+from django.db.models.functions import TruncDate
+
+SUCCESSFULLY = 1
+NOT_SUCCESSFUL = 2
+
+
+def fill_daily_stats(apps, schema_editor):
+    """Функция добавляет в дневную статистику рассылок еще не свернутые попытки рассылки:
+    теперь дневная статистика ведется при записи попыток, а старые попытки только удаляются"""
+    MailingAttempt = apps.get_model('mailing', 'MailingAttempt')
+    MailingAttemptDaily = apps.get_model('mailing', 'MailingAttemptDaily')
+
+    days = (
+        MailingAttempt.objects.exclude(mailing=None)
+        .annotate(date=TruncDate('datetime_last_try'))
+        .values('mailing_id', 'date')
+        .annotate(
+            success_count=Count('id', filter=Q(attempt_status=SUCCESSFULLY)),
+            failure_count=Count('id', filter=Q(attempt_status=NOT_SUCCESSFUL)),
+            first_try_datetime=Min('datetime_last_try'),
+            last_try_datetime=Max('datetime_last_try'),
+        )
+        .order_by()
+    )
+    for day in days:
+        rollup = MailingAttemptDaily.objects.filter(mailing_id=day['mailing_id'], date=day['date']).first()
+        if rollup is None:
+            MailingAttemptDaily.objects.create(**day)
+            continue
+        rollup.success_count += day['success_count']
+        rollup.failure_count += day['failure_count']
+        rollup.first_try_datetime = min(rollup.first_try_datetime, day['first_try_datetime'])
+        rollup.last_try_datetime = max(rollup.last_try_datetime, day['last_try_datetime'])
+        rollup.save(update_fields=['success_count', 'failure_count', 'first_try_datetime', 'last_try_datetime'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0021_contentversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_daily_stats, migrations.RunPython.noop),
+    ]
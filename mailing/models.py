@@ -1,4 +1,9 @@
+import hashlib
+from datetime import timedelta
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Upper
 
 from users.models import User
 
@@ -25,6 +30,11 @@ class Client(models.Model):
     class Meta:
         verbose_name = 'Клиент'
         verbose_name_plural = 'Клиенты'
+        indexes = [
+            # поиск клиентов по части email и Ф.И.О. (icontains сравнивает значения в верхнем регистре)
+            GinIndex(OpClass(Upper('email'), name='gin_trgm_ops'), name='client_email_trgm_idx'),
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='client_name_trgm_idx'),
+        ]
 
 
 class Message(models.Model):
@@ -61,6 +71,11 @@ class MailingSettings(models.Model):
         ('launched', 'запущена'),
         ('completed', 'завершена'),
     )
+    PERIOD_DELTAS = {
+        'once a day': timedelta(days=1),
+        'once a week': timedelta(days=7),
+        'once a month': timedelta(days=30),
+    }
 
     start_datetime = models.DateTimeField(
         verbose_name='Дата и время первой отправки рассылки',
@@ -104,10 +119,43 @@ class MailingSettings(models.Model):
         on_delete=models.SET_NULL
     )
     is_disabled = models.BooleanField(verbose_name='Отключена менеджером', **NULLABLE, default=False)
+    next_send_datetime = models.DateTimeField(
+        verbose_name='Дата и время следующей отправки рассылки',
+        **NULLABLE,
+        editable=False,
+    )
+    # счетчики попыток рассылки увеличиваются при записи попыток, чтобы не считать их по таблице попыток
+    send_count = models.PositiveIntegerField(verbose_name='Количество попыток рассылки', default=0, editable=False)
+    success_count = models.PositiveIntegerField(verbose_name='Количество успешных попыток', default=0, editable=False)
+    failure_count = models.PositiveIntegerField(verbose_name='Количество неуспешных попыток', default=0, editable=False)
+    last_success_datetime = models.DateTimeField(
+        verbose_name='Дата и время последней успешной попытки',
+        **NULLABLE,
+        editable=False,
+    )
+    last_failure_datetime = models.DateTimeField(
+        verbose_name='Дата и время последней неуспешной попытки',
+        **NULLABLE,
+        editable=False,
+    )
 
     def __str__(self):
         return f"Рассылка {self.pk}: с {self.start_datetime} с периодичностью {self.periodicity}"
 
+    def save(self, *args, **kwargs):
+        """Метод для новой рассылки назначает первую отправку на дату и время начала рассылки"""
+        if self._state.adding and self.next_send_datetime is None:
+            self.next_send_datetime = self.start_datetime
+        super().save(*args, **kwargs)
+
+    def get_next_send_datetime(self, last_try=None):
+        """Метод рассчитывает дату и время следующей отправки рассылки по дате и времени последней попытки,
+        None - рассылка больше не отправляется"""
+        if last_try is None:  # попыток рассылки еще не было
+            return self.start_datetime
+        period = self.PERIOD_DELTAS.get(self.periodicity)
+        return last_try + period if period else None
+
     class Meta:
         verbose_name = 'Настройки рассылки'
         verbose_name_plural = 'Настройки рассылок'
@@ -115,30 +163,54 @@ class MailingSettings(models.Model):
         permissions = [
             ("сan_disable_mailings", "Сan disable mailings"),
         ]
+        indexes = [
+            models.Index(fields=['mailing_status', 'is_disabled', 'next_send_datetime'], name='mailing_due_idx'),
+            models.Index(fields=['mailing_status', 'is_disabled', 'start_datetime'], name='mailing_start_idx'),
+            models.Index(fields=['mailing_status', 'is_disabled', 'end_datetime'], name='mailing_end_idx'),
+        ]
+
+
+class MailServerResponse(models.Model):
+    """Класс для модели ответа почтового сервера: одинаковые ответы хранятся один раз,
+    попытки рассылки ссылаются на них"""
+    text = models.TextField(verbose_name='Ответ почтового сервера')
+    text_hash = models.CharField(max_length=64, verbose_name='Хэш ответа', unique=True)
+
+    def __str__(self):
+        return self.text
+
+    @staticmethod
+    def get_hash(text: str) -> str:
+        """Метод возвращает хэш ответа, по которому ответы ищутся без индекса на полный текст"""
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    class Meta:
+        verbose_name = 'Ответ почтового сервера'
+        verbose_name_plural = 'Ответы почтовых серверов'
 
 
 class MailingAttempt(models.Model):
     """Класс для модели попытка рассылки"""
+    SUCCESSFULLY = 1
+    NOT_SUCCESSFUL = 2
     ATTEMPTS = (
-        ('Successfully', 'Успешно'),
-        ('Not successful', 'Не успешно'),
+        (SUCCESSFULLY, 'Успешно'),
+        (NOT_SUCCESSFUL, 'Не успешно'),
     )
 
     datetime_last_try = models.DateTimeField(
         verbose_name='Дата и время последней попытки рассылки',
         # auto_now=True,
     )
-    attempt_status = models.CharField(
+    attempt_status = models.PositiveSmallIntegerField(
         verbose_name='Статус попытки рассылки',
         choices=ATTEMPTS,
-        default=None,
     )
-    response_mail_server = models.CharField(
-        max_length=50,
+    mail_server_response = models.ForeignKey(
+        MailServerResponse,
+        on_delete=models.PROTECT,
         verbose_name='Ответ почтового сервера',
-        default=None,
-        blank=True,
-        null=True,
+        **NULLABLE,
     )
     mailing = models.ForeignKey(
         MailingSettings,
@@ -146,12 +218,136 @@ class MailingAttempt(models.Model):
         verbose_name='Рассылка',
         blank=True,
         null=True,
+        db_index=False,  # попытки рассылки ищутся по индексу attempt_mailing_try_idx
+    )
+    client = models.ForeignKey(
+        Client,
+        on_delete=models.SET_NULL,
+        verbose_name='Клиент',
+        help_text='Получатель письма при отправке рассылки каждому клиенту отдельно',
+        **NULLABLE,
     )
 
     def __str__(self):
-        return f"Попытка рассылки {self.pk}: {self.attempt_status} на {self.datetime_last_try}"
+        return f"Попытка рассылки {self.pk}: {self.get_attempt_status_display()} на {self.datetime_last_try}"
 
     class Meta:
         verbose_name = 'Попытка рассылки'
         verbose_name_plural = 'Попытки рассылок'
         ordering = ['-id']
+        indexes = [
+            # последняя попытка рассылки для планировщика и попытки рассылки по времени для отчетов
+            models.Index(fields=['mailing', 'datetime_last_try'], name='attempt_mailing_try_idx'),
+            # старые попытки рассылки для сворачивания в дневную статистику
+            # и страницы списка попыток рассылок по курсору
+            models.Index(fields=['datetime_last_try', 'id'], name='attempt_try_idx'),
+        ]
+
+
+class MailingAttemptDaily(models.Model):
+    """Класс для модели дневной статистики попыток рассылки: в нее сворачиваются старые попытки рассылки"""
+    mailing = models.ForeignKey(
+        MailingSettings,
+        on_delete=models.CASCADE,
+        verbose_name='Рассылка',
+        **NULLABLE,
+    )
+    date = models.DateField(verbose_name='Дата')
+    success_count = models.PositiveIntegerField(verbose_name='Количество успешных попыток', default=0)
+    failure_count = models.PositiveIntegerField(verbose_name='Количество неуспешных попыток', default=0)
+    first_try_datetime = models.DateTimeField(verbose_name='Дата и время первой попытки')
+    last_try_datetime = models.DateTimeField(verbose_name='Дата и время последней попытки')
+
+    def __str__(self):
+        return f"Рассылка {self.mailing_id} за {self.date}: {self.success_count} / {self.failure_count}"
+
+    class Meta:
+        verbose_name = 'Дневная статистика попыток рассылки'
+        verbose_name_plural = 'Дневная статистика попыток рассылок'
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['mailing', 'date'], name='attempt_daily_unique'),
+        ]
+
+
+class OutboxMessage(models.Model):
+    """Класс для модели письма в исходящей очереди - задания на отправку рассылки одному клиенту"""
+    STATUSES = (
+        ('pending', 'ожидает отправки'),
+        ('processing', 'отправляется'),
+        ('retry', 'ожидает повторной отправки'),
+        ('sent', 'отправлено'),
+        ('failed', 'не отправлено'),
+    )
+
+    mailing = models.ForeignKey(
+        MailingSettings,
+        on_delete=models.CASCADE,
+        verbose_name='Рассылка',
+    )
+    client = models.ForeignKey(
+        Client,
+        on_delete=models.CASCADE,
+        verbose_name='Клиент',
+    )
+    email = models.EmailField(verbose_name='Email')
+    status = models.CharField(
+        verbose_name='Статус отправки',
+        choices=STATUSES,
+        default='pending',
+    )
+    scheduled_datetime = models.DateTimeField(verbose_name='Дата и время постановки рассылки в очередь')
+    send_cycle = models.DateTimeField(verbose_name='Плановое время отправки рассылки')
+    locked_datetime = models.DateTimeField(verbose_name='Дата и время захвата письма на отправку', **NULLABLE)
+    attempt_count = models.PositiveSmallIntegerField(verbose_name='Количество неудачных попыток отправки', default=0)
+    next_attempt_datetime = models.DateTimeField(verbose_name='Дата и время повторной отправки', **NULLABLE)
+
+    def __str__(self):
+        return f"Письмо {self.pk} рассылки {self.mailing_id} на {self.email}: {self.status}"
+
+    @property
+    def idempotency_key(self) -> str:
+        """Свойство возвращает ключ письма, единый для клиента в одном цикле рассылки"""
+        return f"{self.mailing_id}.{self.client_id}.{int(self.send_cycle.timestamp())}"
+
+    class Meta:
+        verbose_name = 'Письмо в очереди'
+        verbose_name_plural = 'Исходящая очередь'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='outbox_status_idx'),
+            models.Index(fields=['status', 'next_attempt_datetime'], name='outbox_retry_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['mailing', 'client', 'send_cycle'], name='outbox_unique_send'),
+        ]
+
+
+class SchedulerNode(models.Model):
+    """Класс для модели запущенного планировщика рассылок: по списку живых планировщиков
+    рассылки автоматически распределяются между ними"""
+    name = models.CharField(max_length=150, verbose_name='Планировщик', unique=True)
+    heartbeat_datetime = models.DateTimeField(verbose_name='Дата и время последней отметки')
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = 'Планировщик рассылок'
+        verbose_name_plural = 'Планировщики рассылок'
+        ordering = ['name']
+
+
+class ContentVersion(models.Model):
+    """Класс для модели версии данных страниц: версия увеличивается при каждом изменении данных,
+    по ней страницы отвечают 304 Not Modified, не выбирая и не отображая сами данные"""
+    name = models.CharField(max_length=50, verbose_name='Данные', unique=True)
+    version = models.PositiveBigIntegerField(default=0, verbose_name='Версия')
+    updated_at = models.DateTimeField(verbose_name='Дата и время изменения')
+
+    def __str__(self):
+        return f"{self.name}: {self.version}"
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
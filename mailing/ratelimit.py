@@ -0,0 +1,98 @@
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Класс ограничителя скорости отправки писем для каждого отправителя и каждого домена получателей.
+    Лимит на секунду и на минуту - это запас токенов, который пополняется в начале каждого окна,
+    счетчики хранятся в кэше Django: в Redis они общие для всех процессов,
+    при выключенном кэше (CACHE_ENABLED) - в памяти процесса"""
+
+    PERIODS = {'second': 1, 'minute': 60}
+
+    def __init__(self, limits: dict = None, prefix: str = 'ratelimit', parent: 'RateLimiter' = None):
+        self.limits = limits if limits is not None else settings.MAILING_RATE_LIMITS
+        self.prefix = prefix
+        self.parent = parent  # общий ограничитель, в лимиты которого письма тоже должны уложиться
+
+    @property
+    def is_enabled(self) -> bool:
+        """Свойство показывает, задан ли хотя бы один лимит"""
+        if self.parent is not None and self.parent.is_enabled:
+            return True
+        return any(any(scope_limits.values()) for scope_limits in self.limits.values())
+
+    def acquire(self, sender: str, recipients: list, on_wait=None) -> None:
+        """Метод ожидает, пока отправитель и домены получателей не уложатся в лимиты, и списывает токены:
+        одно письмо для отправителя и по одному получателю для каждого домена.
+        on_wait вызывается перед каждым ожиданием пополнения окна. Письма без отправителя (не задан EMAIL_HOST_USER)
+        укладываются в общий лимит отправителя"""
+        if not self.is_enabled:
+            return
+        domains = Counter(recipient.rsplit('@', 1)[-1].lower() for recipient in recipients)
+        self._acquire('sender', (sender or '').lower(), 1, on_wait)
+        for domain, count in domains.items():
+            self._acquire('domain', domain, count, on_wait)
+        if self.parent is not None:
+            self.parent.acquire(sender, recipients, on_wait)
+
+    def _acquire(self, scope: str, name: str, count: int, on_wait=None) -> None:
+        """Метод списывает токены из всех окон области, дожидаясь пополнения окна при нехватке токенов"""
+        for period_name, limit in self.limits.get(scope, {}).items():
+            if not limit:
+                continue
+            period = self.PERIODS[period_name]
+            while not self._take(f"{self.prefix}:{scope}:{name}:{period_name}", period, limit, count):
+                delay = period - time.time() % period
+                logger.debug("Rate limit %s/%s for %s %s, waiting %.2fs", limit, period_name, scope, name, delay)
+                if on_wait is not None:
+                    on_wait()
+                time.sleep(delay)
+
+    @staticmethod
+    def _take(key: str, period: int, limit: int, count: int) -> bool:
+        """Метод списывает токены из текущего окна, возвращает False, если токенов в окне не хватило;
+        письмо с количеством получателей больше лимита отправляется в пустом окне.
+        Если токенов не хватило, списанные токены возвращаются в окно"""
+        window_key = f"{key}:{int(time.time() // period)}"
+        cache.add(window_key, 0, timeout=period + 1)
+        try:
+            used = cache.incr(window_key, count)
+        except ValueError:  # окно истекло между add и incr
+            cache.add(window_key, count, timeout=period + 1)
+            used = count
+        if used <= limit or used == count:
+            return True
+        try:
+            cache.decr(window_key, count)
+        except ValueError:  # окно уже истекло, возвращать токены некуда
+            pass
+        return False
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(lane: str = 'default') -> RateLimiter:
+    """Функция возвращает общий для процесса ограничитель скорости отправки писем:
+    default - для новых писем, retry - для повторных отправок со своим запасом токенов отправителя,
+    повторные отправки при этом укладываются в общие с новыми письмами лимиты доменов получателей"""
+    with _rate_limiters_lock:
+        if lane not in _rate_limiters:
+            if lane == 'retry':
+                _rate_limiters[lane] = RateLimiter(
+                    settings.MAILING_RETRY_RATE_LIMITS,
+                    prefix='ratelimit:retry',
+                    parent=RateLimiter({'domain': settings.MAILING_RATE_LIMITS['domain']}),
+                )
+            else:
+                _rate_limiters[lane] = RateLimiter()
+    return _rate_limiters[lane]
@@ -0,0 +1,115 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytz
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.triggers.date import DateTrigger
+from django.conf import settings
+
+from mailing.models import ContentVersion
+from mailing.services import get_next_wakeup_datetime, run_mailing_jobs
+from mailing.sharding import get_current_shard
+from mailing.versions import MAILING_SCHEDULE_VERSION, touch_content_version
+
+logger = logging.getLogger(__name__)
+
+
+def touch_mailing_schedule() -> None:
+    """Функция отмечает в БД, что расписание рассылок изменилось"""
+    touch_content_version(MAILING_SCHEDULE_VERSION)
+
+
+def get_mailing_schedule_version():
+    """Функция возвращает версию расписания рассылок (None - расписание еще не менялось)"""
+    return ContentVersion.objects.filter(name=MAILING_SCHEDULE_VERSION).values_list('version', flat=True).first()
+
+
+class ExactTimeScheduler:
+    """Класс планировщика рассылок по точному времени: задача запускается ровно в ближайшее время изменения
+    статуса или отправки рассылки и после выполнения переносится на следующее такое время.
+    Изменения рассылок отмечаются сигналами в версии расписания в БД, общей для всех процессов,
+    планировщик проверяет версию каждые MAILING_SCHEDULE_WATCH_SECONDS секунд одним запросом по уникальному
+    ключу и пересчитывает расписание не реже, чем раз в MAILING_SCHEDULE_MAX_SLEEP секунд"""
+
+    JOBSTORE = 'exact_time'
+
+    def __init__(self, scheduler, job=run_mailing_jobs):
+        self.scheduler = scheduler
+        self.job = job
+        self.job_id = None
+        self.version = None
+        self.shard = None
+        self.rescheduled_at = None
+        self._run_lock = threading.Lock()
+        self._schedule_lock = threading.Lock()
+
+    def start(self) -> None:
+        """Метод добавляет в планировщик задачи рассылок и проверки изменений расписания"""
+        self.scheduler.add_jobstore(MemoryJobStore(), self.JOBSTORE)
+        self.scheduler.add_job(
+            self.watch,
+            trigger='interval',
+            seconds=settings.MAILING_SCHEDULE_WATCH_SECONDS,
+            id='watch_mailing_schedule',
+            jobstore=self.JOBSTORE,
+            max_instances=1,
+            replace_existing=True,
+        )
+        self.reschedule()
+
+    def run(self) -> None:
+        """Метод выполняет задачу рассылок и планирует следующий запуск,
+        пока задача выполняется, повторный запуск пропускается"""
+        if not self._run_lock.acquire(blocking=False):
+            return
+        try:
+            self.job()
+        finally:
+            self._run_lock.release()
+            self.reschedule()
+
+    def watch(self) -> None:
+        """Метод пересчитывает расписание, если рассылки или часть рассылок планировщика изменились
+        или расписание давно не пересчитывалось"""
+        is_expired = time.monotonic() - self.rescheduled_at > settings.MAILING_SCHEDULE_MAX_SLEEP
+        is_changed = get_mailing_schedule_version() != self.version or get_current_shard() != self.shard
+        if is_expired or is_changed:
+            self.reschedule()
+
+    def reschedule(self) -> None:
+        """Метод переносит задачу рассылок на ближайшее время изменения статуса или отправки рассылки"""
+        with self._schedule_lock:
+            self._reschedule()
+
+    def _reschedule(self) -> None:
+        self.version = get_mailing_schedule_version()
+        self.shard = get_current_shard()
+        self.rescheduled_at = time.monotonic()
+
+        wakeup = get_next_wakeup_datetime()
+        if self.job_id is not None:
+            try:
+                self.scheduler.remove_job(self.job_id, jobstore=self.JOBSTORE)
+            except JobLookupError:  # задача уже выполнена
+                pass
+            self.job_id = None
+        if wakeup is None:
+            logger.info("No mailings to schedule")
+            return
+
+        zone = pytz.timezone(settings.TIME_ZONE)
+        run_date = max(wakeup, datetime.now(zone) + timedelta(seconds=1))
+        # у каждого запуска свой id: выполненную разовую задачу планировщик удаляет сам
+        self.job_id = f"run_mailing_jobs_{uuid4().hex}"
+        self.scheduler.add_job(
+            self.run,
+            trigger=DateTrigger(run_date=run_date),
+            id=self.job_id,
+            jobstore=self.JOBSTORE,
+            misfire_grace_time=None,
+        )
+        logger.info("Next mailing run at %s", run_date)
@@ -1,111 +1,640 @@
+import csv
+import json
+import logging
+import random
 import smtplib
-from datetime import datetime, timedelta
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
 
 import pytz
 from apscheduler.schedulers.background import BackgroundScheduler
 from django.conf import settings
-from django.core.cache import cache
-from django.core.mail import send_mail
+from django.contrib.postgres.search import TrigramSimilarity
+from django.core.mail import EmailMessage
+from django.db import connection as db_connection, transaction
+from django.db.models import Count, Exists, Max, Min, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Greatest, TruncDate
 
-from mailing.models import MailingSettings, MailingAttempt, Client
+from mailing.attempts import flush_attempts, get_attempt_writer
+from mailing.cache import TwoTierCache
+from mailing.connections import SMTPConnectionPool, get_smtp_pool, is_transient_error
+from mailing.emails import prepare_mime_message, build_recipient_messages
+from mailing.leader import get_leader_lock, get_leader_lock_name, leader_only
+from mailing.models import (MailingSettings, MailingAttempt, MailingAttemptDaily, MailServerResponse, Client,
+                            OutboxMessage)
+from mailing.ratelimit import RateLimiter, get_rate_limiter
+from mailing.sharding import filter_shard, get_shard_membership
+from mailing.versions import (MAILING_ATTEMPTS_VERSION, defer_content_versions, get_content_last_modified, make_etag,
+                              touch_content_version)
 
+logger = logging.getLogger(__name__)
 
-def change_mailing_status():
-    """Функция изменения статуса рассылок"""
+
+@leader_only
+@defer_content_versions()
+def change_mailing_status() -> tuple[int, int]:
+    """Функция изменения статуса рассылок, возвращает количество запущенных и завершенных рассылок"""
     zone = pytz.timezone(settings.TIME_ZONE)
     current_datetime = datetime.now(zone)
 
-    mailings = MailingSettings.objects.exclude(mailing_status='completed').exclude(is_disabled=True)
-    for mailing in mailings:
-        if mailing.end_datetime < current_datetime:
-            mailing.mailing_status = 'completed'
-            mailing.save(update_fields=['mailing_status'])
-        if mailing.mailing_status == 'created' and mailing.start_datetime <= current_datetime:
-            mailing.mailing_status = 'launched'
-            mailing.save(update_fields=['mailing_status'])
+    mailings = filter_shard(MailingSettings.objects.exclude(mailing_status='completed').exclude(is_disabled=True))
+    completed_count = mailings.filter(end_datetime__lt=current_datetime).update(mailing_status='completed')
+    launched_count = mailings.filter(
+        mailing_status='created',
+        start_datetime__lte=current_datetime,
+        end_datetime__gte=current_datetime,
+    ).update(mailing_status='launched')
 
+    if launched_count or completed_count:  # update() не отправляет сигналы, поэтому статистика сбрасывается здесь
+        invalidate_statistic_mailing()
+    logger.info("Mailings launched: %s, completed: %s", launched_count, completed_count)
+    return launched_count, completed_count
 
-def is_next_send_time(mailing: MailingSettings, attempt: MailingAttempt, current: datetime) -> bool:
-    """Функция проверки на следующее время рассылки"""
-    time_difference = current - attempt.datetime_last_try if attempt else 0
 
-    if attempt:
-        if mailing.periodicity == 'once a day' and time_difference >= timedelta(days=1):
-            return True
-        elif mailing.periodicity == 'once a week' and time_difference >= timedelta(days=7):
-            return True
-        elif mailing.periodicity == 'once a month' and time_difference >= timedelta(days=30):
-            return True
-    else:  # рассылка запущена, но попыток рассылки еще не было
-        return True
+def refresh_next_send_datetime(mailing: MailingSettings) -> None:
+    """Функция пересчитывает дату и время следующей отправки рассылки по последнему запланированному циклу
+    рассылки в исходящей очереди: попытки цикла могут быть еще не записаны, и отправка по ним вернула бы время
+    уже запланированного цикла. Если в очереди циклов нет, время считается по последней попытке рассылки,
+    в том числе свернутой в дневную статистику. Следующая отправка не раньше начала рассылки"""
+    last_try = OutboxMessage.objects.filter(mailing=mailing).aggregate(last_try=Max('send_cycle'))['last_try']
+    if last_try is None:
+        last_try = MailingAttempt.objects.filter(mailing=mailing).aggregate(
+            last_try=Max('datetime_last_try'))['last_try']
+    if last_try is None:
+        last_try = MailingAttemptDaily.objects.filter(mailing=mailing).aggregate(
+            last_try=Max('last_try_datetime'))['last_try']
+    next_send_datetime = mailing.get_next_send_datetime(last_try)
+    if next_send_datetime is not None and next_send_datetime < mailing.start_datetime:
+        next_send_datetime = mailing.start_datetime
+    mailing.next_send_datetime = next_send_datetime
+    mailing.save(update_fields=['next_send_datetime'])
 
-    return False
 
+def refresh_mailing_counters(mailing: MailingSettings) -> None:
+    """Функция пересчитывает счетчики попыток рассылки по дневной статистике"""
+    days = MailingAttemptDaily.objects.filter(mailing=mailing).aggregate(
+        success_count=Sum('success_count', default=0),
+        failure_count=Sum('failure_count', default=0),
+        last_success_datetime=Max('last_try_datetime', filter=Q(success_count__gt=0)),
+        last_failure_datetime=Max('last_try_datetime', filter=Q(failure_count__gt=0)),
+    )
+    mailing.success_count = days['success_count']
+    mailing.failure_count = days['failure_count']
+    mailing.send_count = mailing.success_count + mailing.failure_count
+    mailing.last_success_datetime = days['last_success_datetime']
+    mailing.last_failure_datetime = days['last_failure_datetime']
+    mailing.save(update_fields=['send_count', 'success_count', 'failure_count', 'last_success_datetime',
+                                'last_failure_datetime'])
 
-def send_mailing():
-    """Функция отправки рассылок"""
+
+def rebuild_daily_attempts() -> None:
+    """Функция заново считает дневную статистику всех рассылок по попыткам рассылки, записанным в обход
+    буфера попыток (команда fill). Статистика свернутых и удаленных попыток при этом теряется"""
+    MailingAttemptDaily.objects.all().delete()
+    MailingAttemptDaily.objects.bulk_create(
+        MailingAttemptDaily(**day)
+        for day in MailingAttempt.objects.exclude(mailing=None)
+        .annotate(date=TruncDate('datetime_last_try'))
+        .values('mailing_id', 'date')
+        .annotate(
+            success_count=Count('id', filter=Q(attempt_status=MailingAttempt.SUCCESSFULLY)),
+            failure_count=Count('id', filter=Q(attempt_status=MailingAttempt.NOT_SUCCESSFUL)),
+            first_try_datetime=Min('datetime_last_try'),
+            last_try_datetime=Max('datetime_last_try'),
+        )
+        .order_by()
+    )
+
+
+def get_mail_server_response_text(error: Exception) -> str:
+    """Функция возвращает текст ответа почтового сервера на ошибку отправки: код и сообщение сервера
+    без адресов получателей, поэтому одинаковые отказы разным получателям хранятся в справочнике один раз"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        responses = set()
+        for recipient, (code, message) in error.recipients.items():
+            if isinstance(message, bytes):
+                message = message.decode(errors='replace')
+            responses.add(f"{code} {message.replace(recipient, 'recipient')}")
+        return '; '.join(sorted(responses))
+    if isinstance(error, smtplib.SMTPResponseException):
+        message = error.smtp_error
+        if isinstance(message, bytes):
+            message = message.decode(errors='replace')
+        return f"{error.smtp_code} {message}"
+    return str(error)
+
+
+def get_mail_server_response_ids(errors: list) -> dict:
+    """Функция возвращает id ответов почтового сервера из справочника по тексту ошибок отправки,
+    отсутствующие в справочнике ответы добавляет в него"""
+    texts = {}
+    for error in errors:
+        if error is not None:
+            text = get_mail_server_response_text(error)
+            texts[MailServerResponse.get_hash(text)] = text
+    if not texts:
+        return {}
+    response_ids = dict(MailServerResponse.objects.filter(text_hash__in=texts).values_list('text_hash', 'id'))
+    missing_hashes = texts.keys() - response_ids.keys()
+    if missing_hashes:
+        # ответ мог добавить другой процесс, поэтому конфликты пропускаются и id выбираются заново
+        MailServerResponse.objects.bulk_create(
+            [MailServerResponse(text=texts[text_hash], text_hash=text_hash) for text_hash in missing_hashes],
+            ignore_conflicts=True,
+        )
+        response_ids.update(
+            MailServerResponse.objects.filter(text_hash__in=missing_hashes).values_list('text_hash', 'id'))
+    return {texts[text_hash]: response_id for text_hash, response_id in response_ids.items()}
+
+
+@defer_content_versions()
+def plan_mailings() -> int:
+    """Функция планирования рассылок: ставит в исходящую очередь письма всем клиентам наступивших рассылок
+    и переносит время следующей отправки, возвращает количество поставленных в очередь писем"""
     zone = pytz.timezone(settings.TIME_ZONE)
     current_datetime = datetime.now(zone)
 
-    # выбираем все запущенные рассылки
-    mailings = MailingSettings.objects.filter(mailing_status='launched')
+    # выбираем запущенные рассылки, время отправки которых наступило
+    mailings = filter_shard(MailingSettings.objects.filter(
+        mailing_status='launched',
+        is_disabled=False,
+        next_send_datetime__lte=current_datetime,
+    ))
 
+    planned_count = 0
     for mailing in mailings:
-        attempts = MailingAttempt.objects.filter(mailing=mailing)  # получаем все попытки рассылки для текущей рассылки
-        end_attempt = attempts.order_by('-datetime_last_try')[0] if attempts else None  # получаем последнюю попытку
+        with transaction.atomic():
+            # время отправки переносится только если его не перенес другой процесс
+            is_planned = MailingSettings.objects.filter(
+                pk=mailing.pk,
+                next_send_datetime=mailing.next_send_datetime,
+            ).update(next_send_datetime=mailing.get_next_send_datetime(current_datetime))
+            if not is_planned:
+                continue
+            # письмо клиенту в одном цикле рассылки ставится в очередь только один раз
+            outbox_messages = OutboxMessage.objects.bulk_create(
+                [
+                    OutboxMessage(mailing=mailing, client_id=client_id, email=email,
+                                  scheduled_datetime=current_datetime, send_cycle=mailing.next_send_datetime)
+                    for client_id, email in mailing.clients.values_list('id', 'email')
+                ],
+                batch_size=settings.MAILING_SEND_CHUNK_SIZE,
+                ignore_conflicts=True,
+            )
+        planned_count += len(outbox_messages)
 
-        if is_next_send_time(mailing, end_attempt, current_datetime):
-            try:
-                result = send_mail(
+    logger.info("Outbox messages planned: %s", planned_count)
+    return planned_count
+
+
+def claim_outbox_messages(batch_size: int, is_retry: bool = False) -> list:
+    """Функция захватывает порцию писем из исходящей очереди, пропуская письма, заблокированные
+    другими процессами отправки; зависшие в отправке дольше срока аренды письма захватываются повторно.
+    При is_retry захватываются письма, время повторной отправки которых наступило"""
+    zone = pytz.timezone(settings.TIME_ZONE)
+    current_datetime = datetime.now(zone)
+    lease_expired = current_datetime - timedelta(seconds=settings.MAILING_OUTBOX_LEASE_SECONDS)
+
+    if is_retry:
+        lane_filter = Q(status='retry', next_attempt_datetime__lte=current_datetime)
+    else:
+        lane_filter = Q(status='pending') | Q(status='processing', locked_datetime__lt=lease_expired)
+
+    with transaction.atomic():
+        outbox_messages = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(lane_filter)
+            .select_related('mailing__message')
+            .order_by('id')[:batch_size]
+        )
+        OutboxMessage.objects.filter(pk__in=[outbox_message.pk for outbox_message in outbox_messages]).update(
+            status='processing',
+            locked_datetime=current_datetime,
+        )
+    return outbox_messages
+
+
+def prune_outbox_messages(batch_size: int) -> int:
+    """Функция удаляет из исходящей очереди отправленные и не отправленные письма завершенных циклов рассылок
+    порциями по batch_size писем, возвращает количество удаленных писем. Цикл завершен, если в нем не осталось
+    писем в отправке или на повторной отправке; последний цикл каждой рассылки остается в очереди,
+    по нему считается время следующей отправки"""
+    in_flight_messages = OutboxMessage.objects.filter(
+        mailing_id=OuterRef('mailing_id'),
+        send_cycle=OuterRef('send_cycle'),
+        status__in=['pending', 'processing', 'retry'],
+    )
+    last_send_cycle = OutboxMessage.objects.filter(mailing_id=OuterRef('mailing_id')).order_by(
+        '-send_cycle').values('send_cycle')[:1]
+    done_messages = (
+        OutboxMessage.objects.filter(status__in=['sent', 'failed'], send_cycle__lt=Subquery(last_send_cycle))
+        .exclude(Exists(in_flight_messages))
+    )
+
+    pruned_count = 0
+    while True:
+        message_ids = list(done_messages.values_list('id', flat=True)[:batch_size])
+        if not message_ids:
+            return pruned_count
+        pruned_count += OutboxMessage.objects.filter(id__in=message_ids).delete()[0]
+
+
+def get_retry_delay(attempt_count: int) -> float:
+    """Функция возвращает задержку повторной отправки в секундах: экспоненциально растущую
+    после каждой неудачной попытки, со случайным разбросом, чтобы повторы не уходили одновременно"""
+    delay = min(settings.MAILING_RETRY_BASE_DELAY * 2 ** (attempt_count - 1), settings.MAILING_RETRY_MAX_DELAY)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def checkpoint_outbox_messages(outbox_messages: list, error: Exception) -> None:
+    """Функция сразу после ответа почтового сервера отмечает письма исходящей очереди, чтобы после перезапуска
+    отправка продолжилась с неотправленных писем: после временной ошибки письмо ставится на повторную
+    отправку, пока не исчерпано количество попыток, после постоянной ошибки - не отправляется"""
+    if error is None or not is_transient_error(error):
+        OutboxMessage.objects.filter(pk__in=[outbox_message.pk for outbox_message in outbox_messages]).update(
+            status='sent' if error is None else 'failed',
+        )
+        return
+
+    zone = pytz.timezone(settings.TIME_ZONE)
+    current_datetime = datetime.now(zone)
+    for outbox_message in outbox_messages:
+        outbox_message.attempt_count += 1
+        if outbox_message.attempt_count >= settings.MAILING_RETRY_MAX_ATTEMPTS:
+            outbox_message.status = 'failed'
+        else:
+            outbox_message.status = 'retry'
+            outbox_message.next_attempt_datetime = current_datetime + timedelta(
+                seconds=get_retry_delay(outbox_message.attempt_count))
+        outbox_message.save(update_fields=['status', 'attempt_count', 'next_attempt_datetime'])
+
+
+def renew_outbox_lease(outbox_messages: list) -> None:
+    """Функция продлевает аренду еще не отправленных писем, чтобы письма, ожидающие ограничителя скорости
+    дольше MAILING_OUTBOX_LEASE_SECONDS, не захватил и не отправил повторно другой процесс"""
+    zone = pytz.timezone(settings.TIME_ZONE)
+    OutboxMessage.objects.filter(
+        pk__in=[outbox_message.pk for outbox_message in outbox_messages],
+        status='processing',
+    ).update(locked_datetime=datetime.now(zone))
+
+
+def send_outbox_messages(mailing: MailingSettings, outbox_messages: list, pool: SMTPConnectionPool,
+                         rate_limiter: RateLimiter) -> list:
+    """Функция отправляет письма рассылки из исходящей очереди через одно соединение, отмечая каждое письмо,
+    возвращает ошибку сервера для каждого письма (None - письмо принято). Пока ограничитель скорости
+    ждет пополнения окна, аренда неотправленных писем продлевается"""
+    results = []
+
+    def on_wait():
+        renew_outbox_lease(outbox_messages[len(results):])
+
+    try:
+        with pool.connection() as connection:
+            if settings.MAILING_DISPATCH_MODE == 'per_recipient':
+                messages = build_recipient_messages(
+                    prepare_mime_message(mailing),
+                    [outbox_message.email for outbox_message in outbox_messages],
+                    [outbox_message.idempotency_key for outbox_message in outbox_messages],
+                )
+                sent_results = pool.send_each(connection, messages, rate_limiter, on_wait)
+                for outbox_message, error in zip(outbox_messages, sent_results):
+                    checkpoint_outbox_messages([outbox_message], error)
+                    results.append(error)
+            else:
+                message = EmailMessage(
                     subject=mailing.message.theme,
-                    message=mailing.message.body,
+                    body=mailing.message.body,
                     from_email=settings.EMAIL_HOST_USER,
-                    recipient_list=[client.email for client in mailing.clients.all()],
-                    fail_silently=False,
+                    to=[outbox_message.email for outbox_message in outbox_messages],
                 )
-                status = 'Successfully' if result else 'Not successful'
-                response = ''
-            except smtplib.SMTPException as e:
-                status = 'Not successful'
-                response = str(e)
-
-            MailingAttempt.objects.create(
-                attempt_status=status,
-                response_mail_server=response,
+                error = next(pool.send_each(connection, [message], rate_limiter, on_wait))
+                checkpoint_outbox_messages(outbox_messages, error)
+                results = [error] * len(outbox_messages)
+    except OSError as e:  # не удалось подключиться к почтовому серверу
+        unsent_messages = outbox_messages[len(results):]
+        checkpoint_outbox_messages(unsent_messages, e)
+        results.extend([e] * len(unsent_messages))
+    return results
+
+
+def deliver_outbox_task(outbox_messages: list, pool: SMTPConnectionPool, rate_limiter: RateLimiter) -> list:
+    """Функция отправляет задачу в потоке и закрывает соединение потока с БД"""
+    try:
+        return send_outbox_messages(outbox_messages[0].mailing, outbox_messages, pool, rate_limiter)
+    finally:
+        db_connection.close()
+
+
+def record_outbox_results(mailing: MailingSettings, outbox_messages: list, results: list) -> None:
+    """Функция добавляет в буфер попыток рассылки результаты отправки писем исходящей очереди"""
+    zone = pytz.timezone(settings.TIME_ZONE)
+    current_datetime = datetime.now(zone)
+
+    response_ids = get_mail_server_response_ids(results)
+
+    def get_response_id(error):
+        return None if error is None else response_ids[get_mail_server_response_text(error)]
+
+    if settings.MAILING_DISPATCH_MODE == 'per_recipient':
+        attempts = [
+            MailingAttempt(
+                attempt_status=MailingAttempt.SUCCESSFULLY if error is None else MailingAttempt.NOT_SUCCESSFUL,
+                mail_server_response_id=get_response_id(error),
                 mailing=mailing,
+                client_id=outbox_message.client_id,
                 datetime_last_try=current_datetime,
             )
-            print('Рассылка отправлена')
+            for outbox_message, error in zip(outbox_messages, results)
+        ]
+    else:
+        attempts = [
+            MailingAttempt(
+                attempt_status=MailingAttempt.SUCCESSFULLY if results[0] is None else MailingAttempt.NOT_SUCCESSFUL,
+                mail_server_response_id=get_response_id(results[0]),
+                mailing=mailing,
+                datetime_last_try=current_datetime,
+            )
+        ]
+
+    get_attempt_writer().add(attempts)
+
+
+def split_outbox_messages(outbox_messages: list) -> list:
+    """Функция делит захваченные письма на задачи для параллельной отправки: письма одной рассылки,
+    при отправке каждому клиенту отдельно - не больше EMAIL_SEND_BATCH_SIZE писем в задаче"""
+    mailing_messages = defaultdict(list)
+    for outbox_message in outbox_messages:
+        mailing_messages[outbox_message.mailing_id].append(outbox_message)
+
+    if settings.MAILING_DISPATCH_MODE != 'per_recipient':
+        return list(mailing_messages.values())
+
+    batch_size = settings.EMAIL_SEND_BATCH_SIZE
+    return [
+        group[i:i + batch_size]
+        for group in mailing_messages.values()
+        for i in range(0, len(group), batch_size)
+    ]
+
+
+@defer_content_versions()
+def deliver_outbox(batch_size: int = None) -> int:
+    """Функция отправки писем из исходящей очереди: захватывает порцию новых писем и порцию писем
+    на повторную отправку (не больше MAILING_RETRY_BATCH_SIZE, со своим ограничителем скорости),
+    отправляет их параллельно в MAILING_SEND_WORKERS потоков и записывает попытки рассылки,
+    возвращает количество обработанных писем"""
+    outbox_messages = claim_outbox_messages(batch_size or settings.MAILING_SEND_CHUNK_SIZE)
+    retry_messages = claim_outbox_messages(settings.MAILING_RETRY_BATCH_SIZE, is_retry=True)
+    if not outbox_messages and not retry_messages:
+        return 0
+
+    pool = get_smtp_pool()
+    tasks = [(task, get_rate_limiter()) for task in split_outbox_messages(outbox_messages)]
+    tasks += [(task, get_rate_limiter('retry')) for task in split_outbox_messages(retry_messages)]
+
+    # потоки отправляют письма и отмечают их в очереди, попытки рассылки записываются в текущем потоке
+    try:
+        with ThreadPoolExecutor(max_workers=settings.MAILING_SEND_WORKERS) as executor:
+            results = executor.map(lambda task: deliver_outbox_task(task[0], pool, task[1]), tasks)
+            for (task, _), task_results in zip(tasks, results):
+                record_outbox_results(task[0].mailing, task, task_results)
+    except Exception:
+        flush_attempts()  # попытки уже отправленных писем не должны потеряться
+        raise
+
+    return len(outbox_messages) + len(retry_messages)
+
+
+@leader_only
+def send_mailing():
+    """Функция отправки рассылок: планирует письма наступивших рассылок и, если письма не отправляют
+    отдельные процессы (команда runmailingworker), отправляет всю исходящую очередь"""
+    plan_mailings()
+    if not settings.MAILING_OUTBOX_WORKERS:
+        delivered_count = deliver_outbox()
+        while delivered_count:
+            logger.info("Outbox messages delivered: %s", delivered_count)
+            delivered_count = deliver_outbox()
+        get_attempt_writer().flush()
+        get_smtp_pool().close_idle()
+
+
+def get_next_wakeup_datetime():
+    """Функция возвращает ближайшие дату и время, когда нужно изменить статус рассылки или отправить рассылку,
+    None - таких рассылок нет"""
+    active_mailings = filter_shard(MailingSettings.objects.filter(is_disabled=False))
+    wakeups = [
+        active_mailings.filter(mailing_status='created').aggregate(wakeup=Min('start_datetime'))['wakeup'],
+        active_mailings.filter(mailing_status__in=['created', 'launched']).aggregate(
+            wakeup=Min('end_datetime'))['wakeup'],
+        active_mailings.filter(mailing_status='launched').aggregate(wakeup=Min('next_send_datetime'))['wakeup'],
+    ]
+    if not settings.MAILING_OUTBOX_WORKERS:  # повторные отправки выполняет сам планировщик
+        wakeups.append(
+            filter_shard(OutboxMessage.objects.filter(status='retry'), 'mailing_id').aggregate(
+                wakeup=Min('next_attempt_datetime'))['wakeup']
+        )
+    wakeups = [wakeup for wakeup in wakeups if wakeup is not None]
+    return min(wakeups) if wakeups else None
+
+
+def run_mailing_jobs():
+    """Функция запускает изменение статусов рассылок и отправку рассылок в одном процессе,
+    поэтому обе задачи выполняются под одной блокировкой ведущего процесса"""
+    change_mailing_status()
+    send_mailing()
+
+
+def leader_heartbeat(scheduler=None, jobstore: str = 'default'):
+    """Функция каждые MAILING_LEADER_HEARTBEAT_SECONDS секунд отмечает планировщик в списке планировщиков
+    и подтверждает блокировку ведущего процесса. Процесс, только что ставший ведущим или получивший новую
+    часть рассылок, сразу выполняет задачи рассылок, пропущенные упавшим процессом: отдельной разовой задачей
+    планировщика scheduler, чтобы долгая отправка не останавливала отметки и продление блокировки"""
+    is_rebalanced = False
+    shard_membership = get_shard_membership()
+    if shard_membership is not None:
+        previous_lock_name = get_leader_lock_name()
+        shard_membership.heartbeat()
+        if get_leader_lock_name() != previous_lock_name:
+            get_leader_lock(previous_lock_name).release()
+            is_rebalanced = True
+
+    is_elected = False
+    if settings.MAILING_LEADER_ELECTION:
+        leader_lock = get_leader_lock(get_leader_lock_name())
+        was_leader = leader_lock.is_leader
+        is_elected = leader_lock.acquire() and not was_leader
+
+    if not is_rebalanced and not is_elected:
+        return
+    if scheduler is None:
+        run_mailing_jobs()
+        return
+    scheduler.add_job(run_mailing_jobs, trigger='date', id='run_mailing_jobs_now', jobstore=jobstore,
+                      max_instances=1, misfire_grace_time=None, replace_existing=True)
 
 
 def start():
     """Функция старта периодических задач"""
     scheduler = BackgroundScheduler()
-    scheduler.add_job(change_mailing_status, 'interval', seconds=59)
-    scheduler.add_job(send_mailing, 'interval', seconds=59)
+    scheduler.add_job(leader_heartbeat, 'interval', seconds=settings.MAILING_LEADER_HEARTBEAT_SECONDS,
+                      kwargs={'scheduler': scheduler}, max_instances=1)
+    if settings.MAILING_EXACT_SCHEDULING:
+        from mailing.scheduling import ExactTimeScheduler
+        ExactTimeScheduler(scheduler).start()
+    else:
+        scheduler.add_job(change_mailing_status, 'interval', seconds=59)
+        scheduler.add_job(send_mailing, 'interval', seconds=59)
     scheduler.start()
 
 
+def rollup_attempts_batch(cutoff_datetime: datetime, batch_size: int) -> int:
+    """Функция удаляет порцию попыток рассылки до cutoff_datetime, возвращает количество удаленных попыток.
+    Дневная статистика по ним уже посчитана при записи попыток"""
+    attempt_ids = list(
+        MailingAttempt.objects.filter(datetime_last_try__lt=cutoff_datetime)
+        .order_by('datetime_last_try')
+        .values_list('id', flat=True)[:batch_size]
+    )
+    if not attempt_ids:
+        return 0
+    return MailingAttempt.objects.filter(id__in=attempt_ids).delete()[0]
+
+
+def rollup_attempts(days: int = None, batch_size: int = None) -> int:
+    """Функция удаляет попытки рассылки старше days дней (MAILING_ATTEMPT_RETENTION_DAYS) порциями
+    по batch_size попыток, возвращает количество удаленных попыток: в дневной статистике рассылок
+    они уже учтены при записи попыток. Заодно из исходящей очереди удаляются письма завершенных циклов рассылок.
+    Одновременно сворачивание выполняет только один процесс"""
+    days = settings.MAILING_ATTEMPT_RETENTION_DAYS if days is None else days
+    batch_size = batch_size or settings.MAILING_ATTEMPT_ROLLUP_BATCH_SIZE
+
+    rollup_lock = get_leader_lock('mailing_attempt_rollup')
+    if not rollup_lock.acquire():
+        logger.info("Attempt rollup is already running")
+        return 0
+
+    zone = pytz.timezone(settings.TIME_ZONE)
+    # удаляются только целые дни, чтобы в списке попыток не оставалась часть дня
+    cutoff_datetime = (datetime.now(zone) - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+    rolled_count = 0
+    try:
+        batch_count = rollup_attempts_batch(cutoff_datetime, batch_size)
+        while batch_count:
+            rolled_count += batch_count
+            logger.info("Mailing attempts deleted: %s", rolled_count)
+            batch_count = rollup_attempts_batch(cutoff_datetime, batch_size)
+        logger.info("Outbox messages pruned: %s", prune_outbox_messages(batch_size))
+    finally:
+        rollup_lock.release()
+    if rolled_count:
+        touch_content_version(MAILING_ATTEMPTS_VERSION)
+    return rolled_count
+
+
+def get_daily_attempt_report(mailing: MailingSettings) -> list:
+    """Функция возвращает статистику попыток рассылки по дням из дневной статистики без выбора попыток"""
+    return list(
+        MailingAttemptDaily.objects.filter(mailing=mailing).values('date', 'success_count', 'failure_count')
+        .order_by('-date')
+    )
+
+
+def filter_attempts(queryset, attempt_status: int = None, date_from=None, date_to=None, mailing_id: int = None):
+    """Функция фильтрует попытки рассылок по статусу, периоду и рассылке, период сравнивается
+    с датой и временем попытки напрямую, чтобы запрос использовал индекс"""
+    zone = pytz.timezone(settings.TIME_ZONE)
+    if attempt_status is not None:
+        queryset = queryset.filter(attempt_status=attempt_status)
+    if date_from is not None:
+        queryset = queryset.filter(datetime_last_try__gte=zone.localize(datetime.combine(date_from, time.min)))
+    if date_to is not None:
+        queryset = queryset.filter(
+            datetime_last_try__lt=zone.localize(datetime.combine(date_to + timedelta(days=1), time.min)))
+    if mailing_id is not None:
+        queryset = queryset.filter(mailing_id=mailing_id)
+    return queryset
+
+
+class EchoBuffer:
+    """Класс буфера, который возвращает записанную строку вместо ее хранения, для потоковой записи CSV"""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+ATTEMPT_EXPORT_FIELDS = {
+    'id': 'id',
+    'datetime_last_try': 'datetime_last_try',
+    'attempt_status': 'attempt_status',
+    'mailing_id': 'mailing_id',
+    'client_email': 'client__email',
+    'mail_server_response': 'mail_server_response__text',
+}
+
+
+def iter_attempts_export(queryset, export_format: str = 'csv'):
+    """Функция построчно выгружает попытки рассылок в формате csv или jsonl: строки читаются из БД
+    порциями по MAILING_EXPORT_CHUNK_SIZE через серверный курсор, поэтому память не зависит от объема выгрузки"""
+    statuses = dict(MailingAttempt.ATTEMPTS)
+    rows = queryset.order_by('id').values_list(*ATTEMPT_EXPORT_FIELDS.values()).iterator(
+        chunk_size=settings.MAILING_EXPORT_CHUNK_SIZE)
+
+    if export_format == 'jsonl':
+        for row in rows:
+            attempt = dict(zip(ATTEMPT_EXPORT_FIELDS, row))
+            attempt['datetime_last_try'] = attempt['datetime_last_try'].isoformat()
+            attempt['attempt_status'] = statuses[attempt['attempt_status']]
+            yield json.dumps(attempt, ensure_ascii=False) + '\n'
+        return
+
+    writer = csv.writer(EchoBuffer())
+    yield writer.writerow(ATTEMPT_EXPORT_FIELDS)
+    for row in rows:
+        attempt_id, datetime_last_try, attempt_status, *other_fields = row
+        yield writer.writerow([attempt_id, datetime_last_try.isoformat(), statuses[attempt_status], *other_fields])
+
+
+statistic_mailing_cache = TwoTierCache('statistic_mailing', settings.MAILING_STATISTIC_CACHE_TIMEOUT)
+
+
+def get_statistic_mailing() -> dict:
+    """Функция считает количество всех рассылок, активных рассылок и количество уникальных клиентов"""
+    return {
+        'mailing_count': MailingSettings.objects.count(),
+        'active_mailing_count': MailingSettings.objects.filter(mailing_status='launched', is_disabled=False).count(),
+        'unique_clients_count': Client.objects.count(),  # email клиента уникален, DISTINCT не нужен
+    }
+
+
 def get_statistic_mailing_for_cache():
     """Функция получает количество всех рассылок, активных рассылок и количество уникальных клиентов
-     из кэша или из БД и тогда записывает в кэш"""
-    if settings.CACHE_ENABLED:
-        key = 'statistic_mailing'
-        statistic_mailing = cache.get(key)
-        if statistic_mailing is None:
-            statistic_mailing = {
-                'mailing_count': MailingSettings.objects.all().count(),
-                'active_mailing_count': MailingSettings.objects.filter(mailing_status='launched').filter(
-                    is_disabled=False).count(),
-                'unique_clients_count': Client.objects.values_list('email', flat=True).distinct().count()
-            }
-            cache.set(key, statistic_mailing)
-    else:
-        statistic_mailing = {
-            'mailing_count': MailingSettings.objects.all().count(),
-            'active_mailing_count': MailingSettings.objects.filter(mailing_status='launched').filter(
-                is_disabled=False).count(),
-            'unique_clients_count': Client.objects.values_list('email', flat=True).distinct().count()
-        }
-
-    return statistic_mailing
+    из памяти процесса, из кэша или из БД и тогда записывает в кэш"""
+    return statistic_mailing_cache.get_or_set('all', get_statistic_mailing)
+
+
+def invalidate_statistic_mailing() -> None:
+    """Функция сбрасывает статистику рассылок в кэше после изменения рассылок или клиентов"""
+    statistic_mailing_cache.invalidate()
+
+
+def search_clients(queryset, query: str):
+    """Функция ищет клиентов по части email или Ф.И.О., клиенты упорядочены по похожести на запрос.
+    Поиск использует триграммные GIN-индексы client_email_trgm_idx и client_name_trgm_idx"""
+    return (
+        queryset.filter(Q(email__icontains=query) | Q(name__icontains=query))
+        .annotate(similarity=Greatest(TrigramSimilarity('email', query), TrigramSimilarity('name', query)))
+        .order_by('-similarity', 'pk')
+    )
+
+
+def get_attempts_etag(request, *args, **kwargs) -> str:
+    """Функция возвращает ETag отчета о попытках рассылок по версии отчета без выбора самих попыток"""
+    return make_etag(request, MAILING_ATTEMPTS_VERSION)
+
+
+def get_attempts_last_modified(request, *args, **kwargs):
+    """Функция возвращает время последнего изменения попыток рассылок, рассылок или клиентов"""
+    return get_content_last_modified(request, MAILING_ATTEMPTS_VERSION)
@@ -0,0 +1,102 @@
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import NamedTuple
+from uuid import uuid4
+
+import pytz
+from django.conf import settings
+from django.db.models.functions import Mod
+
+from mailing.models import SchedulerNode
+
+logger = logging.getLogger(__name__)
+
+
+class Shard(NamedTuple):
+    """Класс части рассылок планировщика: рассылки, у которых id % count == index"""
+    index: int
+    count: int
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+
+_current_shard = None
+
+
+def parse_shard(value: str) -> Shard:
+    """Функция разбирает часть рассылок в формате N/M"""
+    try:
+        index, count = (int(number) for number in value.split('/'))
+    except ValueError:
+        raise ValueError(f"Shard must be in N/M format, got '{value}'")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Shard number must be from 0 to {count - 1}, got '{value}'")
+    return Shard(index, count)
+
+
+def get_current_shard():
+    """Функция возвращает часть рассылок текущего процесса, None - процесс обрабатывает все рассылки"""
+    return _current_shard
+
+
+def set_current_shard(shard) -> None:
+    """Функция назначает часть рассылок текущему процессу"""
+    global _current_shard
+    _current_shard = shard
+
+
+def filter_shard(queryset, field: str = 'pk'):
+    """Функция оставляет в выборке только рассылки части текущего процесса, field - поле с id рассылки"""
+    shard = get_current_shard()
+    if shard is None or shard.count == 1:
+        return queryset
+    return queryset.alias(shard_number=Mod(field, shard.count)).filter(shard_number=shard.index)
+
+
+class ShardMembership:
+    """Класс автоматического распределения рассылок между планировщиками: каждый планировщик
+    отмечается в таблице SchedulerNode, планировщики без отметки дольше MAILING_SHARD_NODE_TIMEOUT секунд
+    удаляются, а номер части рассылок - это место планировщика в упорядоченном списке живых планировщиков.
+    При запуске или падении планировщика части перераспределяются при следующей отметке"""
+
+    def __init__(self):
+        self.name = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+
+    def heartbeat(self) -> Shard:
+        """Метод отмечает планировщик живым и назначает ему часть рассылок"""
+        zone = pytz.timezone(settings.TIME_ZONE)
+        current_datetime = datetime.now(zone)
+        SchedulerNode.objects.update_or_create(name=self.name, defaults={'heartbeat_datetime': current_datetime})
+        SchedulerNode.objects.filter(
+            heartbeat_datetime__lt=current_datetime - timedelta(seconds=settings.MAILING_SHARD_NODE_TIMEOUT),
+        ).delete()
+
+        names = list(SchedulerNode.objects.values_list('name', flat=True))
+        shard = Shard(names.index(self.name), len(names))
+        if shard != get_current_shard():
+            logger.info("Node %s rebalanced to shard %s", self.name, shard)
+            set_current_shard(shard)
+        return shard
+
+    def leave(self) -> None:
+        """Метод удаляет планировщик из списка, чтобы его часть рассылок сразу перешла другим"""
+        SchedulerNode.objects.filter(name=self.name).delete()
+
+
+_shard_membership = None
+
+
+def get_shard_membership():
+    """Функция возвращает автоматическое распределение рассылок текущего процесса, None - не включено"""
+    return _shard_membership
+
+
+def join_shard_membership() -> ShardMembership:
+    """Функция включает автоматическое распределение рассылок для текущего процесса"""
+    global _shard_membership
+    _shard_membership = ShardMembership()
+    _shard_membership.heartbeat()
+    return _shard_membership
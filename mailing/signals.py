@@ -0,0 +1,26 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from mailing.models import Client, MailingSettings
+from mailing.scheduling import touch_mailing_schedule
+from mailing.services import invalidate_statistic_mailing
+from mailing.versions import MAILING_ATTEMPTS_VERSION, touch_content_version
+
+
+@receiver(post_save, sender=MailingSettings)
+@receiver(post_delete, sender=MailingSettings)
+def mailing_settings_changed(sender, **kwargs):
+    """Сигнал отмечает изменение расписания рассылок, сбрасывает статистику рассылок и увеличивает версию
+    отчета о попытках рассылок при создании, изменении, отключении и удалении рассылки"""
+    touch_mailing_schedule()
+    invalidate_statistic_mailing()
+    touch_content_version(MAILING_ATTEMPTS_VERSION)
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+def client_changed(sender, **kwargs):
+    """Сигнал сбрасывает статистику рассылок и увеличивает версию отчета о попытках рассылок
+    при создании, изменении и удалении клиента"""
+    invalidate_statistic_mailing()
+    touch_content_version(MAILING_ATTEMPTS_VERSION)
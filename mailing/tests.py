@@ -1,3 +1,1117 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import os
+import signal
+import smtplib
+import socket
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import pytz
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.date import DateTrigger
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.mail import EmailMessage
+from django.core.management import call_command
+from django.db import DatabaseError, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from mailing.attempts import AttemptWriter, flush_attempts
+from mailing.cache import TwoTierCache
+from mailing.connections import SMTPConnectionPool, is_transient_error
+from mailing.leader import LeaderLock, get_leader_lock
+from mailing.models import (Client, ContentVersion, MailingAttempt, MailingAttemptDaily, MailingSettings,
+                            MailServerResponse, Message, OutboxMessage, SchedulerNode)
+from mailing.ratelimit import RateLimiter, get_rate_limiter
+from mailing.scheduling import ExactTimeScheduler, touch_mailing_schedule
+from mailing.services import (checkpoint_outbox_messages, claim_outbox_messages, deliver_outbox,
+                              get_daily_attempt_report, get_mail_server_response_ids, get_mail_server_response_text,
+                              get_retry_delay, leader_heartbeat, plan_mailings, prune_outbox_messages,
+                              refresh_next_send_datetime, rollup_attempts, run_mailing_jobs, search_clients,
+                              send_outbox_messages)
+from mailing.sharding import Shard, ShardMembership, filter_shard, get_current_shard, set_current_shard
+from mailing.versions import MAILING_ATTEMPTS_VERSION, defer_content_versions, touch_content_version
+from mailing.views import MailingSettingsUpdateView
+from users.models import User
+
+try:
+    from aiosmtpd.controller import Controller
+    from aiosmtpd.smtp import SMTP
+except ImportError:  # заглушка почтового сервера нужна только для тестов отправки
+    Controller = SMTP = None
+
+
+class StubSMTPHandler:
+    """Класс обработчика заглушки почтового сервера: принимает письма, считает соединения
+    и может разорвать соединение по команде MAIL"""
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.recipients = []
+        self.connection_count = 0
+        self.active_connections = 0
+        self.max_active_connections = 0
+        self.drop_on_mail = 0  # количество следующих команд MAIL, на которых сервер разрывает соединение
+        self._lock = threading.Lock()
+
+    def connected(self) -> None:
+        with self._lock:
+            self.connection_count += 1
+            self.active_connections += 1
+            self.max_active_connections = max(self.max_active_connections, self.active_connections)
+
+    def disconnected(self) -> None:
+        with self._lock:
+            self.active_connections -= 1
+
+    def reset(self) -> None:
+        """Метод дожидается закрытия проверочного соединения, которое открывает запуск сервера, и сбрасывает счетчики"""
+        deadline = time.monotonic() + 1
+        while self.active_connections and time.monotonic() < deadline:
+            time.sleep(0.01)
+        with self._lock:
+            self.connection_count = 0
+            self.max_active_connections = 0
+
+    async def handle_MAIL(self, server, session, envelope, address, mail_options):
+        if self.drop_on_mail:
+            self.drop_on_mail -= 1
+            server.transport.close()
+            return '421 Closing connection'
+        envelope.mail_from = address
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        with self._lock:
+            self.recipients.extend(envelope.rcpt_tos)
+        return '250 OK'
+
+
+if SMTP is not None:
+    class CountingSMTP(SMTP):
+        """Класс сессии заглушки почтового сервера, которая сообщает обработчику об открытии и закрытии соединения"""
+
+        def connection_made(self, transport):
+            self.event_handler.connected()
+            super().connection_made(transport)
+
+        def connection_lost(self, error):
+            self.event_handler.disconnected()
+            super().connection_lost(error)
+
+    class StubSMTPController(Controller):
+        def factory(self):
+            return CountingSMTP(self.handler, **self.SMTP_kwargs)
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@skipUnless(Controller, 'aiosmtpd is not installed')
+class StubSMTPServerMixin:
+    """Миксин запускает заглушку почтового сервера в процессе теста и направляет на нее отправку писем"""
+    smtp_delay = 0
+
+    def setUp(self):
+        super().setUp()
+        port = get_free_port()
+        self.smtp_handler = StubSMTPHandler(self.smtp_delay)
+        self.smtp_controller = StubSMTPController(self.smtp_handler, hostname='127.0.0.1', port=port)
+        self.smtp_controller.start()
+        self.addCleanup(self.smtp_controller.stop)
+        self.smtp_handler.reset()
+        email_settings = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',  # тесты Django подменяют его на locmem
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=port,
+            EMAIL_USE_SSL=False,
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER='sender@example.com',
+            EMAIL_HOST_PASSWORD='',
+        )
+        email_settings.enable()
+        self.addCleanup(email_settings.disable)
+
+
+def make_messages(count: int) -> list:
+    return [
+        EmailMessage(subject='Тема', body='Текст', from_email='sender@example.com', to=[f"client{i}@example.com"])
+        for i in range(count)
+    ]
+
+
+class SMTPConnectionPoolTest(StubSMTPServerMixin, SimpleTestCase):
+    """Тесты пула SMTP-соединений на заглушке почтового сервера"""
+
+    def test_connection_is_reused(self):
+        """Письма нескольких отправок уходят через одно соединение пула"""
+        pool = SMTPConnectionPool(size=1)
+        for _ in range(3):
+            with pool.connection() as connection:
+                results = list(pool.send_each(connection, make_messages(10)))
+            self.assertEqual(results, [None] * 10)
+        pool.close()
+
+        self.assertEqual(len(self.smtp_handler.recipients), 30)
+        self.assertEqual(self.smtp_handler.connection_count, 1)
+
+    def test_reconnect_after_server_disconnect(self):
+        """После разрыва соединения сервером пул переподключается и повторяет письмо"""
+        pool = SMTPConnectionPool(size=1)
+        with pool.connection() as connection:
+            results = [next(iter(pool.send_each(connection, make_messages(1))))]
+            self.smtp_handler.drop_on_mail = 1
+            results += list(pool.send_each(connection, make_messages(2)))
+        pool.close()
+
+        self.assertEqual(results, [None] * 3)
+        self.assertEqual(len(self.smtp_handler.recipients), 3)
+        self.assertEqual(self.smtp_handler.connection_count, 2)
+
+
+class SendEachTest(SimpleTestCase):
+    """Тесты отправки писем по одному при разрыве соединения"""
+
+    def test_failed_reconnect_fails_rest_of_batch(self):
+        """Если переподключиться не удалось, остальные письма получают временную ошибку
+        и не отправляются новым соединением на каждое письмо"""
+        connection = mock.Mock()
+        connection.send_messages.side_effect = smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        connection.open.side_effect = ConnectionRefusedError('Connection refused')
+
+        results = list(SMTPConnectionPool(size=1).send_each(connection, make_messages(3)))
+
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(isinstance(error, smtplib.SMTPServerDisconnected) for error in results))
+        self.assertTrue(all(is_transient_error(error) for error in results))
+        self.assertEqual(connection.send_messages.call_count, 1)
+        self.assertEqual(connection.open.call_count, 1)
+
+
+def get_now() -> datetime:
+    return datetime.now(pytz.timezone(settings.TIME_ZONE))
+
+
+def create_mailing(client_count: int = 0, **fields) -> MailingSettings:
+    """Функция создает рассылку с сообщением и client_count клиентами"""
+    message = Message.objects.create(theme='Тема', body='Текст')
+    current_datetime = get_now()
+    mailing = MailingSettings.objects.create(**{
+        'start_datetime': current_datetime - timedelta(days=1),
+        'end_datetime': current_datetime + timedelta(days=30),
+        'periodicity': 'once a day',
+        'mailing_status': 'launched',
+        'message': message,
+        **fields,
+    })
+    first_client_id = Client.objects.count()
+    mailing.clients.set([
+        Client.objects.create(email=f"client{first_client_id + i}@example.com", name=f"Клиент {i}")
+        for i in range(client_count)
+    ])
+    return mailing
+
+
+class NextSendDatetimeTest(TestCase):
+    """Тесты пересчета времени следующей отправки рассылки"""
+
+    def test_planned_cycle_is_not_replanned(self):
+        """Пока попытки запланированного цикла не записаны, пересчет не возвращает время этого цикла"""
+        mailing = create_mailing(client_count=3, next_send_datetime=get_now() - timedelta(minutes=1))
+        self.assertEqual(plan_mailings(), 3)
+
+        mailing.refresh_from_db()
+        refresh_next_send_datetime(mailing)
+
+        mailing.refresh_from_db()
+        self.assertGreater(mailing.next_send_datetime, get_now())
+        self.assertEqual(plan_mailings(), 0)
+        self.assertEqual(OutboxMessage.objects.filter(mailing=mailing).count(), 3)
+
+    def test_next_send_is_not_before_start(self):
+        """Если начало рассылки перенесено позже, следующая отправка - в новое время начала"""
+        mailing = create_mailing(client_count=1, next_send_datetime=get_now() - timedelta(minutes=1))
+        plan_mailings()
+        mailing.refresh_from_db()
+        mailing.start_datetime = get_now() + timedelta(days=10)
+
+        refresh_next_send_datetime(mailing)
+
+        self.assertEqual(mailing.next_send_datetime, mailing.start_datetime)
+
+
+class PruneOutboxTest(TestCase):
+    """Тесты удаления писем завершенных циклов из исходящей очереди"""
+
+    def add_cycle(self, mailing, send_cycle, statuses):
+        OutboxMessage.objects.bulk_create([
+            OutboxMessage(mailing=mailing, client=client, email=client.email, status=status,
+                          scheduled_datetime=send_cycle, send_cycle=send_cycle)
+            for client, status in zip(mailing.clients.all(), statuses)
+        ])
+
+    def test_prune_done_cycles(self):
+        """Удаляются только письма завершенных циклов, кроме последнего цикла рассылки"""
+        current_datetime = get_now()
+        mailing = create_mailing(client_count=2)
+        self.add_cycle(mailing, current_datetime - timedelta(days=2), ['sent', 'failed'])
+        self.add_cycle(mailing, current_datetime - timedelta(days=1), ['sent', 'sent'])
+        in_flight_mailing = create_mailing(client_count=2)
+        self.add_cycle(in_flight_mailing, current_datetime - timedelta(days=2), ['sent', 'retry'])
+        self.add_cycle(in_flight_mailing, current_datetime - timedelta(days=1), ['sent', 'sent'])
+
+        self.assertEqual(prune_outbox_messages(batch_size=1), 2)
+
+        self.assertEqual(OutboxMessage.objects.filter(mailing=mailing).count(), 2)
+        self.assertFalse(OutboxMessage.objects.filter(
+            mailing=mailing, send_cycle=current_datetime - timedelta(days=2)).exists())
+        self.assertEqual(OutboxMessage.objects.filter(mailing=in_flight_mailing).count(), 4)
+
+
+@override_settings(MAILING_SEND_WORKERS=4, EMAIL_POOL_SIZE=2, EMAIL_SEND_BATCH_SIZE=2,
+                   MAILING_DISPATCH_MODE='per_recipient', MAILING_OUTBOX_WORKERS=False)
+class DeliverOutboxConcurrencyTest(StubSMTPServerMixin, TransactionTestCase):
+    """Тесты параллельной отправки исходящей очереди на заглушке почтового сервера"""
+    smtp_delay = 0.05
+
+    def setUp(self):
+        super().setUp()
+        pools = mock.patch.dict('mailing.connections._smtp_pools', clear=True)
+        pools.start()
+        self.addCleanup(pools.stop)
+
+    def test_connections_per_host_are_limited_by_pool(self):
+        """Потоков отправки больше, чем размер пула, но одновременно открыто не больше EMAIL_POOL_SIZE соединений"""
+        create_mailing(client_count=12, next_send_datetime=get_now() - timedelta(minutes=1))
+        plan_mailings()
+
+        self.assertEqual(deliver_outbox(), 12)
+        flush_attempts()
+
+        self.assertEqual(len(self.smtp_handler.recipients), 12)
+        self.assertEqual(self.smtp_handler.max_active_connections, 2)
+        self.assertEqual(OutboxMessage.objects.filter(status='sent').count(), 12)
+
+
+class RateLimiterTest(SimpleTestCase):
+    """Тесты ограничителя скорости отправки писем"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_failed_take_does_not_consume_tokens(self):
+        """Неудачная попытка списать токены не расходует запас окна"""
+        key = 'ratelimit:test:sender:minute'
+        self.assertTrue(RateLimiter._take(key, 60, 3, 2))
+        self.assertFalse(RateLimiter._take(key, 60, 3, 2))
+        self.assertFalse(RateLimiter._take(key, 60, 3, 2))
+        self.assertTrue(RateLimiter._take(key, 60, 3, 1))
+
+    def test_missing_sender_shares_sender_limit(self):
+        """Письма без отправителя не роняют ограничитель и укладываются в общий лимит отправителя"""
+        rate_limiter = RateLimiter({'sender': {'minute': 1}}, prefix='ratelimit:test')
+        rate_limiter.acquire(None, ['client@example.com'])
+        with mock.patch('mailing.ratelimit.time.sleep', side_effect=lambda delay: cache.clear()) as sleep:
+            rate_limiter.acquire(None, ['client@example.com'])
+        sleep.assert_called_once()
+
+    def test_on_wait_is_called_before_sleep(self):
+        """Перед ожиданием пополнения окна вызывается on_wait"""
+        rate_limiter = RateLimiter({'sender': {'minute': 1}}, prefix='ratelimit:test')
+        on_wait = mock.Mock()
+        rate_limiter.acquire('sender@example.com', ['client@example.com'], on_wait)
+        with mock.patch('mailing.ratelimit.time.sleep', side_effect=lambda delay: cache.clear()) as sleep:
+            rate_limiter.acquire('sender@example.com', ['client@example.com'], on_wait)
+
+        on_wait.assert_called_once_with()
+        sleep.assert_called_once()
+
+    @override_settings(MAILING_RATE_LIMITS={'sender': {'minute': 0}, 'domain': {'minute': 2}},
+                       MAILING_RETRY_RATE_LIMITS={'sender': {'minute': 5}})
+    def test_retry_lane_shares_domain_limits(self):
+        """У повторных отправок свой запас токенов отправителя, но лимиты доменов общие с новыми письмами"""
+        with mock.patch.dict('mailing.ratelimit._rate_limiters', clear=True):
+            default_limiter, retry_limiter = get_rate_limiter(), get_rate_limiter('retry')
+        default_limiter.acquire('sender@example.com', ['client1@example.com'])
+        retry_limiter.acquire('sender@example.com', ['client2@example.com'])
+        window = int(time.time() // 60)
+        self.assertEqual(cache.get(f"ratelimit:retry:sender:sender@example.com:minute:{window}"), 1)
+        self.assertEqual(cache.get(f"ratelimit:domain:example.com:minute:{window}"), 2)
+
+        on_wait = mock.Mock(side_effect=cache.clear)
+        with mock.patch('mailing.ratelimit.time.sleep'):
+            retry_limiter.acquire('sender@example.com', ['client3@example.com'], on_wait)
+        on_wait.assert_called_once_with()
+
+
+@override_settings(MAILING_DISPATCH_MODE='per_recipient')
+class OutboxLeaseTest(TestCase):
+    """Тесты аренды писем исходящей очереди"""
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(EMAIL_HOST_USER='sender@example.com')
+    def test_lease_is_renewed_while_rate_limited(self):
+        """Пока ограничитель скорости ждет, аренда неотправленных писем продлевается,
+        и другой процесс не захватывает их повторно"""
+        create_mailing(client_count=2, next_send_datetime=get_now() - timedelta(minutes=1))
+        plan_mailings()
+        outbox_messages = claim_outbox_messages(batch_size=10)
+        claimed_datetime = get_now() - timedelta(seconds=settings.MAILING_OUTBOX_LEASE_SECONDS + 1)
+        OutboxMessage.objects.update(locked_datetime=claimed_datetime)
+
+        def wait_for_window(delay):
+            self.assertEqual(claim_outbox_messages(batch_size=10), [])
+            cache.clear()
+
+        connection = mock.Mock()
+        connection.send_messages.return_value = 1
+        rate_limiter = RateLimiter({'sender': {'minute': 1}}, prefix='ratelimit:test')
+        with mock.patch.object(SMTPConnectionPool, '_take', return_value=connection), \
+                mock.patch('mailing.ratelimit.time.sleep', side_effect=wait_for_window) as sleep:
+            results = send_outbox_messages(outbox_messages[0].mailing, outbox_messages,
+                                           SMTPConnectionPool(size=1), rate_limiter)
+
+        self.assertEqual(results, [None, None])
+        sleep.assert_called_once()
+        first_message, second_message = OutboxMessage.objects.order_by('id')
+        self.assertEqual(first_message.locked_datetime, claimed_datetime)
+        self.assertGreater(second_message.locked_datetime, claimed_datetime)
+
+
+
+@override_settings(MAILING_RETRY_BASE_DELAY=60, MAILING_RETRY_MAX_DELAY=600, MAILING_RETRY_MAX_ATTEMPTS=3)
+class OutboxRetryTest(TestCase):
+    """Тесты повторной отправки писем исходящей очереди"""
+
+    def setUp(self):
+        create_mailing(client_count=3, next_send_datetime=get_now() - timedelta(minutes=1))
+        plan_mailings()
+        self.outbox_messages = claim_outbox_messages(batch_size=10)
+
+    def test_retry_delay_grows_with_jitter(self):
+        """Задержка удваивается после каждой попытки до MAILING_RETRY_MAX_DELAY,
+        разброс - от половины задержки до полной задержки"""
+        with mock.patch('mailing.services.random.uniform', side_effect=lambda low, high: high):
+            self.assertEqual([get_retry_delay(attempt_count) for attempt_count in range(1, 7)],
+                             [60, 120, 240, 480, 600, 600])
+        with mock.patch('mailing.services.random.uniform', side_effect=lambda low, high: low):
+            self.assertEqual([get_retry_delay(attempt_count) for attempt_count in range(1, 7)],
+                             [30, 60, 120, 240, 300, 300])
+        for _ in range(100):
+            self.assertTrue(120 <= get_retry_delay(3) <= 240)
+
+    def test_checkpoint_by_server_response(self):
+        """Письмо с временной ошибкой 4xx ставится на повторную отправку, с постоянной ошибкой 5xx -
+        не отправляется, принятое сервером письмо отмечается отправленным"""
+        retry_message, failed_message, sent_message = self.outbox_messages
+        started_datetime = get_now()
+
+        checkpoint_outbox_messages([retry_message], smtplib.SMTPResponseException(451, b'Try again later'))
+        checkpoint_outbox_messages([failed_message], smtplib.SMTPResponseException(550, b'No such user'))
+        checkpoint_outbox_messages([sent_message], None)
+
+        retry_message, failed_message, sent_message = OutboxMessage.objects.order_by('id')
+        self.assertEqual((retry_message.status, retry_message.attempt_count), ('retry', 1))
+        self.assertTrue(started_datetime + timedelta(seconds=30) <= retry_message.next_attempt_datetime
+                        <= get_now() + timedelta(seconds=60))
+        self.assertEqual((failed_message.status, failed_message.attempt_count), ('failed', 0))
+        self.assertEqual(sent_message.status, 'sent')
+
+    def test_retry_until_max_attempts(self):
+        """Письмо повторно отправляется, пока не исчерпано MAILING_RETRY_MAX_ATTEMPTS попыток,
+        после последней временной ошибки письмо не отправляется"""
+        outbox_message = self.outbox_messages[0]
+        error = smtplib.SMTPResponseException(421, b'Service not available')
+        for attempt_count in range(1, 3):
+            checkpoint_outbox_messages([outbox_message], error)
+            self.assertEqual(outbox_message.status, 'retry')
+            self.assertEqual(claim_outbox_messages(batch_size=10, is_retry=True), [])
+            OutboxMessage.objects.filter(pk=outbox_message.pk).update(next_attempt_datetime=get_now())
+            outbox_message, = claim_outbox_messages(batch_size=10, is_retry=True)
+            self.assertEqual(outbox_message.attempt_count, attempt_count)
+
+        checkpoint_outbox_messages([outbox_message], error)
+
+        outbox_message.refresh_from_db()
+        self.assertEqual((outbox_message.status, outbox_message.attempt_count), ('failed', 3))
+        self.assertEqual(claim_outbox_messages(batch_size=10, is_retry=True), [])
+
+
+
+@override_settings(MAILING_DISPATCH_MODE='per_recipient', EMAIL_HOST_USER='sender@example.com')
+class OutboxIdempotencyTest(TestCase):
+    """Тесты идемпотентной отправки писем исходящей очереди"""
+
+    def setUp(self):
+        cache.clear()
+        self.mailing = create_mailing(client_count=3, next_send_datetime=get_now() - timedelta(minutes=1))
+        plan_mailings()
+        self.sent = []  # пары (адрес, Message-ID) писем, переданных серверу
+
+    def send(self, outbox_messages: list, side_effect=None) -> list:
+        def send_messages(batch):
+            message = batch[0].message()
+            self.sent.append((message['To'], message['Message-ID']))
+            return side_effect(batch) if side_effect is not None else 1
+
+        connection = mock.Mock()
+        connection.send_messages.side_effect = send_messages
+        with mock.patch.object(SMTPConnectionPool, '_take', return_value=connection):
+            return send_outbox_messages(self.mailing, outbox_messages, SMTPConnectionPool(size=1),
+                                        RateLimiter({}, prefix='ratelimit:test'))
+
+    def test_resend_in_cycle_keeps_message_id(self):
+        """Повторная отправка письма в том же цикле рассылки получает тот же Message-ID,
+        письмо следующего цикла - другой Message-ID"""
+        outbox_messages = claim_outbox_messages(batch_size=1)
+
+        def refuse(batch):
+            raise smtplib.SMTPResponseException(451, b'Try again later')
+
+        self.send(outbox_messages, refuse)
+        OutboxMessage.objects.filter(pk=outbox_messages[0].pk).update(next_attempt_datetime=get_now())
+        self.assertEqual(self.send(claim_outbox_messages(batch_size=1, is_retry=True)), [None])
+
+        first_try, second_try = self.sent
+        self.assertEqual(first_try, second_try)
+        next_cycle = OutboxMessage(mailing=self.mailing, client=outbox_messages[0].client,
+                                   send_cycle=outbox_messages[0].send_cycle + timedelta(days=1))
+        self.assertNotEqual(next_cycle.idempotency_key, outbox_messages[0].idempotency_key)
+
+    def test_unfinished_batch_resumes_from_first_unsent(self):
+        """Если процесс остановился посреди порции, после истечения аренды порция продолжается
+        с первого неотправленного письма, отправленные письма повторно не отправляются"""
+        outbox_messages = claim_outbox_messages(batch_size=10)
+        emails = [outbox_message.email for outbox_message in outbox_messages]
+
+        def crash_after_first(batch):
+            if len(self.sent) > 1:
+                raise RuntimeError('process stopped')
+            return 1
+
+        with self.assertRaises(RuntimeError):
+            self.send(outbox_messages, crash_after_first)
+        self.assertEqual(list(OutboxMessage.objects.order_by('id').values_list('status', flat=True)),
+                         ['sent', 'processing', 'processing'])
+        interrupted_message_id = self.sent[1][1]
+
+        expired_datetime = get_now() - timedelta(seconds=settings.MAILING_OUTBOX_LEASE_SECONDS + 1)
+        OutboxMessage.objects.filter(status='processing').update(locked_datetime=expired_datetime)
+        self.sent.clear()
+        resumed_messages = claim_outbox_messages(batch_size=10)
+        self.assertEqual(self.send(resumed_messages), [None, None])
+
+        self.assertEqual([email for email, _ in self.sent], emails[1:])
+        self.assertEqual(self.sent[0][1], interrupted_message_id)
+        self.assertEqual(set(OutboxMessage.objects.values_list('status', flat=True)), {'sent'})
+
+
+class ExactTimeSchedulerTest(TestCase):
+    """Тесты пересчета расписания планировщика рассылок по точному времени"""
+
+    def setUp(self):
+        self.scheduler = ExactTimeScheduler(mock.Mock(), job=mock.Mock())
+        self.scheduler.start()
+
+    def test_watch_reschedules_on_change_from_other_process(self):
+        """Изменение расписания в другом процессе видно через БД, даже если кэш у процессов свой"""
+        with mock.patch.object(self.scheduler, 'reschedule') as reschedule:
+            self.scheduler.watch()
+            reschedule.assert_not_called()
+
+            touch_mailing_schedule()
+            cache.clear()
+            self.scheduler.watch()
+            reschedule.assert_called_once_with()
+
+    def test_mailing_change_touches_schedule(self):
+        """Созданная рассылка отмечает изменение расписания"""
+        create_mailing()
+        with mock.patch.object(self.scheduler, 'reschedule') as reschedule:
+            self.scheduler.watch()
+        reschedule.assert_called_once_with()
+
+
+class LeaderLockTest(TestCase):
+    """Тесты блокировки ведущего процесса: каждый экземпляр блокировки - отдельный процесс со своим соединением"""
+
+    def make_lock(self) -> LeaderLock:
+        lock = LeaderLock(f"test_leader:{self.id()}")
+        self.addCleanup(lock.release)
+        return lock
+
+    def test_takeover_after_release(self):
+        """Пока ведущий процесс держит блокировку, резервный пропускает задачи, после освобождения - захватывает"""
+        leader, standby = self.make_lock(), self.make_lock()
+        self.assertTrue(leader.acquire())
+        self.assertTrue(leader.acquire())
+        self.assertFalse(standby.acquire())
+
+        leader.release()
+
+        self.assertTrue(standby.acquire())
+        self.assertFalse(leader.acquire())
+
+    def test_heartbeat_after_connection_lost(self):
+        """Если соединение ведущего процесса с БД разорвано, сервер снимает блокировку, процесс перестает
+        быть ведущим, а ведущим становится резервный процесс"""
+        leader, standby = self.make_lock(), self.make_lock()
+        self.assertTrue(leader.acquire())
+        with leader._connection.cursor() as cursor:
+            cursor.execute("SELECT pg_backend_pid()")
+            backend_pid = cursor.fetchone()[0]
+        with connections['default'].cursor() as cursor:
+            cursor.execute("SELECT pg_terminate_backend(%s)", [backend_pid])
+
+        self.assertFalse(leader.acquire())
+        self.assertFalse(leader.is_leader)
+        # сервер снимает блокировку, когда процесс разорванного соединения завершится
+        deadline = time.monotonic() + 5
+        while not standby.acquire() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertTrue(standby.is_leader)
+
+    def test_heartbeat_after_connection_closed(self):
+        """Закрытое соединение ведущего процесса не роняет проверку блокировки"""
+        leader = self.make_lock()
+        self.assertTrue(leader.acquire())
+        leader._connection.connection.close()
+
+        self.assertFalse(leader.acquire())
+        self.assertIsNone(leader._connection)
+
+    @override_settings(MAILING_LEADER_ELECTION=True, MAILING_OUTBOX_WORKERS=True)
+    def test_mailing_jobs_share_leader_lock(self):
+        """Изменение статусов и отправка рассылок в одном задании обе выполняются ведущим процессом,
+        резервный процесс в это время блокировку не получает"""
+        with mock.patch.dict('mailing.leader._leader_locks', clear=True), \
+                mock.patch('mailing.services.filter_shard', wraps=filter_shard) as change_mailing_status, \
+                mock.patch('mailing.services.plan_mailings') as send_mailing:
+            run_mailing_jobs()
+            self.addCleanup(get_leader_lock().release)
+            self.assertTrue(get_leader_lock().is_leader)
+            self.assertFalse(LeaderLock().acquire())
+        change_mailing_status.assert_called()
+        send_mailing.assert_called_once_with()
+
+
+class ShardingTest(TestCase):
+    """Тесты распределения рассылок между планировщиками: каждый экземпляр ShardMembership - отдельный
+    планировщик, часть рассылок текущего процесса переключается на часть проверяемого планировщика"""
+
+    def setUp(self):
+        self.addCleanup(set_current_shard, None)
+
+    def get_shard_mailing_ids(self, shard: Shard) -> set:
+        set_current_shard(shard)
+        return set(filter_shard(MailingSettings.objects.all()).values_list('pk', flat=True))
+
+    def assert_mailings_split(self, shards: list) -> None:
+        """Каждая рассылка обрабатывается ровно одним из планировщиков"""
+        mailing_ids = set(MailingSettings.objects.values_list('pk', flat=True))
+        shard_mailing_ids = [self.get_shard_mailing_ids(shard) for shard in shards]
+        self.assertEqual(set().union(*shard_mailing_ids), mailing_ids)
+        self.assertEqual(sum(map(len, shard_mailing_ids)), len(mailing_ids))
+
+    def test_filter_shard_by_mailing_id(self):
+        """Рассылка попадает в часть id % M, письма очереди - в часть своей рассылки"""
+        for _ in range(7):
+            create_mailing(client_count=1, next_send_datetime=get_now() - timedelta(minutes=1))
+        plan_mailings()
+
+        for count in (1, 2, 3):
+            self.assert_mailings_split([Shard(index, count) for index in range(count)])
+        for mailing_id in self.get_shard_mailing_ids(Shard(1, 3)):
+            self.assertEqual(mailing_id % 3, 1)
+        self.assertEqual(
+            set(filter_shard(OutboxMessage.objects.all(), 'mailing_id').values_list('mailing_id', flat=True)),
+            self.get_shard_mailing_ids(Shard(1, 3)),
+        )
+
+    def test_heartbeat_rebalances_nodes(self):
+        """Запущенный или упавший планировщик меняет части рассылок остальных планировщиков при их отметке"""
+        for _ in range(5):
+            create_mailing()
+        first_node, second_node = ShardMembership(), ShardMembership()
+
+        self.assertEqual(first_node.heartbeat(), Shard(0, 1))
+        second_shard = second_node.heartbeat()
+        first_shard = first_node.heartbeat()
+        self.assertEqual({first_shard, second_shard}, {Shard(0, 2), Shard(1, 2)})
+        self.assertEqual(get_current_shard(), first_shard)
+        self.assert_mailings_split([first_shard, second_shard])
+
+        SchedulerNode.objects.filter(name=second_node.name).update(
+            heartbeat_datetime=get_now() - timedelta(seconds=settings.MAILING_SHARD_NODE_TIMEOUT + 1))
+        self.assertEqual(first_node.heartbeat(), Shard(0, 1))
+        self.assertFalse(SchedulerNode.objects.filter(name=second_node.name).exists())
+
+        second_node.heartbeat()
+        second_node.leave()
+        self.assertEqual(first_node.heartbeat(), Shard(0, 1))
+
+    @override_settings(MAILING_LEADER_ELECTION=False)
+    def test_rebalanced_node_runs_jobs(self):
+        """Планировщик, получивший новую часть рассылок, сразу выполняет задачи рассылок"""
+        first_node, second_node = ShardMembership(), ShardMembership()
+        first_node.heartbeat()
+        with mock.patch('mailing.services.get_shard_membership', return_value=first_node), \
+                mock.patch('mailing.services.run_mailing_jobs') as run_mailing_jobs:
+            leader_heartbeat()
+            run_mailing_jobs.assert_not_called()
+
+            second_node.heartbeat()
+            set_current_shard(Shard(0, 1))  # часть первого планировщика до отметки второго
+            leader_heartbeat()
+            run_mailing_jobs.assert_called_once_with()
+
+    @override_settings(MAILING_LEADER_ELECTION=False)
+    def test_rebalanced_node_queues_jobs(self):
+        """С планировщиком задачи рассылок ставятся разовой задачей, а не выполняются в задаче отметки,
+        поэтому долгая отправка не останавливает отметки планировщика"""
+        first_node, second_node = ShardMembership(), ShardMembership()
+        first_node.heartbeat()
+        scheduler = BackgroundScheduler()
+        scheduler.add_jobstore(MemoryJobStore(), 'leader')
+        with mock.patch('mailing.services.get_shard_membership', return_value=first_node), \
+                mock.patch('mailing.services.run_mailing_jobs') as run_mailing_jobs:
+            second_node.heartbeat()
+            set_current_shard(Shard(0, 1))
+            leader_heartbeat(scheduler, 'leader')
+
+        run_mailing_jobs.assert_not_called()
+        job = scheduler.get_job('run_mailing_jobs_now', 'leader')
+        self.assertIs(job.func, run_mailing_jobs)
+        self.assertIsInstance(job.trigger, DateTrigger)
+
+
+def make_attempts(mailing: MailingSettings, statuses: list, datetime_last_try: datetime = None) -> list:
+    return [
+        MailingAttempt(mailing=mailing, attempt_status=attempt_status,
+                       datetime_last_try=datetime_last_try or get_now())
+        for attempt_status in statuses
+    ]
+
+
+class AttemptWriterTest(TestCase):
+    """Тесты буфера попыток рассылки"""
+    SUCCESSFULLY, NOT_SUCCESSFUL = MailingAttempt.SUCCESSFULLY, MailingAttempt.NOT_SUCCESSFUL
+
+    def setUp(self):
+        self.mailing = create_mailing()
+
+    def test_flush_by_size(self):
+        """Буфер записывается одним bulk_create, когда в нем набралось flush_size попыток"""
+        writer = AttemptWriter(flush_size=3, flush_seconds=60)
+        writer.add(make_attempts(self.mailing, [self.SUCCESSFULLY] * 2))
+        self.assertEqual(MailingAttempt.objects.count(), 0)
+
+        # savepoint, bulk_create попыток, UPDATE счетчиков рассылки, bulk_create и UPDATE дня, release, версия данных
+        with self.assertNumQueries(7):
+            writer.add(make_attempts(self.mailing, [self.SUCCESSFULLY]))
+        self.assertEqual(MailingAttempt.objects.count(), 3)
+
+    def test_flush_by_time(self):
+        """Буфер записывается при добавлении попыток, если с последней записи прошло flush_seconds секунд"""
+        writer = AttemptWriter(flush_size=100, flush_seconds=5)
+        writer.add(make_attempts(self.mailing, [self.SUCCESSFULLY]))
+        self.assertEqual(MailingAttempt.objects.count(), 0)
+
+        with mock.patch('mailing.attempts.time.monotonic', return_value=time.monotonic() + 5):
+            writer.add(make_attempts(self.mailing, [self.NOT_SUCCESSFUL]))
+        self.assertEqual(MailingAttempt.objects.count(), 2)
+
+    def test_failed_flush_requeues_attempts(self):
+        """Если записать буфер не удалось, попытки остаются в буфере и записываются следующей записью"""
+        writer = AttemptWriter(flush_size=100, flush_seconds=60)
+        writer.add(make_attempts(self.mailing, [self.SUCCESSFULLY] * 2))
+        with mock.patch.object(MailingAttempt.objects, 'bulk_create', side_effect=DatabaseError('db is down')), \
+                self.assertRaises(DatabaseError):
+            writer.flush()
+        self.assertEqual(MailingAttempt.objects.count(), 0)
+
+        writer.add(make_attempts(self.mailing, [self.NOT_SUCCESSFUL]))
+        self.assertEqual(writer.flush(), 3)
+        self.mailing.refresh_from_db()
+        self.assertEqual((self.mailing.send_count, self.mailing.success_count, self.mailing.failure_count),
+                         (3, 2, 1))
+
+    def test_counters_from_several_writers(self):
+        """Счетчики рассылки увеличиваются в БД через F(), поэтому записи буферов разных процессов
+        складываются, а время последней попытки не уменьшается"""
+        first_writer, second_writer = AttemptWriter(flush_size=100), AttemptWriter(flush_size=100)
+        last_try = get_now()
+        first_writer.add(make_attempts(self.mailing, [self.SUCCESSFULLY, self.NOT_SUCCESSFUL], last_try))
+        second_writer.add(make_attempts(
+            self.mailing, [self.SUCCESSFULLY] * 3, last_try - timedelta(hours=1)))
+        first_writer.flush()
+        second_writer.flush()
+
+        self.mailing.refresh_from_db()
+        self.assertEqual((self.mailing.send_count, self.mailing.success_count, self.mailing.failure_count),
+                         (5, 4, 1))
+        self.assertEqual(self.mailing.last_success_datetime, last_try)
+        self.assertEqual(self.mailing.last_failure_datetime, last_try)
+
+    def test_content_version_touched_once_per_batch(self):
+        """Во время порции работы задач рассылок записи попыток и сохранения рассылки не обновляют версию отчета,
+        версия увеличивается один раз в конце порции"""
+        writer = AttemptWriter(flush_size=1, flush_seconds=60)
+        touch_content_version(MAILING_ATTEMPTS_VERSION)
+        version = ContentVersion.objects.get(name=MAILING_ATTEMPTS_VERSION).version
+
+        with defer_content_versions():
+            # savepoint, bulk_create попыток, UPDATE счетчиков рассылки, bulk_create и UPDATE дня, release
+            with self.assertNumQueries(6):
+                writer.add(make_attempts(self.mailing, [self.SUCCESSFULLY]))
+            writer.add(make_attempts(self.mailing, [self.NOT_SUCCESSFUL]))
+            self.mailing.save(update_fields=['is_disabled'])
+            self.assertEqual(ContentVersion.objects.get(name=MAILING_ATTEMPTS_VERSION).version, version)
+
+        self.assertEqual(ContentVersion.objects.get(name=MAILING_ATTEMPTS_VERSION).version, version + 1)
+
+
+class StopOnSigtermTest(SimpleTestCase):
+    """Тесты остановки команд по SIGTERM"""
+
+    def setUp(self):
+        self.addCleanup(signal.signal, signal.SIGTERM, signal.getsignal(signal.SIGTERM))
+
+    def test_worker_flushes_attempts_on_sigterm(self):
+        """Процесс отправки, остановленный по SIGTERM, записывает буфер попыток"""
+        def deliver_outbox(batch_size):
+            os.kill(os.getpid(), signal.SIGTERM)
+            return 1
+
+        with mock.patch('mailing.management.commands.runmailingworker.deliver_outbox', side_effect=deliver_outbox), \
+                mock.patch('mailing.management.commands.runmailingworker.flush_attempts') as flush_attempts, \
+                mock.patch('mailing.management.commands.runmailingworker.get_smtp_pool'):
+            call_command('runmailingworker')
+
+        flush_attempts.assert_called_once_with()
+
+
+class DailyAttemptsTest(TestCase):
+    """Тесты дневной статистики попыток рассылки"""
+
+    def test_daily_stats_on_flush(self):
+        """Дневная статистика увеличивается при записи попыток, в том числе уже существующий день"""
+        mailing = create_mailing()
+        last_try = get_now().replace(hour=12, minute=0, second=0, microsecond=0)
+        writer = AttemptWriter(flush_size=100)
+        writer.add(make_attempts(mailing, [MailingAttempt.SUCCESSFULLY, MailingAttempt.NOT_SUCCESSFUL], last_try))
+        writer.add(make_attempts(mailing, [MailingAttempt.SUCCESSFULLY], last_try - timedelta(days=1)))
+        writer.flush()
+        writer.add(make_attempts(mailing, [MailingAttempt.SUCCESSFULLY], last_try + timedelta(hours=1)))
+        writer.flush()
+
+        with self.assertNumQueries(1):
+            report = get_daily_attempt_report(mailing)
+        self.assertEqual(report, [
+            {'date': last_try.date(), 'success_count': 2, 'failure_count': 1},
+            {'date': (last_try - timedelta(days=1)).date(), 'success_count': 1, 'failure_count': 0},
+        ])
+        day = MailingAttemptDaily.objects.get(mailing=mailing, date=last_try.date())
+        self.assertEqual((day.first_try_datetime, day.last_try_datetime), (last_try, last_try + timedelta(hours=1)))
+
+    def test_rollup_deletes_old_attempts(self):
+        """Попытки старше срока хранения удаляются, дневная статистика по ним остается, свежие попытки остаются"""
+        mailing = create_mailing()
+        old_day = (get_now() - timedelta(days=40)).replace(hour=12, minute=0, second=0, microsecond=0)
+        writer = AttemptWriter(flush_size=100)
+        writer.add(make_attempts(mailing, [MailingAttempt.SUCCESSFULLY] * 2 + [MailingAttempt.NOT_SUCCESSFUL], old_day)
+                   + make_attempts(mailing, [MailingAttempt.SUCCESSFULLY], old_day + timedelta(days=1))
+                   + make_attempts(mailing, [MailingAttempt.SUCCESSFULLY]))
+        writer.flush()
+        report = get_daily_attempt_report(mailing)
+
+        self.assertEqual(rollup_attempts(days=30, batch_size=2), 4)
+
+        self.assertEqual(MailingAttempt.objects.count(), 1)
+        self.assertEqual(get_daily_attempt_report(mailing), report)
+        self.assertEqual(report[-1], {'date': old_day.date(), 'success_count': 2, 'failure_count': 1})
+
+
+class MailingSettingsViewTest(TestCase):
+    """Тесты сохранения рассылки в контроллерах"""
+
+    def setUp(self):
+        self.user = User.objects.create(email='admin@example.com', is_superuser=True)
+        self.client.force_login(self.user)
+        self.mailing = create_mailing(client_count=1)
+
+    def add_attempts_in_other_process(self):
+        """Метод записывает попытки рассылки, пока контроллер работает с загруженной ранее рассылкой"""
+        writer = AttemptWriter(flush_size=100)
+        writer.add(make_attempts(self.mailing, [MailingAttempt.SUCCESSFULLY] * 2))
+        writer.flush()
+
+    def test_disable_keeps_counters(self):
+        """Отключение рассылки не перезаписывает счетчики попыток"""
+        with mock.patch('mailing.views.get_object_or_404', return_value=self.mailing):
+            self.add_attempts_in_other_process()
+            self.client.get(reverse('mailing:disable_mailing', args=[self.mailing.pk]))
+
+        self.mailing.refresh_from_db()
+        self.assertTrue(self.mailing.is_disabled)
+        self.assertEqual((self.mailing.send_count, self.mailing.success_count), (2, 2))
+
+    def test_update_keeps_counters(self):
+        """Изменение рассылки сохраняет только поля формы, счетчики попыток не перезаписываются"""
+        data = {
+            'start_datetime': self.mailing.start_datetime.strftime('%Y-%m-%d %H:%M:%S'),
+            'end_datetime': (self.mailing.end_datetime + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S'),
+            'periodicity': self.mailing.periodicity,
+            'message': self.mailing.message_id,
+            'clients': list(self.mailing.clients.values_list('pk', flat=True)),
+        }
+        Message.objects.update(owner=self.user)
+        Client.objects.update(owner=self.user)
+        with mock.patch.object(MailingSettingsUpdateView, 'get_object', return_value=self.mailing):
+            self.add_attempts_in_other_process()
+            response = self.client.post(reverse('mailing:update_setting', args=[self.mailing.pk]), data)
+
+        self.assertEqual(response.status_code, 302)
+        self.mailing.refresh_from_db()
+        self.assertEqual((self.mailing.send_count, self.mailing.success_count), (2, 2))
+        self.assertEqual(self.mailing.end_datetime.date(), (get_now() + timedelta(days=31)).date())
+
+
+class MailingAttemptListViewTest(TestCase):
+    """Тесты постраничного вывода попыток рассылок по курсору"""
+
+    def test_pages_by_cursor(self):
+        """Страницы по курсору выводят каждую попытку ровно один раз, в том числе попытки с одинаковым временем"""
+        mailing = create_mailing()
+        last_try = get_now()
+        MailingAttempt.objects.bulk_create(
+            make_attempts(mailing, [MailingAttempt.SUCCESSFULLY] * 70, last_try)
+            + make_attempts(mailing, [MailingAttempt.NOT_SUCCESSFUL] * 50, last_try - timedelta(minutes=1))
+        )
+        self.client.force_login(User.objects.create(email='admin@example.com', is_superuser=True))
+
+        page_ids = []
+        query = ''
+        while query is not None:
+            response = self.client.get(f"{reverse('mailing:attempts')}?{query}")
+            self.assertEqual(response.status_code, 200)
+            page_ids.append([attempt.pk for attempt in response.context['object_list']])
+            query = response.context.get('next_page_query')
+
+        self.assertEqual([len(ids) for ids in page_ids], [50, 50, 20])
+        expected_ids = list(MailingAttempt.objects.order_by('-datetime_last_try', '-id').values_list('id', flat=True))
+        self.assertEqual(sum(page_ids, []), expected_ids)
+
+
+
+class MailingAttemptExportTest(TestCase):
+    """Тесты потоковой выгрузки попыток рассылок"""
+
+    def setUp(self):
+        self.owner = User.objects.create(email='owner@example.com')
+        self.owner.user_permissions.add(Permission.objects.get(codename='view_mailingattempt'))
+        self.other_owner = User.objects.create(email='other@example.com')
+        self.mailing = create_mailing(owner=self.owner)
+        self.other_mailing = create_mailing(owner=self.other_owner)
+        self.last_try = get_now().replace(hour=12, minute=0, second=0, microsecond=0)
+        self.old_try = self.last_try - timedelta(days=10)
+        MailingAttempt.objects.bulk_create(
+            make_attempts(self.mailing, [MailingAttempt.SUCCESSFULLY, MailingAttempt.NOT_SUCCESSFUL], self.last_try)
+            + make_attempts(self.mailing, [MailingAttempt.NOT_SUCCESSFUL], self.old_try)
+            + make_attempts(self.other_mailing, [MailingAttempt.SUCCESSFULLY], self.last_try)
+        )
+
+    def export(self, **params) -> list:
+        response = self.client.get(reverse('mailing:attempts_export'), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def get_attempt_ids(self, mailing: MailingSettings, **filters) -> list:
+        attempts = MailingAttempt.objects.filter(mailing=mailing, **filters)
+        return list(attempts.order_by('id').values_list('id', flat=True))
+
+    def test_csv_export(self):
+        """CSV содержит заголовок и все попытки рассылок по порядку id для суперпользователя"""
+        self.client.force_login(User.objects.create(email='admin@example.com', is_superuser=True))
+        rows = list(csv.reader(self.export()))
+
+        self.assertEqual(rows[0], ['id', 'datetime_last_try', 'attempt_status', 'mailing_id', 'client_email',
+                                   'mail_server_response'])
+        self.assertEqual([int(row[0]) for row in rows[1:]], list(
+            MailingAttempt.objects.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(rows[1][1:4], [self.last_try.isoformat(), 'Успешно', str(self.mailing.pk)])
+
+    def test_jsonl_export_with_filters(self):
+        """JSONL выгружает по строке на попытку с учетом статуса, периода и рассылки"""
+        self.client.force_login(self.owner)
+        attempts = [json.loads(line) for line in self.export(
+            export_format='jsonl', attempt_status=MailingAttempt.NOT_SUCCESSFUL,
+            date_from=self.last_try.date().isoformat(), date_to=self.last_try.date().isoformat(),
+            mailing_id=self.mailing.pk,
+        )]
+
+        self.assertEqual([attempt['id'] for attempt in attempts],
+                         self.get_attempt_ids(self.mailing, datetime_last_try=self.last_try,
+                                              attempt_status=MailingAttempt.NOT_SUCCESSFUL))
+        self.assertEqual(attempts[0]['attempt_status'], 'Не успешно')
+        self.assertEqual(attempts[0]['datetime_last_try'], self.last_try.isoformat())
+
+    def test_owner_scoping(self):
+        """Пользователь выгружает только попытки своих рассылок, даже если передал другого владельца,
+        суперпользователь выгружает попытки выбранного владельца"""
+        self.client.force_login(self.owner)
+        rows = self.export(owner_id=self.other_owner.pk)
+        self.assertEqual([int(row.split(',')[0]) for row in rows[1:]], self.get_attempt_ids(self.mailing))
+        rows = self.export(mailing_id=self.other_mailing.pk)
+        self.assertEqual(rows[1:], [])
+
+        self.client.force_login(User.objects.create(email='admin@example.com', is_superuser=True))
+        rows = self.export(owner_id=self.other_owner.pk)
+        self.assertEqual([int(row.split(',')[0]) for row in rows[1:]], self.get_attempt_ids(self.other_mailing))
+
+    def test_export_requires_permission(self):
+        """Пользователь без права просмотра попыток рассылок не выгружает попытки"""
+        self.client.force_login(self.other_owner)
+        response = self.client.get(reverse('mailing:attempts_export'))
+        self.assertNotEqual(response.status_code, 200)
+
+    def test_export_command(self):
+        """Команда exportattempts выгружает попытки владельца за период в файл"""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'attempts.jsonl')
+            call_command('exportattempts', '--format', 'jsonl', '--owner', str(self.owner.pk),
+                         '--date-to', self.old_try.date().isoformat(), '--output', output)
+            with open(output, encoding='utf-8') as file:
+                attempts = [json.loads(line) for line in file]
+
+        self.assertEqual([attempt['id'] for attempt in attempts],
+                         self.get_attempt_ids(self.mailing, datetime_last_try=self.old_try))
+
+
+
+class ClientSearchTest(TestCase):
+    """Тесты триграммного поиска клиентов"""
+
+    def setUp(self):
+        with connections['default'].cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                self.skipTest("Postgres extension pg_trgm is not installed")
+        self.owner = User.objects.create(email='owner@example.com')
+        self.owner.user_permissions.add(Permission.objects.get(codename='view_client'))
+        self.other_owner = User.objects.create(email='other@example.com')
+
+    def search(self, user: User, **params):
+        self.client.force_login(user)
+        response = self.client.get(reverse('mailing:clients'), params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_search_ranks_by_similarity(self):
+        """Клиенты находятся по части email или Ф.И.О. и упорядочены по похожести на запрос"""
+        exact = Client.objects.create(email='petrov@example.com', name='Петров Петр', owner=self.owner)
+        partial = Client.objects.create(email='a.petrova.long@example.com', name='Анна', owner=self.owner)
+        by_name = Client.objects.create(email='anna@example.com', name='Иван Петров', owner=self.owner)
+        Client.objects.create(email='sidorov@example.com', name='Сидоров', owner=self.owner)
+
+        self.assertEqual(list(search_clients(Client.objects.all(), 'petrov')), [exact, partial])
+        self.assertEqual(set(search_clients(Client.objects.all(), 'петров')), {exact, by_name})
+
+    def test_search_scoped_to_owner(self):
+        """Пользователь находит только своих клиентов, суперпользователь - всех клиентов"""
+        own = Client.objects.create(email='ivanov@example.com', name='Иванов', owner=self.owner)
+        other = Client.objects.create(email='ivanova@example.com', name='Иванова', owner=self.other_owner)
+
+        response = self.search(self.owner, q='ivanov')
+        self.assertEqual(list(response.context['object_list']), [own])
+
+        response = self.search(User.objects.create(email='admin@example.com', is_superuser=True), q='ivanov')
+        self.assertEqual(list(response.context['object_list']), [own, other])
+
+    def test_search_pages_keep_query(self):
+        """Результаты поиска делятся на страницы, ссылки на страницы сохраняют запрос"""
+        Client.objects.bulk_create([
+            Client(email=f"client{i}@example.com", name=f"Клиент {i}", owner=self.owner) for i in range(55)
+        ])
+        Client.objects.create(email='other@example.com', name='Другой', owner=self.owner)
+
+        response = self.search(self.owner, q='client', page=2)
+        self.assertEqual(len(response.context['object_list']), 5)
+        self.assertEqual(response.context['paginator'].count, 55)
+        self.assertEqual(response.context['page_query'], 'q=client')
+
+
+class MailServerResponseTest(TestCase):
+    """Тесты справочника ответов почтового сервера"""
+
+    def test_refusals_of_different_recipients_share_response(self):
+        """Одинаковые отказы разным получателям хранятся одним ответом без адреса получателя"""
+        errors = [
+            smtplib.SMTPRecipientsRefused({
+                f"client{i}@example.com": (550, f"5.1.1 <client{i}@example.com>: User unknown".encode()),
+            })
+            for i in range(3)
+        ]
+        errors.append(smtplib.SMTPDataError(451, b'4.3.0 Try again later'))
+
+        response_ids = get_mail_server_response_ids(errors)
+
+        self.assertEqual(MailServerResponse.objects.count(), 2)
+        self.assertEqual(len({response_ids[get_mail_server_response_text(error)] for error in errors[:3]}), 1)
+        self.assertEqual(get_mail_server_response_text(errors[0]), '550 5.1.1 <recipient>: User unknown')
+        self.assertEqual(get_mail_server_response_text(errors[3]), '451 4.3.0 Try again later')
+
+
+class TwoTierCacheTest(SimpleTestCase):
+    """Тесты двухуровневого кэша"""
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(CACHE_ENABLED=True, CACHE_STATS_LOG_SECONDS=0)
+    def test_stats_from_several_threads(self):
+        """Попадания и промахи из нескольких потоков считаются без потерь"""
+        two_tier_cache = TwoTierCache('test_stats', timeout=60, local_timeout=60)
+
+        def read():
+            for i in range(200):
+                two_tier_cache.get_or_set(f"key{i % 10}", lambda: 'value')
+
+        threads = [threading.Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = two_tier_cache.get_stats()
+        self.assertEqual(stats['local_hits'] + stats['shared_hits'] + stats['misses'], 800)
+        self.assertEqual(stats['local_size'], 10)
+
+    @override_settings(CACHE_ENABLED=False, CACHE_STATS_LOG_SECONDS=60)
+    def test_stats_logged_periodically(self):
+        """Счетчики пишутся в лог не чаще раза в CACHE_STATS_LOG_SECONDS секунд"""
+        two_tier_cache = TwoTierCache('test_log', timeout=60, local_timeout=120)
+        with self.assertNoLogs('mailing.cache'):
+            two_tier_cache.get_or_set('key', lambda: 'value')
+
+        with mock.patch('mailing.cache.time.monotonic', return_value=time.monotonic() + 60), \
+                self.assertLogs('mailing.cache') as logs:
+            two_tier_cache.get_or_set('key', lambda: 'value')
+            two_tier_cache.get_or_set('key', lambda: 'value')
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('Cache test_log: local hits 1, shared hits 0, misses 1', logs.output[0])
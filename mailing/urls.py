@@ -4,7 +4,7 @@ from mailing.apps import MailingConfig
 from mailing.views import ClientListView, ClientDetailView, ClientCreateView, ClientUpdateView, ClientDeleteView, \
     MessageListView, MessageDetailView, MessageCreateView, MessageUpdateView, MessageDeleteView, \
     MailingSettingsListView, MailingSettingsDetailView, MailingSettingsCreateView, MailingSettingsUpdateView, \
-    MailingSettingsDeleteView, MailingAttemptListView, disable_mailing_settings, IndexView
+    MailingSettingsDeleteView, MailingAttemptListView, disable_mailing_settings, export_mailing_attempts, IndexView
 
 app_name = MailingConfig.name
 
@@ -27,4 +27,5 @@ urlpatterns = [
     path('setting/<int:pk>/delete/', MailingSettingsDeleteView.as_view(), name='delete_setting'),
     path('block/<int:pk>/', disable_mailing_settings, name='disable_mailing'),
     path('attempts/', MailingAttemptListView.as_view(), name='attempts'),
+    path('attempts/export/', export_mailing_attempts, name='attempts_export'),
 ]
@@ -0,0 +1,85 @@
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytz
+from django.conf import settings
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from mailing.models import ContentVersion
+
+BLOG_VERSION = 'blog'
+MAILING_ATTEMPTS_VERSION = 'mailing_attempts'
+MAILING_SCHEDULE_VERSION = 'mailing_schedule'
+
+_deferred = threading.local()
+
+
+def touch_content_version(name: str) -> None:
+    """Функция увеличивает версию данных страниц, внутри defer_content_versions - один раз в конце блока"""
+    deferred_versions = getattr(_deferred, 'versions', None)
+    if deferred_versions is not None:
+        deferred_versions.add(name)
+        return
+    increment_content_version(name)
+
+
+@contextmanager
+def defer_content_versions():
+    """Контекстный менеджер и декоратор порции работы задач рассылок (изменение статусов, планирование,
+    отправка одной порции писем): версии данных страниц, измененные в потоке во время порции записями попыток
+    и сохранениями рассылок, увеличиваются один раз в конце порции, а не на каждое изменение.
+    Откладываются только изменения текущего потока, вложенная порция увеличивает версии в конце внешней"""
+    if getattr(_deferred, 'versions', None) is not None:
+        yield
+        return
+    _deferred.versions = set()
+    try:
+        yield
+    finally:
+        names, _deferred.versions = _deferred.versions, None
+        for name in sorted(names):
+            increment_content_version(name)
+
+
+def increment_content_version(name: str) -> None:
+    """Функция увеличивает версию данных страниц в БД, время изменения версии не уменьшается,
+    даже если часы процессов расходятся"""
+    current_datetime = datetime.now(pytz.timezone(settings.TIME_ZONE))
+    updated_count = ContentVersion.objects.filter(name=name).update(
+        version=F('version') + 1,
+        updated_at=Greatest('updated_at', Value(current_datetime)),
+    )
+    if not updated_count:
+        ContentVersion.objects.get_or_create(name=name, defaults={'version': 1, 'updated_at': current_datetime})
+
+
+def get_content_version(request, name: str):
+    """Функция возвращает версию данных страниц (None - данные еще не менялись),
+    версия выбирается из БД один раз за запрос"""
+    request_versions = request.__dict__.setdefault('_content_versions', {})
+    if name not in request_versions:
+        request_versions[name] = ContentVersion.objects.filter(name=name).first()
+    return request_versions[name]
+
+
+def get_content_last_modified(request, name: str):
+    """Функция возвращает время последнего изменения данных страниц для заголовка Last-Modified"""
+    content_version = get_content_version(request, name)
+    return None if content_version is None else content_version.updated_at
+
+
+def make_etag(request, name: str, *parts) -> str:
+    """Функция возвращает ETag страницы: версия данных, пользователь (страницы зависят от его прав),
+    параметры запроса и дополнительные части"""
+    content_version = get_content_version(request, name)
+    etag_parts = [
+        name,
+        0 if content_version is None else content_version.version,
+        request.user.pk,
+        request.GET.urlencode(),
+        *parts,
+    ]
+    return hashlib.sha1('|'.join(map(str, etag_parts)).encode()).hexdigest()
@@ -1,32 +1,55 @@
+from datetime import datetime
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.core.exceptions import PermissionDenied
+from django.http import HttpResponseBadRequest, HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.db.models import Q
 from django.urls import reverse_lazy, reverse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, TemplateView
 
 from blog.models import BlogPost
-from blog.services import get_blogpost_for_cache
-from mailing.forms import ClientForm, MessageForm, MailingSettingsForm
+from blog.services import get_random_blogposts
+from mailing.forms import (ClientForm, MessageForm, MailingSettingsForm, MailingAttemptFilterForm,
+                           MailingAttemptExportForm, SearchForm)
 from mailing.models import Client, Message, MailingSettings, MailingAttempt
-from mailing.services import get_statistic_mailing_for_cache
+from mailing.services import (filter_attempts, get_attempts_etag, get_attempts_last_modified, get_daily_attempt_report,
+                              get_statistic_mailing_for_cache, iter_attempts_export, refresh_next_send_datetime,
+                              search_clients)
 
 
 class ClientListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
     """Контроллер для вывода списка клиентов"""
     model = Client
     permission_required = 'mailing.view_client'
+    paginate_by = 50
 
     def get_queryset(self, *args, **kwargs):
-        """Метод выбирает клиентов, созданных авторизованным пользователем"""
-        queryset = super().get_queryset(*args, **kwargs)
+        """Метод выбирает клиентов, созданных авторизованным пользователем, и ищет клиентов по запросу"""
+        queryset = super().get_queryset(*args, **kwargs).order_by('pk')
         user = self.request.user
         if user.is_authenticated:
             if not user.is_superuser or not user.has_perm('mailing.view_client'):
                 queryset = queryset.filter(owner=self.request.user)
+            self.search_form = SearchForm(self.request.GET)
+            if self.search_form.is_valid() and self.search_form.cleaned_data['q']:
+                queryset = search_clients(queryset, self.search_form.cleaned_data['q'])
             return queryset
         raise PermissionDenied
 
+    def get_context_data(self, *args, **kwargs):
+        """Метод передает форму поиска и параметры запроса для ссылок на страницы"""
+        context_data = super().get_context_data(*args, **kwargs)
+        context_data['search_form'] = self.search_form
+        query = self.request.GET.copy()
+        query.pop('page', None)
+        context_data['page_query'] = query.urlencode()
+        return context_data
+
 
 class ClientDetailView(LoginRequiredMixin, PermissionRequiredMixin, DetailView):
     """Контроллер для вывода детальной информации о клиенте"""
@@ -143,13 +166,14 @@ class MailingSettingsDetailView(LoginRequiredMixin, PermissionRequiredMixin, Det
     permission_required = 'mailing.view_mailingsettings'
 
     def get_context_data(self, **kwargs):
-        """Метод выбирает попытки рассылок для данной рассылки"""
+        """Метод выбирает статистику попыток рассылки по дням и последние попытки рассылки для данной рассылки"""
         context_data = super().get_context_data(**kwargs)
         user = self.request.user
         if user.is_authenticated:
             if user.is_superuser or user.has_perm('mailing.view_mailingsettings') or user.id == self.object.owner_id:
-                context_data['attempts'] = MailingAttempt.objects.filter(mailing=self.object).order_by(
-                    '-datetime_last_try')
+                context_data['attempt_days'] = get_daily_attempt_report(self.object)
+                context_data['attempts'] = MailingAttempt.objects.filter(mailing=self.object).select_related(
+                    'client').order_by('-datetime_last_try')[:settings.MAILING_DETAIL_ATTEMPTS_COUNT]
                 return context_data
         raise PermissionDenied
 
@@ -164,7 +188,8 @@ def disable_mailing_settings(request, pk):
     else:
         mailing_settings_item.is_disabled = True
 
-    mailing_settings_item.save()
+    # сохраняется только признак отключения, чтобы не перезаписать счетчики попыток рассылки
+    mailing_settings_item.save(update_fields=['is_disabled'])
 
     return redirect(reverse('mailing:settings'))
 
@@ -185,10 +210,8 @@ class MailingSettingsCreateView(LoginRequiredMixin, PermissionRequiredMixin, Cre
         return form
 
     def form_valid(self, form, **kwargs):
-        """Метод для автоматической привязки владельца рассылки - пользователя"""
-        mailing = form.save()
-        mailing.owner = self.request.user
-        mailing.save()
+        """Метод для автоматической привязки владельца рассылки - пользователя, рассылка сохраняется один раз"""
+        form.instance.owner = self.request.user
         return super().form_valid(form)
 
 
@@ -208,6 +231,16 @@ class MailingSettingsUpdateView(LoginRequiredMixin, PermissionRequiredMixin, Upd
         form.fields['clients'].queryset = Client.objects.filter(owner=self.request.user)
         return form
 
+    def form_valid(self, form):
+        """Метод сохраняет только поля формы, чтобы не перезаписать счетчики попыток рассылки,
+        и пересчитывает дату и время следующей отправки, только если изменилось начало или периодичность рассылки"""
+        self.object = form.save(commit=False)
+        self.object.save(update_fields=[name for name in form.fields if name != 'clients'])
+        form.save_m2m()
+        if {'start_datetime', 'periodicity'} & set(form.changed_data):
+            refresh_next_send_datetime(self.object)
+        return HttpResponseRedirect(self.get_success_url())
+
 
 class MailingSettingsDeleteView(LoginRequiredMixin, DeleteView):
     """Контроллер для удаления рассылки"""
@@ -216,26 +249,95 @@ class MailingSettingsDeleteView(LoginRequiredMixin, DeleteView):
     success_url = reverse_lazy('mailing:settings')
 
 
+@method_decorator(condition(etag_func=get_attempts_etag, last_modified_func=get_attempts_last_modified), name='get')
 class MailingAttemptListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
-    """Контроллер для вывода списка попыток рассылок"""
+    """Контроллер для вывода списка попыток рассылок постранично: страница выбирается одним запросом
+    по курсору - дате и времени и id последней попытки предыдущей страницы.
+    Если попытки, рассылки и клиенты не менялись, отвечает 304 Not Modified"""
     model = MailingAttempt
     permission_required = 'mailing.view_mailingattempt'
+    page_size = 50
 
-    def get_context_data(self, *args, **kwargs):
-        """Метод выбирает все попытки рассылок для суперпользователя
-        или попытки рассылок, созданные авторизованным пользователем"""
-        context_data = super().get_context_data(*args, **kwargs)
+    def get_queryset(self, *args, **kwargs):
+        """Метод выбирает все попытки рассылок для суперпользователя или попытки рассылок,
+        созданные авторизованным пользователем, с учетом фильтров и курсора страницы"""
+        queryset = super().get_queryset(*args, **kwargs).select_related(
+            'mailing', 'client', 'mail_server_response').order_by('-datetime_last_try', '-id')
         user = self.request.user
-        if user.is_authenticated:
-            if not user.is_superuser and user.has_perm('mailing.view_mailingattempt'):
-                mailings = MailingSettings.objects.filter(owner_id=user.id)
-                attempts = []
-                for mailing in mailings:
-                    attemps_mailing = self.object_list.filter(mailing_id=mailing.id)
-                    attempts.extend(attemps_mailing)
-                context_data['object_list'] = attempts
-            return context_data
-        raise PermissionDenied
+        if not user.is_superuser:
+            queryset = queryset.filter(mailing__owner=user)
+
+        self.filter_form = MailingAttemptFilterForm(self.request.GET)
+        if self.filter_form.is_valid():
+            queryset = filter_attempts(queryset, **self.filter_form.cleaned_data)
+
+        cursor = self.parse_cursor(self.request.GET.get('after'))
+        if cursor is not None:
+            datetime_last_try, pk = cursor
+            queryset = queryset.filter(
+                Q(datetime_last_try__lt=datetime_last_try) | Q(datetime_last_try=datetime_last_try, pk__lt=pk))
+        return queryset
+
+    def get_context_data(self, *args, **kwargs):
+        """Метод передает страницу попыток рассылок, форму фильтров и ссылки на первую и следующую страницы"""
+        attempts = list(self.object_list[:self.page_size + 1])
+        context_data = super().get_context_data(*args, object_list=attempts[:self.page_size], **kwargs)
+        context_data['filter_form'] = self.filter_form
+
+        query = self.request.GET.copy()
+        query.pop('after', None)
+        context_data['first_page_query'] = query.urlencode()
+        if len(attempts) > self.page_size:
+            last_attempt = attempts[self.page_size - 1]
+            query['after'] = f"{last_attempt.datetime_last_try.isoformat()}_{last_attempt.pk}"
+            context_data['next_page_query'] = query.urlencode()
+        context_data['is_first_page'] = 'after' not in self.request.GET
+        return context_data
+
+    @staticmethod
+    def parse_cursor(cursor: str):
+        """Метод разбирает курсор страницы, None - первая страница или неверный курсор"""
+        if not cursor:
+            return None
+        try:
+            datetime_last_try, pk = cursor.rsplit('_', 1)
+            return datetime.fromisoformat(datetime_last_try), int(pk)
+        except ValueError:
+            return None
+
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+@login_required
+@permission_required('mailing.view_mailingattempt')
+def export_mailing_attempts(request):
+    """Контроллер для потоковой выгрузки попыток рассылок в CSV или JSONL: все попытки рассылок
+    или попытки рассылок владельца для суперпользователя, попытки рассылок авторизованного пользователя
+    для остальных пользователей"""
+    form = MailingAttemptExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+    filters = form.cleaned_data
+    export_format = filters.pop('export_format') or 'csv'
+    owner_id = filters.pop('owner_id')
+
+    attempts = MailingAttempt.objects.all()
+    if not request.user.is_superuser:
+        attempts = attempts.filter(mailing__owner=request.user)
+    elif owner_id is not None:
+        attempts = attempts.filter(mailing__owner_id=owner_id)
+    attempts = filter_attempts(attempts, **filters)
+
+    response = StreamingHttpResponse(
+        iter_attempts_export(attempts, export_format),
+        content_type=EXPORT_CONTENT_TYPES[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="attempts.{export_format}"'
+    return response
 
 
 class IndexView(TemplateView):
@@ -245,8 +347,9 @@ class IndexView(TemplateView):
     def get_context_data(self, **kwargs):
         """Метод передает кол-во всего рассылок, активных рассылок, уникальных клиентов и 3 случайных статьи из блога"""
         context = super().get_context_data(**kwargs)
-        context['mailing_count'] = get_statistic_mailing_for_cache()['mailing_count']
-        context['active_mailing_count'] = get_statistic_mailing_for_cache()['active_mailing_count']
-        context['unique_clients_count'] = get_statistic_mailing_for_cache()['unique_clients_count']
-        context["blog_list"] = get_blogpost_for_cache().order_by('?')[:3]
+        statistic_mailing = get_statistic_mailing_for_cache()
+        context['mailing_count'] = statistic_mailing['mailing_count']
+        context['active_mailing_count'] = statistic_mailing['active_mailing_count']
+        context['unique_clients_count'] = statistic_mailing['unique_clients_count']
+        context["blog_list"] = get_random_blogposts(3)
         return context